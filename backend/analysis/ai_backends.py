@@ -0,0 +1,83 @@
+import importlib
+import os
+from typing import Optional
+
+import openai
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_AI_MODEL = "gpt-4o-mini"
+
+
+class ModelBackend:
+    """Interface of the language models that review packed code chunks.
+    
+    Other models (a self-hosted one, or a local fake serving fixed replies
+    in tests) are plugged in by subclassing and pointing AI_BACKEND at the
+    class ('package.module:ClassName').
+    """
+    
+    def complete(self, system: str, prompt: str, max_tokens: int, timeout: float) -> str:
+        """Get the model's reply to a prompt.
+        
+        Args:
+            system: Instructions describing the expected JSON reply
+            prompt: Code chunks to review
+            max_tokens: Maximum length of the reply
+            timeout: Seconds the request may take
+        
+        Returns:
+            Reply text, expected to be a JSON object
+        """
+        raise NotImplementedError
+
+
+class OpenAIBackend(ModelBackend):
+    """OpenAI chat model asked for a JSON object reply."""
+    
+    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None, api_base: Optional[str] = None):
+        """Initialize the backend from arguments or environment variables.
+        
+        Args:
+            api_key: OpenAI API key (OPENAI_API_KEY)
+            model: Chat model name (AI_MODEL)
+            api_base: API root URL, e.g. of a compatible local server (OPENAI_API_BASE)
+        """
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.model = model or os.getenv("AI_MODEL", DEFAULT_AI_MODEL)
+        self.api_base = api_base or os.getenv("OPENAI_API_BASE")
+    
+    def complete(self, system: str, prompt: str, max_tokens: int, timeout: float) -> str:
+        """Get the model's reply to a prompt."""
+        response = openai.ChatCompletion.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=max_tokens,
+            temperature=0.2,
+            response_format={"type": "json_object"},
+            api_key=self.api_key,
+            api_base=self.api_base,
+            request_timeout=timeout
+        )
+        return response["choices"][0]["message"]["content"]
+
+
+def get_model_backend() -> Optional[ModelBackend]:
+    """Create the model backend configured by AI_BACKEND.
+    
+    Returns:
+        The configured backend, the OpenAI backend if OPENAI_API_KEY is set,
+        or None when AI feedback is disabled
+    """
+    backend = os.getenv("AI_BACKEND", "")
+    if not backend or backend == "openai":
+        return OpenAIBackend() if os.getenv("OPENAI_API_KEY") is not None else None
+    
+    module_name, _, class_name = backend.partition(":")
+    backend_class = getattr(importlib.import_module(module_name), class_name)
+    return backend_class()
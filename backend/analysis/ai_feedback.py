@@ -1,174 +1,501 @@
+import ast
+import heapq
+import json
 import os
-from typing import List, Dict, Any, Optional
-import openai
+import time
+from typing import Any, List, Dict, Optional, Set, Tuple
+
 from dotenv import load_dotenv
 
+from analysis.ai_backends import ModelBackend, get_model_backend
+from analysis.node_cache import NodeCache, source_digest, split_top_level
 from models.feedback_model import Issue
+from utils.diff_positions import diff_line_map
+from utils.time_budget import BudgetExceeded, TimeBudget
 
 # Load environment variables
 load_dotenv()
 
+# Seconds a model request may take when the caller has no time budget
+DEFAULT_AI_REQUEST_TIMEOUT = 60
+
+# Prompt tokens packed into one model request
+DEFAULT_AI_BATCH_TOKENS = 3000
+
+# Maximum tokens of one model reply
+DEFAULT_AI_MAX_OUTPUT_TOKENS = 1500
+
+# Characters per chunk a file is split into
+DEFAULT_CHUNK_SIZE = 1000
+
+# Prompt tokens of code sent to the model per job (0 for no limit)
+DEFAULT_AI_JOB_TOKENS = 24000
+
+# tiktoken encoding used to count prompt tokens locally (that of gpt-4o models)
+DEFAULT_AI_TOKENIZER = "o200k_base"
+
+# Rough characters per token of source code, used when tiktoken is not available
+CHARS_PER_TOKEN = 4
+
+# Value of an issue the other checkers found inside a chunk, in changed lines
+RISK_WEIGHTS = {'bug': 8.0, 'complexity': 4.0, 'style': 0.5}
+
+SYSTEM_PROMPT = """You review Python code for readability, performance and best practices.
+The user sends numbered code chunks; every line is prefixed with its line number in the file.
+Reply with a JSON object {"suggestions": [{"chunk": <chunk id>, "line": <line number>, "message": "<suggestion>"}]}
+with one entry per concrete, actionable suggestion, using the line number printed before the line
+it is about. Reply {"suggestions": []} when there is nothing to improve."""
+
+# Tokenizer loaded on first use; False when token counts are estimated
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Count the prompt tokens of a text locally, without calling the model.
+    
+    Uses tiktoken with the AI_TOKENIZER encoding when it is installed, and
+    an estimate from the text's length otherwise.
+    
+    Args:
+        text: Text to count
+    
+    Returns:
+        Number of tokens
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(os.getenv("AI_TOKENIZER", DEFAULT_AI_TOKENIZER))
+        except Exception as e:
+            # Not installed, or the encoding could not be downloaded
+            print(f"Estimating prompt tokens, tokenizer not available: {e}")
+            _encoding = False
+    if _encoding is False:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+class FileChange:
+    """How much of one file a pull request changed, from the PR's file list."""
+    
+    def __init__(self, additions: int, deletions: int, added_lines: Optional[Set[int]] = None):
+        """Initialize the change.
+        
+        Args:
+            additions: Lines added to the file
+            deletions: Lines deleted from the file
+            added_lines: New-file line numbers of the added lines, when the
+                provider returned the file's patch
+        """
+        self.additions = additions
+        self.deletions = deletions
+        self.added_lines = added_lines
+    
+    @classmethod
+    def from_pr_file(cls, file: Dict[str, Any]) -> "FileChange":
+        """Create the change from an entry of a provider's ``get_pr_files`` list."""
+        patch = file.get("patch")
+        added_lines = None
+        if patch:
+            added_lines = {line for line, old_line in diff_line_map(patch).items() if old_line is None}
+        return cls(file.get("additions") or 0, file.get("deletions") or 0, added_lines)
+
+
+def chunk_values(chunks: List["CodeChunk"], change: Optional[FileChange] = None,
+                 risk_issues: Optional[Dict[str, List[Issue]]] = None) -> List[float]:
+    """Rate how much reviewing each chunk of one file is worth.
+    
+    The file's churn (additions plus deletions) is spread over its chunks
+    by where the added lines are, or by chunk length when the patch is not
+    known; every issue the other checkers found inside a chunk adds its
+    checker's ``RISK_WEIGHTS``.
+    
+    Args:
+        chunks: Chunks of the file, in order
+        change: Change of the file in the PR (None counts the whole file as new)
+        risk_issues: Issues of the file per checker name
+    
+    Returns:
+        Value of each chunk
+    """
+    total_lines = sum(chunk.end_line - chunk.start_line + 1 for chunk in chunks) or 1
+    churn = total_lines if change is None else change.additions + change.deletions
+    added_lines = change.added_lines if change is not None else None
+    risk_lines: Dict[int, float] = {}
+    for name, issues in (risk_issues or {}).items():
+        for issue in issues:
+            risk_lines[issue.line] = risk_lines.get(issue.line, 0.0) + RISK_WEIGHTS.get(name, 1.0)
+    
+    values = []
+    for chunk in chunks:
+        lines = range(chunk.start_line, chunk.end_line + 1)
+        if added_lines:
+            share = sum(1 for line in lines if line in added_lines) / len(added_lines)
+        else:
+            share = len(lines) / total_lines
+        values.append(churn * share + sum(risk_lines.get(line, 0.0) for line in lines))
+    return values
+
+
+class CodeChunk:
+    """A run of consecutive lines of one file, reviewed as part of a packed request."""
+    
+    def __init__(self, file_path: str, start_line: int, text: str):
+        """Initialize the chunk.
+        
+        Args:
+            file_path: Path to the file the chunk comes from
+            start_line: Line number of the chunk's first line in the file
+            text: Lines of the chunk
+        """
+        self.file_path = file_path
+        self.start_line = start_line
+        self.text = text
+        self.end_line = start_line + text.count('\n')
+        # Key of the chunk's suggestions in the node cache
+        self.digest = source_digest(text.split('\n'))
+        # Prompt tokens of the rendered chunk
+        self.tokens = count_tokens(self.render(0))
+    
+    def render(self, chunk_id: int) -> str:
+        """Format the chunk for the prompt, with a line number before every line."""
+        numbered = '\n'.join(
+            f"{self.start_line + offset}: {line}" for offset, line in enumerate(self.text.split('\n'))
+        )
+        return f"### chunk {chunk_id} ({self.file_path})\n{numbered}"
+
+
+class ChunkPacker:
+    """Packs the code chunks of one job's files into as few model requests as fit a token budget.
+    
+    Without a job token budget, chunks are queued as files arrive and a
+    request is sent whenever the next chunk would not fit, so chunks of
+    several small files share one request. With one (AI_JOB_TOKENS), every
+    chunk is rated by ``chunk_values`` as its file arrives and only the
+    most valuable chunks per token that fit the budget are held; the rest
+    are dropped and listed in ``skipped``. The held chunks are sent by
+    ``flush`` once the job's files are all in, most valuable first, so
+    memory stays bounded by the budget however large the PR is.
+    
+    Suggestions come back as JSON naming the chunk and the exact line, and
+    are collected per file in ``results``. Files whose chunks could not be
+    reviewed, for lack of time or because the request failed, are listed
+    in ``unreviewed``. With a node cache,
+    chunks reviewed before (whole top-level functions and classes, see
+    ``_split_into_chunks``) reuse their suggestions instead of being sent.
+    """
+    
+    def __init__(self, generator: "AIFeedbackGenerator", budget: Optional[TimeBudget] = None):
+        """Initialize the packer.
+        
+        Args:
+            generator: Generator providing the model backend and limits
+            budget: Time budget of the job; requests share the 'ai' stage's time
+        """
+        self.generator = generator
+        self.backend = generator.backend
+        self.cache = generator.cache
+        self.budget = budget
+        self.token_budget = generator.job_tokens
+        self.results: Dict[str, List[Issue]] = {}
+        self.unreviewed: List[str] = []
+        self.skipped: Dict[str, List[Tuple[int, int]]] = {}
+        self.requests = 0
+        self.tokens_sent = 0
+        self.chunks_sent = 0
+        self.chunks_cached = 0
+        self._pending: List[CodeChunk] = []
+        self._pending_tokens = 0
+        # Min-heap of (value per token, -arrival, chunk) held for the budget
+        self._candidates: List[Tuple[float, int, CodeChunk]] = []
+        self._candidate_tokens = 0
+        self._arrivals = 0
+    
+    def add_file(self, file_content: str, file_path: str, change: Optional[FileChange] = None,
+                 risk_issues: Optional[Dict[str, List[Issue]]] = None) -> None:
+        """Queue a file's chunks, sending every request that fills up.
+        
+        Args:
+            file_content: Content of the file
+            file_path: Path to the file
+            change: Change of the file in the PR, used to rank its chunks
+            risk_issues: Issues the other checkers found in the file, per checker name
+        """
+        self.results.setdefault(file_path, [])
+        chunks = [
+            CodeChunk(file_path, start_line, text)
+            for start_line, text in self.generator._split_into_chunks(file_content)
+        ]
+        if not self.token_budget:
+            for chunk in chunks:
+                if not self._reuse(chunk):
+                    self._queue(chunk)
+            return
+        
+        for chunk, value in zip(chunks, chunk_values(chunks, change, risk_issues)):
+            if self._reuse(chunk):
+                continue
+            # On equal value, chunks of files that arrived first are kept
+            self._arrivals += 1
+            heapq.heappush(self._candidates, (value / chunk.tokens, -self._arrivals, chunk))
+            self._candidate_tokens += chunk.tokens
+        while self._candidate_tokens > self.token_budget:
+            _, _, chunk = heapq.heappop(self._candidates)
+            self._candidate_tokens -= chunk.tokens
+            self.skipped.setdefault(chunk.file_path, []).append((chunk.start_line, chunk.end_line))
+    
+    def flush(self) -> None:
+        """Send the held chunks, most valuable first, and then the queued ones."""
+        candidates, self._candidates, self._candidate_tokens = self._candidates, [], 0
+        for _, _, chunk in sorted(candidates, reverse=True):
+            self._queue(chunk)
+        self._send()
+    
+    def usage(self) -> Dict[str, Any]:
+        """Report the tokens spent and the chunks left out by the job token budget."""
+        return {
+            "token_budget": self.token_budget,
+            "tokens_sent": self.tokens_sent,
+            "requests": self.requests,
+            "chunks_sent": self.chunks_sent,
+            "chunks_cached": self.chunks_cached,
+            "chunks_skipped": sum(len(ranges) for ranges in self.skipped.values()),
+            "skipped": {
+                file_path: sorted(ranges) for file_path, ranges in self.skipped.items()
+            }
+        }
+    
+    def _reuse(self, chunk: CodeChunk) -> bool:
+        """Add the cached suggestions of a chunk reviewed before, moved to the chunk's lines.
+        
+        Returns:
+            True if the chunk was reviewed before and need not be sent
+        """
+        cached = self.cache.get('ai', chunk.digest) if self.cache is not None else None
+        if cached is None:
+            return False
+        self.results[chunk.file_path].extend(
+            Issue(type="ai-suggestion", msg=message, line=chunk.start_line + offset) for message, offset in cached
+        )
+        self.chunks_cached += 1
+        return True
+    
+    def _queue(self, chunk: CodeChunk) -> None:
+        """Add a chunk to the next request, sending the request first if it is full."""
+        if self._pending and self._pending_tokens + chunk.tokens > self.generator.batch_tokens:
+            self._send()
+        self._pending.append(chunk)
+        self._pending_tokens += chunk.tokens
+    
+    def _send(self) -> None:
+        """Send the queued chunks as one request."""
+        chunks, self._pending, self._pending_tokens = self._pending, [], 0
+        if not chunks:
+            return
+        
+        timeout = self.generator.request_timeout
+        if self.budget is not None:
+            timeout = min(timeout, self.budget.stage_time_left('ai'))
+        if timeout <= 0:
+            self._skip(chunks)
+            return
+        
+        prompt = '\n\n'.join(chunk.render(chunk_id) for chunk_id, chunk in enumerate(chunks))
+        self.requests += 1
+        self.chunks_sent += len(chunks)
+        self.tokens_sent += sum(chunk.tokens for chunk in chunks)
+        try:
+            reply = self.backend.complete(
+                SYSTEM_PROMPT, prompt, self.generator.max_output_tokens, timeout
+            )
+        except Exception as e:
+            print(f"Error calling model for {len(chunks)} chunks: {e}")
+            self._skip(chunks)
+            return
+        
+        try:
+            suggestions = parse_suggestions(reply, chunks)
+        except ValueError as e:
+            print(f"Model reply is not a JSON object: {e}")
+            self._skip(chunks)
+            return
+        
+        found: List[List[Tuple[str, int]]] = [[] for _ in chunks]
+        for chunk_index, issue in suggestions:
+            self.results[chunks[chunk_index].file_path].append(issue)
+            found[chunk_index].append((issue.msg, issue.line - chunks[chunk_index].start_line))
+        if self.cache is not None:
+            # Chunks without suggestions are cached too, so they are not sent again either
+            for chunk, chunk_found in zip(chunks, found):
+                self.cache.put('ai', chunk.digest, tuple(chunk_found))
+    
+    def _skip(self, chunks: List[CodeChunk]) -> None:
+        """Record the files of chunks that ran out of time or got no usable reply."""
+        for chunk in chunks:
+            if chunk.file_path not in self.unreviewed:
+                self.unreviewed.append(chunk.file_path)
+
+
+def parse_suggestions(reply: str, chunks: List[CodeChunk]) -> List[Tuple[int, Issue]]:
+    """Turn a model's JSON reply into issues, dropping suggestions that do not point into a chunk.
+    
+    Args:
+        reply: Reply text of the model
+        chunks: Chunks of the request, indexed by their chunk id
+    
+    Returns:
+        (chunk index, issue) of every valid suggestion
+    
+    Raises:
+        ValueError: If the reply is not a JSON object
+    """
+    reply = json.loads(reply)
+    if not isinstance(reply, dict):
+        raise ValueError(f"expected an object, got {type(reply).__name__}")
+    suggestions = reply.get("suggestions", [])
+    
+    issues = []
+    for suggestion in suggestions:
+        try:
+            chunk_index = int(suggestion["chunk"])
+            line = int(suggestion["line"])
+            message = str(suggestion["message"]).strip()
+        except (KeyError, TypeError, ValueError):
+            continue
+        if not 0 <= chunk_index < len(chunks) or not message:
+            continue
+        chunk = chunks[chunk_index]
+        if not chunk.start_line <= line <= chunk.end_line:
+            continue
+        issues.append((chunk_index, Issue(type="ai-suggestion", msg=message, line=line)))
+    return issues
+
 
 class AIFeedbackGenerator:
-    """Generator for AI-powered code suggestions using OpenAI."""
+    """Generator for AI-powered code suggestions from a pluggable language model."""
     
-    def __init__(self):
-        """Initialize the AI feedback generator."""
-        self.api_key = os.getenv("OPENAI_API_KEY")
-        self.enabled = self.api_key is not None
+    def __init__(self, backend: Optional[ModelBackend] = None, cache: Optional[NodeCache] = None):
+        """Initialize the AI feedback generator.
+        
+        Args:
+            backend: Model backend (defaults to the one configured by AI_BACKEND)
+            cache: Optional cache of the suggestions per chunk, reused for unchanged code
+        """
+        self.backend = backend if backend is not None else get_model_backend()
+        self.cache = cache
+        self.enabled = self.backend is not None
         
-        if self.enabled:
-            openai.api_key = self.api_key
+        self.request_timeout = float(os.getenv("AI_REQUEST_TIMEOUT", DEFAULT_AI_REQUEST_TIMEOUT))
+        self.batch_tokens = int(os.getenv("AI_BATCH_TOKENS", DEFAULT_AI_BATCH_TOKENS))
+        self.max_output_tokens = int(os.getenv("AI_MAX_OUTPUT_TOKENS", DEFAULT_AI_MAX_OUTPUT_TOKENS))
+        self.job_tokens = int(os.getenv("AI_JOB_TOKENS", DEFAULT_AI_JOB_TOKENS))
+    
+    def packer(self, budget: Optional[TimeBudget] = None) -> ChunkPacker:
+        """Create a packer that reviews the files of one job in shared requests."""
+        return ChunkPacker(self, budget)
     
-    def generate_feedback(self, file_content: str, file_path: str) -> List[Issue]:
+    def generate_feedback(self, file_content: str, file_path: str, budget: Optional[TimeBudget] = None) -> List[Issue]:
         """Generate AI-powered suggestions for code improvements.
         
         Args:
             file_content: Content of the file to analyze
             file_path: Path to the file
-            
+            budget: Time budget of the job; requests share the 'ai' stage's time
+        
         Returns:
             List of AI suggestion issues
+        
+        Raises:
+            BudgetExceeded: If the file's time ran out before all chunks were reviewed
         """
         if not self.enabled:
             return []
         
-        issues = []
-        
         # Only process Python files
         if not file_path.endswith('.py'):
-            return issues
-        
-        try:
-            # Split the file into chunks if it's too large
-            chunks = self._split_into_chunks(file_content)
-            
-            for i, chunk in enumerate(chunks):
-                # Calculate the starting line number for this chunk
-                start_line = 1
-                if i > 0:
-                    start_line = file_content.count('\n', 0, file_content.find(chunk)) + 1
-                
-                # Generate suggestions for this chunk
-                chunk_issues = self._generate_chunk_feedback(chunk, start_line)
-                issues.extend(chunk_issues)
-        
-        except Exception as e:
-            print(f"Error generating AI feedback for {file_path}: {e}")
+            return []
         
-        return issues
+        packer = self.packer(budget)
+        started = time.monotonic()
+        packer.add_file(file_content, file_path)
+        packer.flush()
+        if packer.unreviewed:
+            raise BudgetExceeded(f"AI review did not finish after {time.monotonic() - started:.1f}s")
+        return packer.results[file_path]
     
-    def _split_into_chunks(self, content: str, max_chunk_size: int = 1000) -> List[str]:
-        """Split file content into chunks for processing.
+    def _split_into_chunks(self, content: str, max_chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[Tuple[int, str]]:
+        """Split file content into chunks of whole lines for processing.
+        
+        Top-level functions and classes of Python files start chunks of
+        their own, so an unchanged one is split the same way wherever it
+        moves and its suggestions can be reused; lines that are all blank
+        are not sent.
         
         Args:
             content: File content to split
             max_chunk_size: Maximum size of each chunk in characters
-            
+        
         Returns:
-            List of content chunks
+            List of (starting line number, chunk content) tuples
         """
-        if len(content) <= max_chunk_size:
-            return [content]
-        
         lines = content.split('\n')
         chunks = []
         current_chunk = []
         current_size = 0
+        start_line = 1
+        try:
+            definitions, _ = split_top_level(ast.parse(content), lines)
+        except (SyntaxError, ValueError):
+            definitions = []
+        boundaries = {definition.start_line for definition in definitions}
+        boundaries.update(definition.end_line + 1 for definition in definitions)
         
-        for line in lines:
+        for line_number, line in enumerate(lines, 1):
             line_size = len(line) + 1  # +1 for newline
-            if current_size + line_size > max_chunk_size and current_chunk:
-                chunks.append('\n'.join(current_chunk))
+            if current_chunk and (current_size + line_size > max_chunk_size or line_number in boundaries):
+                chunks.append((start_line, '\n'.join(current_chunk)))
                 current_chunk = [line]
                 current_size = line_size
+                start_line = line_number
             else:
                 current_chunk.append(line)
                 current_size += line_size
         
         if current_chunk:
-            chunks.append('\n'.join(current_chunk))
+            chunks.append((start_line, '\n'.join(current_chunk)))
         
-        return chunks
+        return [(start_line, text) for start_line, text in chunks if text.strip()]
     
-    def _generate_chunk_feedback(self, code_chunk: str, start_line: int) -> List[Issue]:
-        """Generate feedback for a chunk of code using OpenAI.
-        
-        Args:
-            code_chunk: Chunk of code to analyze
-            start_line: Starting line number of this chunk in the original file
-            
-        Returns:
-            List of AI suggestion issues
-        """
-        issues = []
+    def generate_feedback_for_files(self, files_content: Dict[str, str],
+                                    file_changes: Optional[Dict[str, FileChange]] = None,
+                                    risk_issues: Optional[Dict[str, Dict[str, List[Issue]]]] = None
+                                    ) -> Dict[str, List[Issue]]:
+        """Generate AI feedback for multiple files, packing their chunks into shared requests.
         
-        try:
-            # Prepare the prompt for OpenAI
-            prompt = f"""Analyze this Python code and suggest improvements for readability, 
-            performance, and best practices. Focus on concrete, actionable suggestions. 
-            Format each suggestion as a separate line starting with 'SUGGESTION: '.
-            
-            ```python
-            {code_chunk}
-            ```
-            """
-            
-            # Call OpenAI API
-            response = openai.Completion.create(
-                engine="text-davinci-003",  # or use a more recent model
-                prompt=prompt,
-                max_tokens=500,
-                temperature=0.3,
-                top_p=1.0,
-                frequency_penalty=0.0,
-                presence_penalty=0.0
-            )
-            
-            # Parse the suggestions
-            suggestions = []
-            for line in response.choices[0].text.strip().split('\n'):
-                if line.startswith('SUGGESTION:'):
-                    suggestions.append(line[11:].strip())  # Remove 'SUGGESTION: ' prefix
-            
-            # Map suggestions to line numbers (simplified approach)
-            lines = code_chunk.split('\n')
-            for i, suggestion in enumerate(suggestions):
-                # Distribute suggestions across the chunk
-                # This is a simplified approach; in a real implementation,
-                # you would want to map suggestions to the specific lines they refer to
-                line_number = start_line + min(i, len(lines) - 1)
-                
-                issues.append(Issue(
-                    type="ai-suggestion",
-                    msg=suggestion,
-                    line=line_number
-                ))
-        
-        except Exception as e:
-            print(f"Error calling OpenAI API: {e}")
-        
-        return issues
-    
-    def generate_feedback_for_files(self, files_content: Dict[str, str]) -> Dict[str, List[Issue]]:
-        """Generate AI feedback for multiple files.
+        Within the job token budget, the chunks that changed most and that
+        the other checkers found most issues in are reviewed first.
         
         Args:
             files_content: Dictionary mapping file paths to their content
-            
+            file_changes: Change of each file in the PR
+            risk_issues: Issues of each file per checker name
+        
         Returns:
             Dictionary mapping file paths to lists of AI suggestion issues
         """
+        results: Dict[str, List[Issue]] = {file_path: [] for file_path in files_content}
         if not self.enabled:
-            return {file_path: [] for file_path in files_content}
-        
-        results = {}
+            return results
         
+        file_changes = file_changes or {}
+        risk_issues = risk_issues or {}
+        packer = self.packer()
         for file_path, content in files_content.items():
             # Only process Python files
             if file_path.endswith('.py'):
-                results[file_path] = self.generate_feedback(content, file_path)
-            else:
-                results[file_path] = []
+                packer.add_file(content, file_path, file_changes.get(file_path), risk_issues.get(file_path))
+        packer.flush()
+        results.update(packer.results)
         
-        return results
\ No newline at end of file
+        return results
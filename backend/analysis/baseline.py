@@ -0,0 +1,486 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+from difflib import SequenceMatcher
+from typing import Callable, Dict, Iterator, List, Any, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from models.feedback_model import Issue
+from analysis.triage import classify_change, line_hashes, token_digest
+from utils.content_policy import ContentPolicy
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_BASELINE_PATH = "baseline_index.db"
+
+# Number of (repository, base SHA) pairs kept in the index
+DEFAULT_BASELINE_INDEX_SIZE = 64
+
+# Seconds other jobs wait for the one analyzing a base file before taking it over
+DEFAULT_BASELINE_CLAIM_SECONDS = 60
+
+# Interval at which jobs waiting for another job's base file look for its entry
+CLAIM_POLL_SECONDS = 0.2
+
+# Seconds between updates of a base commit's last use, which decides what is evicted
+TOUCH_INTERVAL = 60
+
+# Deterministic checkers whose base results are indexed; AI suggestions are
+# neither stable nor cheap enough to baseline
+BASELINE_CHECKERS = ('style', 'complexity', 'bug')
+
+
+class BaselineEntry:
+    """Indexed issues of one file on a base commit."""
+    
+    def __init__(self, line_hashes: List[int], issues: Dict[str, List[Issue]], digest: Optional[str] = None):
+        """Initialize the entry.
+        
+        Args:
+            line_hashes: Hash of every line of the base file, used to map lines to the head
+            issues: Base issues per checker name
+            digest: Normalized token digest of a base Python file, used to triage the head
+        """
+        self.line_hashes = line_hashes
+        self.issues = issues
+        self.digest = digest
+
+
+class BaselineIndex:
+    """Index of per-file issues on base commits, shared by every PR targeting the same base.
+    
+    Entries are stored in SQLite keyed by (repository, base SHA, path), so
+    API and worker processes share them and they survive restarts. Each
+    file is analyzed at most once per base: a job about to analyze a base
+    file claims it, and other jobs needing the same file wait for its entry
+    instead of fetching and analyzing it too. Entries are only stored for
+    base files that were read or are known not to exist; a failed fetch
+    raises and leaves nothing behind.
+    """
+    
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_bases: Optional[int] = None,
+        claim_seconds: Optional[float] = None
+    ):
+        """Initialize the index and create its tables.
+        
+        Args:
+            path: Database file (BASELINE_DB_PATH)
+            max_bases: Number of (repository, base SHA) pairs kept (BASELINE_INDEX_SIZE)
+            claim_seconds: Seconds a job may take to analyze a base file before
+                waiting jobs take it over (BASELINE_CLAIM_SECONDS)
+        """
+        self.path = path or os.getenv("BASELINE_DB_PATH", DEFAULT_BASELINE_PATH)
+        if max_bases is None:
+            max_bases = int(os.getenv("BASELINE_INDEX_SIZE", DEFAULT_BASELINE_INDEX_SIZE))
+        if claim_seconds is None:
+            claim_seconds = float(os.getenv("BASELINE_CLAIM_SECONDS", DEFAULT_BASELINE_CLAIM_SECONDS))
+        self.max_bases = max_bases
+        self.claim_seconds = claim_seconds
+        self._touched: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+        
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS baseline_bases (
+                    repo TEXT NOT NULL,
+                    base_sha TEXT NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (repo, base_sha)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_baseline_bases_used ON baseline_bases (last_used)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS baseline_files (
+                    repo TEXT NOT NULL,
+                    base_sha TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    line_hashes BLOB NOT NULL,
+                    digest TEXT,
+                    issues TEXT NOT NULL,
+                    PRIMARY KEY (repo, base_sha, path)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS baseline_claims (
+                    repo TEXT NOT NULL,
+                    base_sha TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    owner TEXT NOT NULL,
+                    expires REAL NOT NULL,
+                    PRIMARY KEY (repo, base_sha, path)
+                )
+            """)
+    
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection; one per call keeps the index safe across threads and processes."""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+    
+    def get_entries(
+        self,
+        repo: str,
+        base_sha: str,
+        file_paths: List[str],
+        load_contents: Callable[[List[str]], Dict[str, str]],
+        checkers: Dict[str, Any],
+        checker_names: Tuple[str, ...] = BASELINE_CHECKERS
+    ) -> Dict[str, BaselineEntry]:
+        """Get base entries for files, analyzing the ones not indexed yet.
+        
+        Args:
+            repo: Repository name
+            base_sha: Base commit SHA
+            file_paths: Paths of the files changed by the PR
+            load_contents: Fetches base contents for a list of paths; files
+                missing from the result do not exist at the base, and any
+                other failure must raise
+            checkers: Checker instances keyed like ``create_checkers`` in the pipeline
+            checker_names: Checkers whose base issues are needed; entries
+                indexed without one of them are completed
+        
+        Returns:
+            Dictionary mapping file paths to their base entries
+        
+        Raises:
+            Exception: If ``load_contents`` fails; nothing is indexed for the files
+        """
+        self._touch(repo, base_sha)
+        entries = self._load(repo, base_sha, file_paths)
+        missing = [path for path in file_paths if not _complete(entries.get(path), checker_names)]
+        
+        while missing:
+            claimed = self._claim(repo, base_sha, missing)
+            if claimed:
+                try:
+                    base_contents = load_contents(claimed)
+                    new_entries = {}
+                    for path in claimed:
+                        content = base_contents.get(path)
+                        if content is None:
+                            # Added files have no base issues
+                            new_entries[path] = BaselineEntry([], {name: [] for name in BASELINE_CHECKERS})
+                        else:
+                            new_entries[path] = self._analyze(content, path, checkers, checker_names, entries.get(path))
+                    entries.update(self._store(repo, base_sha, new_entries))
+                finally:
+                    self._release(repo, base_sha, claimed)
+            
+            # Files claimed by other jobs are picked up once indexed, or taken over when their claim expires
+            waiting = [path for path in missing if path not in claimed]
+            if not waiting:
+                break
+            if not claimed:
+                time.sleep(CLAIM_POLL_SECONDS)
+            entries.update(self._load(repo, base_sha, waiting))
+            missing = [path for path in waiting if not _complete(entries.get(path), checker_names)]
+        
+        return {path: entries[path] for path in file_paths}
+    
+    def _analyze(self, content: str, file_path: str, checkers: Dict[str, Any],
+                 checker_names: Tuple[str, ...], entry: Optional[BaselineEntry] = None) -> BaselineEntry:
+        """Run the baseline checkers an entry is still missing over one base file."""
+        issues = dict(entry.issues) if entry else {}
+        for name in checker_names:
+            if name in issues:
+                continue
+            if file_path.endswith('.py'):
+                issues[name] = checkers[name].check_file(content, file_path)
+            else:
+                issues[name] = []
+        digest = token_digest(content) if file_path.endswith('.py') else None
+        return BaselineEntry(line_hashes(content), issues, digest)
+    
+    def _touch(self, repo: str, base_sha: str) -> None:
+        """Record that a base commit is in use, evicting the least recently used ones over ``max_bases``."""
+        now = time.time()
+        with self._lock:
+            if now - self._touched.get((repo, base_sha), 0) < TOUCH_INTERVAL:
+                return
+            self._touched[(repo, base_sha)] = now
+        
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT INTO baseline_bases (repo, base_sha, last_used) VALUES (?, ?, ?) "
+                    "ON CONFLICT(repo, base_sha) DO UPDATE SET last_used = excluded.last_used",
+                    (repo, base_sha, now)
+                )
+                evicted = conn.execute(
+                    "SELECT repo, base_sha FROM baseline_bases ORDER BY last_used DESC LIMIT -1 OFFSET ?",
+                    (self.max_bases,)
+                ).fetchall()
+                for row in evicted:
+                    for table in ("baseline_files", "baseline_claims", "baseline_bases"):
+                        conn.execute(
+                            f"DELETE FROM {table} WHERE repo = ? AND base_sha = ?", (row["repo"], row["base_sha"])
+                        )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    
+    def _load(self, repo: str, base_sha: str, file_paths: List[str]) -> Dict[str, BaselineEntry]:
+        """Read the indexed entries of files."""
+        entries = {}
+        with self._connect() as conn:
+            for path in file_paths:
+                row = conn.execute(
+                    "SELECT line_hashes, digest, issues FROM baseline_files WHERE repo = ? AND base_sha = ? AND path = ?",
+                    (repo, base_sha, path)
+                ).fetchone()
+                if row is not None:
+                    entries[path] = _decode_entry(row)
+        return entries
+    
+    def _claim(self, repo: str, base_sha: str, file_paths: List[str]) -> List[str]:
+        """Claim the files no other job is analyzing, or whose claim expired.
+        
+        Returns:
+            Paths of the files this job must now analyze
+        """
+        owner = _claim_owner()
+        now = time.time()
+        claimed = []
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for path in file_paths:
+                    cursor = conn.execute(
+                        "INSERT INTO baseline_claims (repo, base_sha, path, owner, expires) VALUES (?, ?, ?, ?, ?) "
+                        "ON CONFLICT(repo, base_sha, path) DO UPDATE SET owner = excluded.owner, "
+                        "expires = excluded.expires WHERE baseline_claims.expires < ?",
+                        (repo, base_sha, path, owner, now + self.claim_seconds, now)
+                    )
+                    if cursor.rowcount:
+                        claimed.append(path)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return claimed
+    
+    def _release(self, repo: str, base_sha: str, file_paths: List[str]) -> None:
+        """Drop this job's claims of files, whether or not they were indexed."""
+        owner = _claim_owner()
+        with self._connect() as conn:
+            conn.executemany(
+                "DELETE FROM baseline_claims WHERE repo = ? AND base_sha = ? AND path = ? AND owner = ?",
+                [(repo, base_sha, path, owner) for path in file_paths]
+            )
+    
+    def _store(self, repo: str, base_sha: str, entries: Dict[str, BaselineEntry]) -> Dict[str, BaselineEntry]:
+        """Index entries, merged with checker results stored for them meanwhile.
+        
+        Returns:
+            The stored entries
+        """
+        stored = {}
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for path, entry in entries.items():
+                    row = conn.execute(
+                        "SELECT line_hashes, digest, issues FROM baseline_files WHERE repo = ? AND base_sha = ? AND path = ?",
+                        (repo, base_sha, path)
+                    ).fetchone()
+                    if row is not None:
+                        entry = BaselineEntry(entry.line_hashes, {**_decode_entry(row).issues, **entry.issues}, entry.digest)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO baseline_files (repo, base_sha, path, line_hashes, digest, issues) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (repo, base_sha, path, array('q', entry.line_hashes).tobytes(), entry.digest,
+                         json.dumps({
+                             name: [[issue.type, issue.msg, issue.line] for issue in issues]
+                             for name, issues in entry.issues.items()
+                         }))
+                    )
+                    stored[path] = entry
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return stored
+
+
+def _claim_owner() -> str:
+    """Identify the calling thread across every process sharing the index."""
+    return f"{os.getpid()}:{threading.get_ident()}"
+
+
+def _complete(entry: Optional[BaselineEntry], checker_names: Tuple[str, ...]) -> bool:
+    """Check whether an entry holds the base issues of every given checker."""
+    return entry is not None and all(name in entry.issues for name in checker_names)
+
+
+def _decode_entry(row: sqlite3.Row) -> BaselineEntry:
+    """Build an entry from its ``baseline_files`` row."""
+    hashes = array('q')
+    hashes.frombytes(row["line_hashes"])
+    issues = {
+        name: [Issue(type=issue_type, msg=msg, line=line) for issue_type, msg, line in issues]
+        for name, issues in json.loads(row["issues"]).items()
+    }
+    return BaselineEntry(hashes.tolist(), issues, row["digest"])
+
+
+def map_base_lines(base_hashes: List[int], head_hashes: List[int]) -> Dict[int, int]:
+    """Map unchanged base line numbers to their line numbers in the head file.
+    
+    Args:
+        base_hashes: Line hashes of the base file
+        head_hashes: Line hashes of the head file
+    
+    Returns:
+        Dictionary mapping 1-based base line numbers to 1-based head line numbers
+    """
+    line_map = {}
+    matcher = SequenceMatcher(None, base_hashes, head_hashes)
+    for base_start, head_start, size in matcher.get_matching_blocks():
+        for offset in range(size):
+            line_map[base_start + offset + 1] = head_start + offset + 1
+    return line_map
+
+
+def filter_new_issues(issues: List[Issue], base_issues: List[Issue], line_map: Dict[int, int]) -> List[Issue]:
+    """Drop head issues that already exist at the same (shifted) line on the base.
+    
+    Args:
+        issues: Issues found in the head version of a file
+        base_issues: Issues found in the base version of the file
+        line_map: Base-to-head line mapping from ``map_base_lines``
+    
+    Returns:
+        Issues introduced by the PR
+    """
+    existing = Counter(
+        (issue.type, issue.msg, line_map[issue.line])
+        for issue in base_issues
+        if issue.line in line_map
+    )
+    
+    new_issues = []
+    for issue in issues:
+        key = (issue.type, issue.msg, issue.line)
+        if existing[key] > 0:
+            existing[key] -= 1
+        else:
+            new_issues.append(issue)
+    
+    return new_issues
+
+
+class BaselineFilter:
+    """Reduces the checker results of a pull request's files to the issues it introduces.
+    
+    Files are filtered one at a time as they stream through the pipeline;
+    each file's base version is looked up in (or added to) the shared index
+    when the file arrives, so no more than one base file is held at a time.
+    Checkers in ``changed_lines_only`` are not run on the base at all;
+    their issues are kept only on lines the PR changed, which is cheaper
+    and used when the service is shedding load.
+    
+    The same base versions are used to triage files before they are
+    analyzed (see ``classify_file``).
+    """
+    
+    def __init__(
+        self,
+        index: BaselineIndex,
+        git_service: Any,
+        repo: str,
+        pr_number: int,
+        checkers: Dict[str, Any],
+        changed_lines_only: Tuple[str, ...] = (),
+        filter_issues: bool = True
+    ):
+        """Initialize the filter and resolve the pull request's base commit.
+        
+        Args:
+            index: Shared baseline index
+            git_service: Provider service with ``get_base_sha`` and ``get_files_content_at``
+            repo: Repository name
+            pr_number: Pull request number
+            checkers: Checker instances keyed like ``create_checkers`` in the pipeline
+            changed_lines_only: Checkers whose issues on unchanged lines are dropped
+            filter_issues: Whether issues are filtered; when only files are
+                triaged, the base is fetched but not analyzed
+        """
+        self.index = index
+        self.git_service = git_service
+        self.repo = repo
+        self.checkers = checkers
+        self.changed_lines_only = changed_lines_only
+        self.checker_names = tuple(
+            name for name in BASELINE_CHECKERS if filter_issues and name not in changed_lines_only
+        )
+        self.base_sha = git_service.get_base_sha(repo, pr_number)
+        self.removed = 0
+    
+    def _entry(self, file_path: str) -> BaselineEntry:
+        """Get a file's base entry, fetching and analyzing the base version if it is not indexed."""
+        # Base contents are only needed until they have been analyzed
+        return self.index.get_entries(
+            self.repo,
+            self.base_sha,
+            [file_path],
+            lambda paths: self.git_service.get_files_content_at(self.repo, paths, self.base_sha, ContentPolicy()),
+            self.checkers,
+            self.checker_names
+        )[file_path]
+    
+    def classify_file(self, file_path: str, content: str) -> str:
+        """Classify how a file changed from the base (see ``classify_change``).
+        
+        The base version is analyzed here already, so filtering the file's
+        issues afterwards does not fetch it again.
+        
+        Args:
+            file_path: Path to the file
+            content: Head content of the file
+        
+        Returns:
+            'no-op', 'cosmetic' or 'semantic'
+        """
+        entry = self._entry(file_path)
+        return classify_change(entry.line_hashes, entry.digest, content)
+    
+    def filter_file(self, file_path: str, content: str, file_results: Dict[str, List[Issue]]) -> None:
+        """Remove one file's pre-existing issues.
+        
+        Args:
+            file_path: Path to the file
+            content: Head content of the file
+            file_results: Head issues of the file per checker name; filtered in place
+        """
+        entry = self._entry(file_path)
+        if not entry.line_hashes:
+            return
+        
+        line_map = map_base_lines(entry.line_hashes, line_hashes(content))
+        unchanged_lines = set(line_map.values())
+        for name, issues in file_results.items():
+            if not issues:
+                continue
+            if name in self.changed_lines_only:
+                new_issues = [issue for issue in issues if issue.line not in unchanged_lines]
+            else:
+                new_issues = filter_new_issues(issues, entry.issues.get(name, []), line_map)
+            self.removed += len(issues) - len(new_issues)
+            file_results[name] = new_issues
@@ -1,15 +1,22 @@
 import ast
 import re
-from typing import List, Dict, Any, Set
+from typing import List, Dict, Any, Optional, Set, Tuple
 
 from models.feedback_model import Issue
+from analysis.node_cache import NodeCache, split_top_level
+from utils.time_budget import BudgetExceeded, JobCancelled, TimeBudget
 
 
 class BugChecker:
     """Checker for potential bugs and unsafe code patterns."""
     
-    def __init__(self):
-        """Initialize the bug checker with patterns to detect."""
+    def __init__(self, cache: Optional[NodeCache] = None):
+        """Initialize the bug checker with patterns to detect.
+        
+        Args:
+            cache: Optional cache of the AST rules' findings per top-level function and class
+        """
+        self.cache = cache
         # Patterns to look for in the code
         self.unsafe_functions = {
             'eval': 'Use of eval() is potentially dangerous',
@@ -22,15 +29,20 @@ class BugChecker:
             'os.popen': 'Check for command injection in os.popen calls'
         }
     
-    def check_file(self, file_content: str, file_path: str) -> List[Issue]:
+    def check_file(self, file_content: str, file_path: str, budget: Optional[TimeBudget] = None) -> List[Issue]:
         """Check a file for potential bugs and unsafe patterns.
         
         Args:
             file_content: Content of the file to check
             file_path: Path to the file (used for reporting)
+            budget: Time budget of the job; checking stops between top-level
+                functions and classes when the file's time runs out
             
         Returns:
             List of bug issues found
+        
+        Raises:
+            BudgetExceeded: If the file was not checked in time
         """
         issues = []
         
@@ -42,11 +54,8 @@ class BugChecker:
             # Parse the code into an AST
             tree = ast.parse(file_content)
             
-            # Check for unsafe function calls
-            issues.extend(self._check_unsafe_functions(tree, file_content))
-            
-            # Check for unused imports
-            issues.extend(self._check_unused_imports(tree, file_content))
+            # Check for unsafe function calls and unused imports
+            issues.extend(self._check_ast(tree, file_content, budget))
             
             # Check for hardcoded credentials
             issues.extend(self._check_hardcoded_credentials(file_content))
@@ -58,19 +67,90 @@ class BugChecker:
                 msg=f"Syntax error: {str(e)}",
                 line=e.lineno or 1
             ))
+        except (BudgetExceeded, JobCancelled):
+            raise
         except Exception as e:
             # Log other errors and continue
             print(f"Error analyzing {file_path} for bugs: {e}")
         
         return issues
     
-    def _check_unsafe_functions(self, tree: ast.AST, file_content: str) -> List[Issue]:
-        """Check for calls to unsafe functions.
+    def _check_ast(self, tree: ast.Module, file_content: str, budget: Optional[TimeBudget] = None) -> List[Issue]:
+        """Run the AST rules, reusing the cached findings of unchanged top-level functions and classes.
         
         Args:
             tree: AST of the file
             file_content: Content of the file
+            budget: Time budget checked before each top-level function and class
             
+        Returns:
+            List of issues related to unsafe function calls and unused imports
+        """
+        if self.cache is None and budget is None:
+            parts = [(tree, 1, None)]
+        else:
+            definitions, rest = split_top_level(tree, file_content.split('\n'))
+            # Statements other than functions and classes are checked every time
+            parts = [(ast.Module(body=rest, type_ignores=[]), 1, None)] + [
+                (definition.node, definition.start_line, definition.digest) for definition in definitions
+            ]
+        
+        issues = []
+        used_names: Set[str] = set()
+        imports = []
+        for node, start_line, digest in parts:
+            facts = self.cache.get('bug', digest) if digest is not None and self.cache is not None else None
+            if facts is None:
+                if budget is not None:
+                    budget.check_file_time()
+                facts = self._node_facts(node, start_line)
+                if digest is not None and self.cache is not None:
+                    self.cache.put('bug', digest, facts)
+            unsafe_calls, node_used_names, node_imports = facts
+            issues.extend(Issue(type="bug", msg=msg, line=offset + start_line) for msg, offset in unsafe_calls)
+            used_names.update(node_used_names)
+            imports.extend((offset + start_line, name, imported) for offset, name, imported in node_imports)
+        
+        issues.extend(self._check_unused_imports(sorted(imports, key=lambda item: item[:2]), used_names))
+        return issues
+    
+    def _node_facts(self, node: ast.AST, start_line: int) -> Tuple[
+            Tuple[Tuple[str, int], ...], frozenset, Tuple[Tuple[int, str, Optional[str]], ...]]:
+        """Collect what the AST rules need from one node, with lines relative to ``start_line``.
+        
+        Args:
+            node: AST node to check
+            start_line: Line the node's findings are relative to
+        
+        Returns:
+            (message and line of every unsafe call, names the node uses,
+            line, name and name bound of every imported name)
+        """
+        unsafe_calls = tuple(
+            (issue.msg, issue.line - start_line) for issue in self._check_unsafe_functions(node)
+        )
+        used_names = set()
+        imports = []
+        for child in ast.walk(node):
+            if isinstance(child, ast.Import):
+                for name in child.names:
+                    imports.append((child.lineno - start_line, name.name, name.name.split('.')[0]))
+            elif isinstance(child, ast.ImportFrom):
+                for name in child.names:
+                    imported = name.name if child.module and name.name != '*' else None
+                    imports.append((child.lineno - start_line, name.name, imported))
+            elif isinstance(child, ast.Name) and isinstance(child.ctx, ast.Load):
+                used_names.add(child.id)
+            elif isinstance(child, ast.Attribute) and isinstance(child.value, ast.Name):
+                used_names.add(child.value.id)
+        return unsafe_calls, frozenset(used_names), tuple(imports)
+    
+    def _check_unsafe_functions(self, tree: ast.AST) -> List[Issue]:
+        """Check for calls to unsafe functions.
+        
+        Args:
+            tree: AST of the file, or of a part of it
+        
         Returns:
             List of issues related to unsafe function calls
         """
@@ -108,68 +188,32 @@ class BugChecker:
         
         return issues
     
-    def _check_unused_imports(self, tree: ast.AST, file_content: str) -> List[Issue]:
+    def _check_unused_imports(self, imports: List[Tuple[int, str, Optional[str]]], used_names: Set[str]) -> List[Issue]:
         """Check for unused imports.
         
         Args:
-            tree: AST of the file
-            file_content: Content of the file
+            imports: Line, name and name bound of every imported name of the file
+            used_names: Names the file uses
             
         Returns:
             List of issues related to unused imports
         """
         issues = []
         
-        # Collect all imported names
-        imported_names = set()
-        # Collect all used names
-        used_names = set()
-        
-        class ImportVisitor(ast.NodeVisitor):
-            def visit_Import(self, node):
-                for name in node.names:
-                    imported_names.add(name.name.split('.')[0])
-                self.generic_visit(node)
-            
-            def visit_ImportFrom(self, node):
-                if node.module:
-                    for name in node.names:
-                        if name.name != '*':
-                            imported_names.add(name.name)
-                self.generic_visit(node)
-        
-        class NameVisitor(ast.NodeVisitor):
-            def visit_Name(self, node):
-                if isinstance(node.ctx, ast.Load):
-                    used_names.add(node.id)
-                self.generic_visit(node)
-            
-            def visit_Attribute(self, node):
-                if isinstance(node.value, ast.Name):
-                    used_names.add(node.value.id)
-                self.generic_visit(node)
-        
-        import_visitor = ImportVisitor()
-        import_visitor.visit(tree)
-        
-        name_visitor = NameVisitor()
-        name_visitor.visit(tree)
-        
         # Find unused imports
+        imported_names = {imported for _, _, imported in imports if imported is not None}
         unused_imports = imported_names - used_names
         
         # Create issues for unused imports
         for name in unused_imports:
             # Find the line number of the import
-            for node in ast.walk(tree):
-                if isinstance(node, (ast.Import, ast.ImportFrom)):
-                    for import_name in node.names:
-                        if import_name.name == name or import_name.name.split('.')[0] == name:
-                            issues.append(Issue(
-                                type="bug",
-                                msg=f"Unused import: {name}",
-                                line=node.lineno
-                            ))
+            for line, import_name, _ in imports:
+                if import_name == name or import_name.split('.')[0] == name:
+                    issues.append(Issue(
+                        type="bug",
+                        msg=f"Unused import: {name}",
+                        line=line
+                    ))
         
         return issues
     
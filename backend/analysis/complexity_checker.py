@@ -1,21 +1,26 @@
-from typing import List, Dict, Any
-import radon.complexity as cc
-from radon.visitors import ComplexityVisitor
+import ast
+from typing import List, Dict, Any, Optional
+
+import numpy as np
 
 from models.feedback_model import Issue
-from utils.helpers import create_temp_file, cleanup_temp_files
+from analysis.metrics import RANKS, FunctionMetrics, measure_functions
+from analysis.node_cache import NodeCache, split_top_level
+from utils.time_budget import BudgetExceeded, JobCancelled, TimeBudget
 
 
 class ComplexityChecker:
     """Checker for code complexity using Radon."""
     
-    def __init__(self, threshold: str = 'C'):
+    def __init__(self, threshold: str = 'C', cache: Optional[NodeCache] = None):
         """Initialize the complexity checker with a threshold.
         
         Args:
             threshold: Complexity rank threshold (A-F, where A is the best)
+            cache: Optional cache of the metrics of top-level functions and classes
         """
         self.threshold = threshold
+        self.cache = cache
         self.rank_to_score = {
             'A': 1,
             'B': 2,
@@ -25,42 +30,113 @@ class ComplexityChecker:
             'F': 6
         }
     
-    def check_file(self, file_content: str, file_path: str) -> List[Issue]:
-        """Check a file for complexity issues using Radon.
+    def measure_file(self, file_content: str, file_path: str, budget: Optional[TimeBudget] = None) -> FunctionMetrics:
+        """Measure every function of a file using Radon.
         
         Args:
-            file_content: Content of the file to check
+            file_content: Content of the file to measure
             file_path: Path to the file (used for reporting)
+            budget: Time budget of the job; measuring stops between top-level
+                functions and classes when the file's time runs out
             
         Returns:
-            List of complexity issues found
-        """
-        issues = []
+            Per-function metrics table (empty for non-Python or unparsable files)
         
+        Raises:
+            BudgetExceeded: If the file was not measured in time
+        """
         # Only check Python files
         if not file_path.endswith('.py'):
-            return issues
+            return FunctionMetrics.empty()
         
-        # Parse the code with Radon
         try:
-            visitor = ComplexityVisitor.from_code(file_content)
-            for func in visitor.functions:
-                # Get the complexity rank
-                rank = cc.rank_function(func.complexity)
-                
-                # Check if the complexity is above the threshold
-                if self.rank_to_score.get(rank, 0) >= self.rank_to_score.get(self.threshold, 0):
-                    issues.append(Issue(
-                        type="complexity",
-                        msg=f"Function {func.name} has complexity {func.complexity} (rank {rank})",
-                        line=func.lineno
-                    ))
+            if self.cache is None and budget is None:
+                return measure_functions(file_content)
+            return self._measure_by_node(file_content, budget)
+        except (BudgetExceeded, JobCancelled):
+            raise
         except Exception as e:
             # Log the error and continue
             print(f"Error analyzing complexity for {file_path}: {e}")
+            return FunctionMetrics.empty()
+    
+    def _measure_by_node(self, file_content: str, budget: Optional[TimeBudget]) -> FunctionMetrics:
+        """Measure a file one top-level function or class at a time.
         
+        The cached metrics of unchanged nodes are reused, and the budget is
+        checked before each node that has to be measured.
+        """
+        tree = ast.parse(file_content)
+        source_lines = file_content.split('\n')
+        definitions, rest = split_top_level(tree, source_lines)
+        names = []
+        rows = []
+        missed = []
+        for definition in definitions:
+            cached = self.cache.get('complexity', definition.digest) if self.cache is not None else None
+            if cached is None:
+                missed.append(definition)
+                continue
+            for name, (line, *values) in cached:
+                names.append(name)
+                rows.append((line + definition.start_line, *values))
+        
+        # Statements other than functions and classes are measured every time
+        parts = [(None, rest)] if rest else []
+        parts += [(definition, [definition.node]) for definition in missed]
+        for definition, body in parts:
+            if budget is not None:
+                budget.check_file_time()
+            measured = measure_functions(file_content, ast.Module(body=body, type_ignores=[]), source_lines)
+            measured_rows = list(zip(measured.names, measured.rows()))
+            if definition is not None and self.cache is not None:
+                self.cache.put('complexity', definition.digest, [
+                    (name, (line - definition.start_line, *values))
+                    for name, (line, *values) in measured_rows
+                ])
+            for name, row in measured_rows:
+                names.append(name)
+                rows.append(row)
+        
+        # In radon's order: functions, then methods, each by line
+        order = sorted(range(len(rows)), key=lambda index: ('.' in names[index], rows[index][0]))
+        return FunctionMetrics.from_rows([names[index] for index in order], [rows[index] for index in order])
+    
+    def _above_threshold(self, metrics: FunctionMetrics) -> np.ndarray:
+        """Mask of the functions ranked at or above the threshold."""
+        return metrics.rank_index >= RANKS.index(self.threshold)
+    
+    def issues_from_metrics(self, metrics: FunctionMetrics) -> List[Issue]:
+        """Report the functions of a file's metrics table that reach the threshold.
+        
+        Args:
+            metrics: Metrics table of one file
+            
+        Returns:
+            List of complexity issues found
+        """
+        issues = []
+        for row in np.flatnonzero(self._above_threshold(metrics)):
+            issues.append(Issue(
+                type="complexity",
+                msg=f"Function {metrics.names[row]} has complexity {metrics.complexity[row]} "
+                    f"(rank {RANKS[metrics.rank_index[row]]})",
+                line=int(metrics.line[row])
+            ))
         return issues
     
+    def check_file(self, file_content: str, file_path: str) -> List[Issue]:
+        """Check a file for complexity issues using Radon.
+        
+        Args:
+            file_content: Content of the file to check
+            file_path: Path to the file (used for reporting)
+            
+        Returns:
+            List of complexity issues found
+        """
+        return self.issues_from_metrics(self.measure_file(file_content, file_path))
+    
     def check_files(self, files_content: Dict[str, str]) -> Dict[str, List[Issue]]:
         """Check multiple files for complexity issues.
         
@@ -81,24 +157,20 @@ class ComplexityChecker:
         
         return results
     
-    def calculate_complexity_penalty(self, issues: List[Issue]) -> int:
-        """Calculate a complexity penalty based on the issues found.
+    def calculate_complexity_penalty(self, metrics: FunctionMetrics, mask: np.ndarray = None) -> int:
+        """Calculate a complexity penalty from a metrics table.
+        
+        Every function at or above the threshold costs twice its rank score.
         
         Args:
-            issues: List of complexity issues
+            metrics: Per-function metrics table
+            mask: Optional selection of the functions to count
             
         Returns:
             Complexity penalty (higher is worse)
         """
-        penalty = 0
-        for issue in issues:
-            if issue.type == "complexity":
-                # Extract the rank from the message
-                try:
-                    rank = issue.msg.split("rank ")[-1].strip(")")
-                    penalty += self.rank_to_score.get(rank, 3) * 2
-                except (IndexError, ValueError):
-                    # Default penalty if we can't parse the rank
-                    penalty += 6
-        
-        return penalty
\ No newline at end of file
+        counted = self._above_threshold(metrics)
+        if mask is not None:
+            counted &= mask
+        # rank_to_score is the rank index plus one
+        return int(((metrics.rank_index[counted] + 1) * 2).sum())
\ No newline at end of file
@@ -0,0 +1,278 @@
+import ast
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+from radon.complexity import cc_visit_ast
+from radon.metrics import halstead_visitor_report, mi_compute
+from radon.visitors import Function, HalsteadVisitor
+
+# Cyclomatic complexity rank letters, best first
+RANKS = 'ABCDEF'
+
+# Highest complexity of each rank but the last (same bounds as radon's cc_rank)
+RANK_BOUNDS = np.array([5, 10, 20, 30, 40])
+
+# Percentiles reported for every metric of a pull request
+SUMMARY_PERCENTILES = (50, 90, 99)
+
+
+class FunctionMetrics:
+    """Column-oriented table of per-function code metrics.
+    
+    Every function gets one row; numeric metrics are NumPy arrays so
+    PR-level aggregates are computed without Python loops. Tables of several
+    files are combined with :meth:`concat`, which records each row's file,
+    and tables of several such groups of files with :meth:`merge`.
+    """
+    
+    NUMERIC_COLUMNS = ('line', 'complexity', 'loc', 'maintainability', 'halstead_volume')
+    
+    def __init__(
+        self,
+        names: List[str],
+        line: np.ndarray,
+        complexity: np.ndarray,
+        loc: np.ndarray,
+        maintainability: np.ndarray,
+        halstead_volume: np.ndarray,
+        files: Optional[List[str]] = None,
+        file_index: Optional[np.ndarray] = None
+    ):
+        """Initialize the table from its columns.
+        
+        Args:
+            names: Function names ('Class.method' for methods)
+            line: Line number of each function definition
+            complexity: Cyclomatic complexity
+            loc: Lines of code, from the definition to the last line of the body
+            maintainability: Maintainability index (0-100, higher is better)
+            halstead_volume: Halstead volume
+            files: File paths referenced by ``file_index`` (tables of several files)
+            file_index: Index into ``files`` for each row
+        """
+        self.names = names
+        self.line = line
+        self.complexity = complexity
+        self.loc = loc
+        self.maintainability = maintainability
+        self.halstead_volume = halstead_volume
+        self.files = files or []
+        self.file_index = file_index if file_index is not None else np.zeros(len(names), dtype=np.int32)
+    
+    def __len__(self) -> int:
+        return len(self.names)
+    
+    @classmethod
+    def empty(cls) -> "FunctionMetrics":
+        """Create a table without rows."""
+        return cls(
+            [],
+            np.zeros(0, dtype=np.int32),
+            np.zeros(0, dtype=np.int32),
+            np.zeros(0, dtype=np.int32),
+            np.zeros(0, dtype=np.float32),
+            np.zeros(0, dtype=np.float32)
+        )
+    
+    @classmethod
+    def from_rows(cls, names: List[str], rows: List[tuple]) -> "FunctionMetrics":
+        """Create a table from the names and (line, complexity, loc, maintainability, halstead_volume) of its functions."""
+        if not rows:
+            return cls.empty()
+        
+        line, complexity, loc, maintainability, halstead_volume = zip(*rows)
+        return cls(
+            names,
+            np.array(line, dtype=np.int32),
+            np.array(complexity, dtype=np.int32),
+            np.array(loc, dtype=np.int32),
+            np.array(maintainability, dtype=np.float32),
+            np.array(halstead_volume, dtype=np.float32)
+        )
+    
+    def rows(self) -> List[tuple]:
+        """Get the (line, complexity, loc, maintainability, halstead_volume) of every function (see :meth:`from_rows`)."""
+        return list(zip(*(getattr(self, column).tolist() for column in self.NUMERIC_COLUMNS)))
+    
+    @classmethod
+    def concat(cls, tables: Dict[str, "FunctionMetrics"]) -> "FunctionMetrics":
+        """Combine the tables of several files into one.
+        
+        Args:
+            tables: Dictionary mapping file paths to their tables
+        
+        Returns:
+            Table with a row per function of every file
+        """
+        files = list(tables)
+        parts = [tables[path] for path in files]
+        if not parts:
+            return cls.empty()
+        
+        names = [name for part in parts for name in part.names]
+        file_index = np.repeat(np.arange(len(files), dtype=np.int32), [len(part) for part in parts])
+        return cls(
+            names,
+            *(np.concatenate([getattr(part, column) for part in parts]) for column in cls.NUMERIC_COLUMNS),
+            files=files,
+            file_index=file_index
+        )
+    
+    @classmethod
+    def merge(cls, tables: List["FunctionMetrics"]) -> "FunctionMetrics":
+        """Combine tables that each cover several files, e.g. those of the shards of one pull request.
+        
+        Args:
+            tables: Tables built by :meth:`concat`
+        
+        Returns:
+            Table with every row and file of the given tables
+        """
+        if not tables:
+            return cls.empty()
+        
+        offsets = np.cumsum([0] + [len(table.files) for table in tables[:-1]])
+        return cls(
+            [name for table in tables for name in table.names],
+            *(np.concatenate([getattr(table, column) for table in tables]) for column in cls.NUMERIC_COLUMNS),
+            files=[path for table in tables for path in table.files],
+            file_index=np.concatenate([
+                table.file_index + offset for table, offset in zip(tables, offsets)
+            ]).astype(np.int32)
+        )
+    
+    @classmethod
+    def from_columns(cls, columns: Dict[str, list]) -> "FunctionMetrics":
+        """Rebuild a table from the output of :meth:`to_columns`."""
+        if not columns:
+            return cls.empty()
+        
+        return cls(
+            list(columns['name']),
+            np.array(columns['line'], dtype=np.int32),
+            np.array(columns['complexity'], dtype=np.int32),
+            np.array(columns['loc'], dtype=np.int32),
+            np.array(columns['maintainability'], dtype=np.float32),
+            np.array(columns['halstead_volume'], dtype=np.float32),
+            files=list(columns['files']),
+            file_index=np.array(columns['file_index'], dtype=np.int32)
+        )
+    
+    @property
+    def rank_index(self) -> np.ndarray:
+        """Complexity rank of each function as an index into ``RANKS``."""
+        return np.searchsorted(RANK_BOUNDS, self.complexity, side='left')
+    
+    def ranks(self) -> List[str]:
+        """Complexity rank letter of each function."""
+        return [RANKS[index] for index in self.rank_index]
+    
+    def at_lines(self, lines_by_file: Dict[str, set]) -> np.ndarray:
+        """Select the functions defined at given lines.
+        
+        Args:
+            lines_by_file: Dictionary mapping file paths to definition line numbers
+        
+        Returns:
+            Boolean mask over the rows
+        """
+        mask = np.zeros(len(self), dtype=bool)
+        for index, path in enumerate(self.files):
+            lines = lines_by_file.get(path)
+            if lines:
+                mask |= (self.file_index == index) & np.isin(self.line, list(lines))
+        return mask
+    
+    def to_columns(self) -> Dict[str, list]:
+        """Get the table as JSON-serializable columns."""
+        return {
+            'files': self.files,
+            'file_index': self.file_index.tolist(),
+            'name': self.names,
+            'line': self.line.tolist(),
+            'complexity': self.complexity.tolist(),
+            'rank': self.ranks(),
+            'loc': self.loc.tolist(),
+            'maintainability': np.round(self.maintainability.astype(np.float64), 2).tolist(),
+            'halstead_volume': np.round(self.halstead_volume.astype(np.float64), 2).tolist()
+        }
+    
+    def summary(self) -> Dict[str, Any]:
+        """Get distributions of every metric over all functions.
+        
+        Returns:
+            Dictionary with the function count, the number of functions per
+            complexity rank and mean, max and percentiles of each metric
+        """
+        summary: Dict[str, Any] = {
+            'functions': len(self),
+            'ranks': dict(zip(RANKS, np.bincount(self.rank_index, minlength=len(RANKS)).tolist()))
+        }
+        if not len(self):
+            return summary
+        
+        for column in ('complexity', 'loc', 'maintainability', 'halstead_volume'):
+            values = getattr(self, column).astype(np.float64)
+            percentiles = np.percentile(values, SUMMARY_PERCENTILES)
+            summary[column] = {
+                'mean': round(float(values.mean()), 2),
+                'max': round(float(values.max()), 2),
+                **{f'p{p}': round(float(v), 2) for p, v in zip(SUMMARY_PERCENTILES, percentiles)}
+            }
+        return summary
+
+
+def measure_functions(file_content: str, tree: Optional[ast.Module] = None,
+                      source_lines: Optional[List[str]] = None) -> FunctionMetrics:
+    """Measure every function of a Python file from one parse.
+    
+    Complexity comes from radon's complexity visitor, Halstead volume from
+    its Halstead visitor run on each function's node of the same tree, and
+    the maintainability index is computed per function from those and the
+    function's source lines.
+    
+    Args:
+        file_content: Content of the file
+        tree: Parsed file, or a module holding only the top-level
+            statements of it to measure (parsed from ``file_content`` by default)
+        source_lines: ``file_content`` split into lines, when the caller has them already
+    
+    Returns:
+        Table with a row per function and method
+    
+    Raises:
+        SyntaxError: If the file cannot be parsed
+    """
+    if tree is None:
+        tree = ast.parse(file_content)
+    function_nodes = {
+        node.lineno: node
+        for node in ast.walk(tree)
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+    }
+    if source_lines is None:
+        source_lines = file_content.split('\n')
+    
+    names = []
+    rows = []
+    for block in cc_visit_ast(tree):
+        if not isinstance(block, Function):
+            continue
+        node = function_nodes.get(block.lineno)
+        volume = halstead_visitor_report(HalsteadVisitor.from_ast(node)).volume if node else 0.0
+        
+        body = [line.strip() for line in source_lines[block.lineno - 1:block.endline]]
+        sloc = sum(1 for line in body if line)
+        comments = sum(1 for line in body if line.startswith('#'))
+        comment_percent = comments * 100.0 / sloc if sloc else 0.0
+        
+        names.append(block.fullname)
+        rows.append((
+            block.lineno,
+            block.complexity,
+            block.endline - block.lineno + 1,
+            mi_compute(volume, block.complexity, sloc, comment_percent),
+            volume
+        ))
+    
+    return FunctionMetrics.from_rows(names, rows)
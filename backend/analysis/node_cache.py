@@ -0,0 +1,111 @@
+import ast
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Results of top-level functions and classes kept per process, over all checkers
+DEFAULT_NODE_CACHE_SIZE = 50000
+
+
+class TopLevelNode:
+    """A top-level function or class of a file, with the lines it spans including its decorators."""
+    
+    def __init__(self, node: ast.stmt, start_line: int, end_line: int, digest: str):
+        """Initialize the node.
+        
+        Args:
+            node: AST node of the definition
+            start_line: First line, that of its first decorator if it has any
+            end_line: Last line
+            digest: ``source_digest`` of its lines
+        """
+        self.node = node
+        self.start_line = start_line
+        self.end_line = end_line
+        self.digest = digest
+
+
+def source_digest(lines: List[str]) -> str:
+    """Hash source lines, ignoring trailing whitespace, so equal code at any position hashes alike."""
+    normalized = '\n'.join(line.rstrip() for line in lines)
+    return hashlib.sha1(normalized.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def split_top_level(tree: ast.Module, lines: List[str]) -> Tuple[List[TopLevelNode], List[ast.stmt]]:
+    """Split a module into its top-level functions and classes and its other statements.
+    
+    Args:
+        tree: Parsed module
+        lines: Source lines of the module
+    
+    Returns:
+        (top-level functions and classes, remaining top-level statements)
+    """
+    definitions = []
+    rest = []
+    for node in tree.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            rest.append(node)
+            continue
+        start_line = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+        end_line = node.end_lineno or node.lineno
+        definitions.append(TopLevelNode(node, start_line, end_line, source_digest(lines[start_line - 1:end_line])))
+    return definitions, rest
+
+
+class NodeCache:
+    """Process-wide cache of checker results per top-level function or class.
+    
+    Results are keyed by checker and by the hash of the node's source and
+    stored with line numbers relative to the node's first line, so a
+    function keeps its cached results when code above it moves it, and only
+    edited functions are analyzed again.
+    """
+    
+    def __init__(self, max_entries: Optional[int] = None):
+        """Initialize the cache.
+        
+        Args:
+            max_entries: Results kept before the least recently used are dropped (NODE_CACHE_SIZE)
+        """
+        if max_entries is None:
+            max_entries = int(os.getenv("NODE_CACHE_SIZE", DEFAULT_NODE_CACHE_SIZE))
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, checker: str, digest: str) -> Optional[Any]:
+        """Get a checker's cached result for a node, or None."""
+        key = (checker, digest)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, checker: str, digest: str, value: Any) -> None:
+        """Cache a checker's result for a node; results must not be modified afterwards."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[(checker, digest)] = value
+            self._entries.move_to_end((checker, digest))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def stats(self) -> dict:
+        """Get the cache's size and hit counts."""
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -1,23 +1,42 @@
+import os
 import subprocess
 import tempfile
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from models.feedback_model import Issue
 from utils.helpers import create_temp_file, cleanup_temp_files
+from utils.time_budget import BudgetExceeded, TimeBudget
+
+# Seconds a flake8 run may take when the caller has no time budget
+DEFAULT_FLAKE8_TIMEOUT = 30
 
 
 class StyleChecker:
     """Checker for code style issues using Flake8."""
     
-    def check_file(self, file_content: str, file_path: str) -> List[Issue]:
+    def __init__(self, timeout: Optional[float] = None):
+        """Initialize the style checker.
+        
+        Args:
+            timeout: Seconds before flake8 is killed when no time budget is given (FLAKE8_TIMEOUT)
+        """
+        if timeout is None:
+            timeout = float(os.getenv("FLAKE8_TIMEOUT", DEFAULT_FLAKE8_TIMEOUT))
+        self.timeout = timeout
+    
+    def check_file(self, file_content: str, file_path: str, budget: Optional[TimeBudget] = None) -> List[Issue]:
         """Check a file for style issues using Flake8.
         
         Args:
             file_content: Content of the file to check
             file_path: Path to the file (used for reporting)
+            budget: Time budget of the job; flake8 is killed when the file's time runs out
             
         Returns:
             List of style issues found
+            
+        Raises:
+            BudgetExceeded: If flake8 did not finish in time
         """
         # Create a temporary file with the content
         temp_file = create_temp_file(file_content)
@@ -25,12 +44,20 @@ class StyleChecker:
         
         try:
             # Run flake8 on the temporary file
-            result = subprocess.run(
-                ['flake8', '--format=%(row)d:%(col)d:%(code)s:%(text)s', temp_file],
-                capture_output=True,
-                text=True,
-                check=False
-            )
+            command = ['flake8', '--format=%(row)d:%(col)d:%(code)s:%(text)s', temp_file]
+            if budget is not None:
+                result = budget.run_command(command)
+            else:
+                try:
+                    result = subprocess.run(
+                        command,
+                        capture_output=True,
+                        text=True,
+                        check=False,
+                        timeout=self.timeout
+                    )
+                except subprocess.TimeoutExpired:
+                    raise BudgetExceeded(f"flake8 timed out after {self.timeout:.0f}s")
             
             # Parse the output
             for line in result.stdout.strip().split('\n'):
@@ -0,0 +1,114 @@
+import ast
+import hashlib
+import io
+import tokenize
+from typing import List, Optional, Tuple
+
+# How a file changed from its base version: not at all, only in layout,
+# comments, string quoting or import order, or in what the code does
+CHANGE_KINDS = ('no-op', 'cosmetic', 'semantic')
+
+# Tokens that only lay the code out
+LAYOUT_TOKENS = {tokenize.COMMENT, tokenize.NL, tokenize.ENCODING, tokenize.ENDMARKER}
+
+
+def _normalize_string(text: str) -> str:
+    """Spell a string literal the same way whatever its quotes, e.g. 'a' and "a"."""
+    try:
+        return repr(ast.literal_eval(text))
+    except (ValueError, SyntaxError):
+        # f-strings are not literals; their quotes are kept
+        return text
+
+
+def normalized_statements(content: str) -> Optional[List[List[Tuple[int, str]]]]:
+    """Split a file into statements of (token type, text) with layout and comments removed.
+    
+    Indentation changes are kept as statements of their own, and runs of
+    top-level imports are sorted, so reordered imports normalize alike.
+    
+    Args:
+        content: Content of a Python file
+    
+    Returns:
+        Normalized statements, or None if the file cannot be tokenized
+    """
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(content).readline))
+    except (tokenize.TokenError, SyntaxError):
+        return None
+    
+    statements: List[List[Tuple[int, str]]] = []
+    statement: List[Tuple[int, str]] = []
+    depth = 0
+    imports: List[List[Tuple[int, str]]] = []
+    for token in tokens:
+        if token.type in LAYOUT_TOKENS:
+            continue
+        if token.type in (tokenize.INDENT, tokenize.DEDENT):
+            depth += 1 if token.type == tokenize.INDENT else -1
+            statements.extend(sorted(imports))
+            imports = []
+            statements.append([(token.type, '')])
+            continue
+        text = token.string
+        if token.type == tokenize.NEWLINE:
+            # Line endings, like indentation widths, only matter where they occur
+            text = ''
+        elif token.type == tokenize.STRING:
+            text = _normalize_string(text)
+        statement.append((token.type, text))
+        if token.type != tokenize.NEWLINE:
+            continue
+        if depth == 0 and statement[0][1] in ('import', 'from'):
+            imports.append(statement)
+        else:
+            statements.extend(sorted(imports))
+            imports = []
+            statements.append(statement)
+        statement = []
+    statements.extend(sorted(imports))
+    if statement:
+        statements.append(statement)
+    return statements
+
+
+def line_hashes(content: str) -> List[int]:
+    """Hash every line of a file, with a hash that is the same in every process unlike ``hash()``."""
+    return [
+        int.from_bytes(hashlib.blake2b(line.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'big', signed=True)
+        for line in content.split('\n')
+    ]
+
+
+def token_digest(content: str) -> Optional[str]:
+    """Hash a file's normalized statements (see ``normalized_statements``).
+    
+    Returns:
+        Hex digest, or None if the file cannot be tokenized
+    """
+    statements = normalized_statements(content)
+    if statements is None:
+        return None
+    return hashlib.sha1(repr(statements).encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def classify_change(base_line_hashes: List[int], base_digest: Optional[str], content: str) -> str:
+    """Classify how a file changed from its base version.
+    
+    Args:
+        base_line_hashes: Hash of every line of the base file, empty if the file was added
+        base_digest: ``token_digest`` of the base file
+        content: Head content of the file
+    
+    Returns:
+        'no-op' if the lines are identical, 'cosmetic' if only layout,
+        comments, string quoting or import order changed, 'semantic' otherwise
+    """
+    if not base_line_hashes:
+        return 'semantic'
+    if base_line_hashes == line_hashes(content):
+        return 'no-op'
+    if base_digest is not None and base_digest == token_digest(content):
+        return 'cosmetic'
+    return 'semantic'
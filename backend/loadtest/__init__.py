@@ -0,0 +1 @@
+# Load test package initialization
\ No newline at end of file
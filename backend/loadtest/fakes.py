@@ -0,0 +1,254 @@
+"""Fake provider service and model backend with configurable latency, for load tests.
+
+The app under test loads them through GIT_SERVICE_BACKEND and AI_BACKEND:
+    
+    GIT_SERVICE_BACKEND=loadtest.fakes:FakeGitService
+    AI_BACKEND=loadtest.fakes:FakeModelBackend
+
+Pull requests are synthetic: the repository name carries the number of
+changed files ('loadtest/pr-40' changes 40 files) and the PR number seeds
+their content, so every request is reproducible without a provider.
+"""
+import difflib
+import json
+import math
+import os
+import random
+import re
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from analysis.ai_backends import ModelBackend
+from utils.content_policy import ContentPolicy
+from utils.file_stream import fetch_concurrently
+
+# Load environment variables
+load_dotenv()
+
+# Median milliseconds of one provider request and of one model request
+DEFAULT_GIT_LATENCY_MS = 40
+DEFAULT_AI_LATENCY_MS = 800
+
+# Spread of the log-normal latency distribution (0 for a fixed latency)
+DEFAULT_LATENCY_SIGMA = 0.5
+
+# Fraction of provider and model requests that fail
+DEFAULT_ERROR_RATE = 0.0
+
+# File contents fetched in parallel per job
+DEFAULT_GIT_CONCURRENCY = 8
+
+# Changed files of a PR whose repository name carries no count
+DEFAULT_FILES_PER_PR = 5
+
+# One in this many changed files is not Python
+NON_PYTHON_EVERY = 8
+
+
+class FakeLatency:
+    """Log-normal request latency with injected failures, read from the environment."""
+    
+    def __init__(self, prefix: str, default_ms: float):
+        """Initialize the latency model.
+        
+        Args:
+            prefix: Environment variable prefix, e.g. 'LOADTEST_GIT' for
+                LOADTEST_GIT_LATENCY_MS and LOADTEST_GIT_ERROR_RATE
+            default_ms: Median latency when the variable is not set
+        """
+        self.median = float(os.getenv(f"{prefix}_LATENCY_MS", default_ms)) / 1000
+        self.sigma = float(os.getenv("LOADTEST_LATENCY_SIGMA", DEFAULT_LATENCY_SIGMA))
+        self.error_rate = float(os.getenv(f"{prefix}_ERROR_RATE", DEFAULT_ERROR_RATE))
+        self.name = prefix
+    
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Sleep for one request's latency.
+        
+        Args:
+            timeout: Seconds the caller allows the request to take
+        
+        Raises:
+            Exception: If the request is chosen to fail, or takes longer than ``timeout``
+        """
+        delay = self.median * math.exp(self.sigma * random.gauss(0, 1))
+        if timeout is not None and delay > timeout:
+            time.sleep(max(timeout, 0))
+            raise Exception(f"{self.name} request timed out after {timeout:.1f}s")
+        time.sleep(delay)
+        if random.random() < self.error_rate:
+            raise Exception(f"{self.name} request failed (injected)")
+
+
+def pr_file_count(repo: str) -> int:
+    """Get the number of files a synthetic PR changes from its repository name."""
+    match = re.search(r'(\d+)$', repo)
+    return int(match.group(1)) if match else DEFAULT_FILES_PER_PR
+
+
+def pr_file_paths(repo: str, pr_number: int) -> List[str]:
+    """Get the paths of the files a synthetic PR changes."""
+    return [
+        f"docs/page_{index}.md" if index % NON_PYTHON_EVERY == NON_PYTHON_EVERY - 1 else f"pkg/module_{index}.py"
+        for index in range(pr_file_count(repo))
+    ]
+
+
+def synthetic_file(repo: str, pr_number: int, file_path: str, base: bool = False) -> str:
+    """Generate the content of one file of a synthetic PR.
+    
+    Files hold a mix of short and branchy functions, long lines and risky
+    calls, so every checker has work to do. The base version lacks the
+    functions the PR added.
+    
+    Args:
+        repo: Repository name
+        pr_number: Pull request number
+        file_path: Path of the file
+        base: Whether to generate the file as it was before the PR
+    
+    Returns:
+        File content
+    """
+    rng = random.Random(f"{repo}#{pr_number}:{file_path}")
+    if not file_path.endswith('.py'):
+        return '\n'.join(f"Paragraph {i} of {file_path}." for i in range(rng.randint(5, 40)))
+    
+    lines = ["import os", "import subprocess", ""]
+    functions = rng.randint(2, 25)
+    added = set(rng.sample(range(functions), max(1, functions // 3)))
+    for index in range(functions):
+        body = [f"def function_{index}(value, limit={rng.randint(1, 100)}):", f'    """Compute result {index}."""']
+        for branch in range(rng.choice([0, 1, 2, 4, 8])):
+            body.append(f"    if value > {branch} and limit < {branch * 10}:")
+            body.append(f"        value = value * {branch + 2} + limit - {rng.randint(0, 9)}")
+        if rng.random() < 0.2:
+            body.append("    result = eval(str(value))")
+        elif rng.random() < 0.3:
+            body.append(f"    result = [item for item in range(value) if item % {rng.randint(2, 7)} == 0 and item > limit and item < value * 2]")
+        else:
+            body.append("    result = value")
+        body += ["    return result", "", ""]
+        # Drawn for the base as well, so both versions share the other functions
+        if not (base and index in added):
+            lines += body
+    return '\n'.join(lines)
+
+
+class FakeGitService:
+    """Provider service serving synthetic pull requests after a configurable delay.
+    
+    Every provider call sleeps for one request latency (LOADTEST_GIT_LATENCY_MS)
+    and fails at LOADTEST_GIT_ERROR_RATE; file contents are fetched with up
+    to LOADTEST_GIT_CONCURRENCY requests in flight, like the real services.
+    """
+    
+    def __init__(self, blob_cache: Any = None):
+        """Initialize the service.
+        
+        Args:
+            blob_cache: Accepted for compatibility with the real services; unused
+        """
+        self.latency = FakeLatency("LOADTEST_GIT", DEFAULT_GIT_LATENCY_MS)
+        self.max_concurrency = int(os.getenv("LOADTEST_GIT_CONCURRENCY", DEFAULT_GIT_CONCURRENCY))
+    
+    def get_pr_files(self, repo_name: str, pr_number: int) -> List[Dict[str, Any]]:
+        """Get files changed in a synthetic pull request."""
+        self.latency.wait()
+        files = []
+        for file_path in pr_file_paths(repo_name, pr_number):
+            head = synthetic_file(repo_name, pr_number, file_path).split('\n')
+            base = synthetic_file(repo_name, pr_number, file_path, base=True).split('\n')
+            # Hunks only, without the ---/+++ header, as providers return them
+            patch = list(difflib.unified_diff(base, head, lineterm=''))[2:]
+            additions = sum(1 for line in patch if line.startswith('+'))
+            deletions = sum(1 for line in patch if line.startswith('-'))
+            files.append({
+                "filename": file_path,
+                "status": "modified",
+                "additions": additions,
+                "deletions": deletions,
+                "changes": additions + deletions,
+                "patch": '\n'.join(patch)
+            })
+        return files
+    
+    def _read_file(self, repo_name: str, pr_number: int, file_path: str, base: bool,
+                   content_policy: ContentPolicy) -> Optional[str]:
+        """Fetch one synthetic file through a content policy."""
+        self.latency.wait()
+        content = synthetic_file(repo_name, pr_number, file_path, base)
+        data = content.encode('utf-8')
+        return content_policy.read(file_path, [data], len(data))
+    
+    def iter_pr_files_content(self, repo_name: str, pr_number: int,
+                              content_policy: Optional[ContentPolicy] = None) -> Iterator[Tuple[str, str]]:
+        """Stream the content of all files changed in a synthetic pull request."""
+        if content_policy is None:
+            content_policy = ContentPolicy()
+        self.latency.wait()
+        return fetch_concurrently(
+            lambda file_path: self._read_file(repo_name, pr_number, file_path, False, content_policy),
+            pr_file_paths(repo_name, pr_number),
+            self.max_concurrency
+        )
+    
+    def get_pr_files_content(self, repo_name: str, pr_number: int,
+                             content_policy: Optional[ContentPolicy] = None) -> Dict[str, str]:
+        """Get content of all files changed in a synthetic pull request."""
+        return dict(self.iter_pr_files_content(repo_name, pr_number, content_policy))
+    
+    def get_base_sha(self, repo_name: str, pr_number: int) -> str:
+        """Get the commit a synthetic pull request is based on; the PR number encodes it."""
+        self.latency.wait()
+        return f"base-{pr_number}"
+    
+    def get_changed_file_count(self, repo_name: str, pr_number: int) -> int:
+        """Get the number of files a synthetic pull request changes."""
+        self.latency.wait()
+        return pr_file_count(repo_name)
+    
+    def get_pr_head(self, repo_name: str, pr_number: int) -> Tuple[str, str]:
+        """Get the repository and head commit of a synthetic pull request; the PR number encodes it."""
+        self.latency.wait()
+        return repo_name, f"head-{pr_number}"
+    
+    def get_files_content_at(self, repo_name: str, file_paths: List[str], ref: str,
+                             content_policy: ContentPolicy) -> Dict[str, str]:
+        """Get content of several files at the base or head commit of a synthetic pull request."""
+        side, _, pr_number = ref.rpartition('-')
+        files_content = {}
+        for file_path in file_paths:
+            content = self._read_file(repo_name, int(pr_number), file_path, side == "base", content_policy)
+            if content is not None:
+                files_content[file_path] = content
+        return files_content
+    
+    def get_pr_author(self, repo_name: str, pr_number: int) -> str:
+        """Get the author of a synthetic pull request."""
+        return f"author-{pr_number % 10}"
+
+
+class FakeModelBackend(ModelBackend):
+    """Model backend replying with one suggestion per chunk after a configurable delay.
+    
+    Requests take LOADTEST_AI_LATENCY_MS plus LOADTEST_AI_MS_PER_KTOKEN per
+    thousand prompt tokens, and fail at LOADTEST_AI_ERROR_RATE.
+    """
+    
+    def __init__(self):
+        """Initialize the backend from the environment."""
+        self.latency = FakeLatency("LOADTEST_AI", DEFAULT_AI_LATENCY_MS)
+        self.ms_per_ktoken = float(os.getenv("LOADTEST_AI_MS_PER_KTOKEN", "200"))
+    
+    def complete(self, system: str, prompt: str, max_tokens: int, timeout: float) -> str:
+        """Get a fake reply suggesting a change on the first line of every chunk."""
+        # Larger prompts take longer to process
+        prompt_seconds = len(prompt) / 4 / 1000 * self.ms_per_ktoken / 1000
+        time.sleep(min(prompt_seconds, max(timeout, 0)))
+        self.latency.wait(timeout - prompt_seconds)
+        suggestions = []
+        for chunk_id, line in re.findall(r'^### chunk (\d+) \(.*\)\n(\d+):', prompt, re.M):
+            suggestions.append({"chunk": int(chunk_id), "line": int(line), "message": "Consider a clearer name here"})
+        return json.dumps({"suggestions": suggestions})
@@ -0,0 +1,411 @@
+"""Load test of the analyze API against a locally started app with fake providers.
+
+Usage:
+    python -m loadtest.harness --rate 2 --duration 120 --mix 3:0.6,25:0.3,150:0.1
+    python -m loadtest.harness --mode queue --workers 4 --rate 5 --output report.json
+
+The app (and in queue mode the worker processes) is started with the git
+services and the AI backend replaced by the fakes of ``loadtest.fakes``,
+whose latency is set with --git-latency-ms and --ai-latency-ms. Jobs arrive
+as a Poisson process at the target rate, independently of how fast the app
+answers, and each one is polled with GET /analyze/{job_id} until it ends.
+Latency is measured from the scheduled arrival, so a saturated client or
+server shows up in the numbers instead of slowing the arrivals down.
+
+The report gives p50/p95/p99 end-to-end latency overall and per PR size,
+throughput, error rates, queue depth over time and the memory of the
+processes running jobs; --max-p95 and --max-error-rate turn it into a
+pass/fail check.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import requests
+
+# Directory of main.py and worker.py
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Changed files per PR and their share of the traffic: mostly small PRs, a few huge ones
+DEFAULT_MIX = "3:0.5,12:0.3,40:0.15,200:0.05"
+
+# Seconds the app may take to start answering /health
+STARTUP_TIMEOUT = 30
+
+# Seconds a single HTTP request of the load generator may take
+HTTP_TIMEOUT = 30
+
+PERCENTILES = (50, 95, 99)
+
+
+def parse_mix(mix: str) -> List[Tuple[int, float]]:
+    """Parse a PR size mix such as '3:0.6,40:0.4' into (files, weight) pairs."""
+    sizes = []
+    for entry in mix.split(","):
+        files, _, weight = entry.partition(":")
+        sizes.append((int(files), float(weight or 1)))
+    if not sizes or sum(weight for _, weight in sizes) <= 0:
+        raise ValueError(f"Invalid PR size mix: {mix}")
+    return sizes
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """Get the resident memory of a local process in MB, or None if it cannot be read."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        return None
+    return None
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """Get the reported percentiles of a list of latencies."""
+    if not values:
+        return {f"p{p}": None for p in PERCENTILES}
+    return {f"p{p}": round(float(np.percentile(values, p)), 3) for p in PERCENTILES}
+
+
+class JobRecord:
+    """Outcome of one load-test job."""
+    
+    def __init__(self, files: int, scheduled: float):
+        """Initialize the record.
+        
+        Args:
+            files: Changed files of the job's PR
+            scheduled: Monotonic time the job was due to be submitted
+        """
+        self.files = files
+        self.scheduled = scheduled
+        self.submit_seconds: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.status: Optional[str] = None
+        self.error: Optional[str] = None
+    
+    @property
+    def latency(self) -> Optional[float]:
+        """Seconds from the scheduled arrival until the job was seen finished."""
+        return self.finished - self.scheduled if self.finished is not None else None
+
+
+class LoadTest:
+    """Drives the analyze API at a target arrival rate and collects measurements."""
+    
+    def __init__(self, base_url: str, rate: float, duration: float, mix: List[Tuple[int, float]],
+                 poll_interval: float, job_timeout: float, client_threads: int, seed: int):
+        """Initialize the load test.
+        
+        Args:
+            base_url: Root URL of the app under test
+            rate: Jobs submitted per second, on average
+            duration: Seconds during which jobs are submitted
+            mix: (changed files, weight) of the PR sizes submitted
+            poll_interval: Seconds between status requests of one job
+            job_timeout: Seconds after its arrival a job counts as timed out
+            client_threads: Jobs the load generator submits and polls at once
+            seed: Seed of the arrival times and PR choices
+        """
+        self.base_url = base_url.rstrip("/")
+        self.rate = rate
+        self.duration = duration
+        self.mix = mix
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout
+        self.client_threads = client_threads
+        self.rng = random.Random(seed)
+        self.records: List[JobRecord] = []
+        self.samples: List[Dict[str, Any]] = []
+        self.started = 0.0
+        self._local = threading.local()
+        self._stop_sampling = threading.Event()
+    
+    def _session(self) -> requests.Session:
+        """Get this thread's HTTP session."""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+    
+    def _run_job(self, record: JobRecord, payload: Dict[str, Any]) -> None:
+        """Submit one job and poll it until it ends or times out."""
+        session = self._session()
+        submitted = time.monotonic()
+        try:
+            response = session.post(f"{self.base_url}/analyze", json=payload, timeout=HTTP_TIMEOUT)
+        except requests.RequestException as e:
+            record.status, record.error = "error", f"submit: {type(e).__name__}"
+            return
+        record.submit_seconds = time.monotonic() - submitted
+        if response.status_code != 200:
+            record.status, record.error = "error", f"submit: HTTP {response.status_code}"
+            return
+        job_id = response.json()["job_id"]
+        
+        deadline = record.scheduled + self.job_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            try:
+                response = session.get(f"{self.base_url}/analyze/{job_id}", timeout=HTTP_TIMEOUT)
+            except requests.RequestException as e:
+                record.status, record.error = "error", f"poll: {type(e).__name__}"
+                return
+            if response.status_code != 200:
+                record.status, record.error = "error", f"poll: HTTP {response.status_code}"
+                return
+            status = response.json().get("status")
+            if status in ("completed", "failed", "cancelled"):
+                record.finished = time.monotonic()
+                record.status = status
+                if status != "completed":
+                    record.error = f"job {status}"
+                return
+        record.status, record.error = "timeout", "timeout"
+    
+    def _sample(self, pids: List[int], interval: float) -> None:
+        """Record queue depth and memory until the load test ends."""
+        session = requests.Session()
+        while not self._stop_sampling.wait(interval):
+            sample: Dict[str, Any] = {
+                "t": round(time.monotonic() - self.started, 1),
+                "in_flight": sum(1 for record in list(self.records) if record.status is None)
+            }
+            worker_pids = list(pids)
+            try:
+                stats = session.get(f"{self.base_url}/queue/stats", timeout=HTTP_TIMEOUT).json()
+                sample["jobs"] = stats.get("jobs", {})
+                worker_pids += [worker["pid"] for worker in stats.get("workers", []) if worker.get("pid")]
+            except (requests.RequestException, ValueError):
+                sample["jobs"] = None
+            sample["rss_mb"] = {
+                str(pid): round(mb, 1)
+                for pid, mb in ((pid, rss_mb(pid)) for pid in sorted(set(worker_pids)))
+                if mb is not None
+            }
+            self.samples.append(sample)
+    
+    def run(self, pids: List[int], sample_interval: float) -> None:
+        """Submit jobs for the test's duration and wait for all of them to end.
+        
+        Args:
+            pids: Local processes whose memory is sampled, besides the reported workers
+            sample_interval: Seconds between queue depth and memory samples
+        """
+        sizes = [files for files, _ in self.mix]
+        weights = [weight for _, weight in self.mix]
+        self.started = time.monotonic()
+        sampler = threading.Thread(target=self._sample, args=(pids, sample_interval), daemon=True)
+        sampler.start()
+        with ThreadPoolExecutor(max_workers=self.client_threads) as executor:
+            arrival = self.started
+            while True:
+                # Poisson arrivals: exponential gaps between jobs
+                arrival += self.rng.expovariate(self.rate)
+                if arrival - self.started > self.duration:
+                    break
+                time.sleep(max(0.0, arrival - time.monotonic()))
+                files = self.rng.choices(sizes, weights)[0]
+                record = JobRecord(files, arrival)
+                self.records.append(record)
+                payload = {
+                    "server": "github",
+                    "repo": f"loadtest/pr-{files}",
+                    "pr_number": self.rng.randint(1, 10 ** 6)
+                }
+                executor.submit(self._run_job, record, payload)
+        self._stop_sampling.set()
+        sampler.join()
+    
+    def report(self, warmup: float) -> Dict[str, Any]:
+        """Summarize the jobs that arrived after the warmup.
+        
+        Args:
+            warmup: Seconds from the start whose jobs are left out of the statistics
+        
+        Returns:
+            JSON-serializable report
+        """
+        records = [record for record in self.records if record.scheduled - self.started >= warmup]
+        completed = [record for record in records if record.status == "completed"]
+        errors: Dict[str, int] = {}
+        for record in records:
+            if record.error:
+                errors[record.error] = errors.get(record.error, 0) + 1
+        finished = [record.finished for record in completed]
+        window = (max(finished) - min(record.scheduled for record in records)) if finished else 0.0
+        
+        by_size = {}
+        for files, _ in self.mix:
+            size_records = [record for record in records if record.files == files]
+            by_size[str(files)] = {
+                "jobs": len(size_records),
+                "completed": sum(1 for record in size_records if record.status == "completed"),
+                **percentiles([record.latency for record in size_records if record.status == "completed"])
+            }
+        
+        rss: Dict[str, Dict[str, float]] = {}
+        for sample in self.samples:
+            for pid, mb in sample["rss_mb"].items():
+                entry = rss.setdefault(pid, {"first": mb, "peak": mb, "last": mb})
+                entry["peak"] = max(entry["peak"], mb)
+                entry["last"] = mb
+        pending = [(sample["jobs"] or {}).get("pending", 0) for sample in self.samples]
+        
+        return {
+            "target_rate": self.rate,
+            "offered_rate": round(len(records) / max(self.duration - warmup, 1e-9), 3),
+            "jobs": len(records),
+            "completed": len(completed),
+            "throughput": round(len(completed) / window, 3) if window else 0.0,
+            "error_rate": round(sum(errors.values()) / len(records), 4) if records else 0.0,
+            "errors": errors,
+            "latency": percentiles([record.latency for record in completed]),
+            "submit_latency": percentiles([record.submit_seconds for record in records if record.submit_seconds is not None]),
+            "latency_by_files": by_size,
+            "max_pending": max(pending, default=0),
+            "memory_mb": rss,
+            "samples": self.samples
+        }
+
+
+def start_app(args: argparse.Namespace, log) -> Tuple[str, List[subprocess.Popen]]:
+    """Start the app, and in queue mode its workers, with the fake providers.
+    
+    Returns:
+        Root URL of the app and the started processes
+    """
+    env = dict(os.environ)
+    env.update({
+        "GIT_SERVICE_BACKEND": "loadtest.fakes:FakeGitService",
+        "AI_BACKEND": "loadtest.fakes:FakeModelBackend",
+        "LOADTEST_GIT_LATENCY_MS": str(args.git_latency_ms),
+        "LOADTEST_AI_LATENCY_MS": str(args.ai_latency_ms),
+        "LOADTEST_GIT_ERROR_RATE": str(args.error_rate),
+        "LOADTEST_AI_ERROR_RATE": str(args.error_rate),
+        "HISTORY_ENABLED": "false",
+        "ANALYSIS_MODE": args.mode
+    })
+    if args.mode == "queue":
+        env["JOB_QUEUE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "jobs.db")
+    
+    processes = [subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+    )]
+    if args.mode == "queue":
+        processes.append(subprocess.Popen(
+            [sys.executable, "worker.py", "--processes", str(args.workers), "--poll-interval", "0.2"],
+            cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+        ))
+    
+    base_url = f"http://127.0.0.1:{args.port}"
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if processes[0].poll() is not None:
+            raise Exception(f"App exited with code {processes[0].returncode} during startup")
+        try:
+            if requests.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return base_url, processes
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise Exception(f"App did not answer /health within {STARTUP_TIMEOUT}s")
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    """Print the report in a readable form."""
+    def fmt(values: Dict[str, Optional[float]]) -> str:
+        return "  ".join(f"{name}={value if value is not None else '-'}s" for name, value in values.items())
+    
+    print(f"jobs: {report['jobs']} (offered {report['offered_rate']}/s, target {report['target_rate']}/s), "
+          f"completed: {report['completed']}, throughput: {report['throughput']}/s")
+    print(f"end-to-end latency: {fmt(report['latency'])}")
+    print(f"submit latency:     {fmt(report['submit_latency'])}")
+    for files, stats in report["latency_by_files"].items():
+        print(f"  {files:>5} files: {stats['completed']}/{stats['jobs']} completed  "
+              f"{fmt({name: stats[name] for name in ('p50', 'p95', 'p99')})}")
+    print(f"error rate: {report['error_rate']:.2%} {report['errors'] or ''}")
+    print(f"max pending jobs: {report['max_pending']}")
+    print("queue depth over time (t: pending/running, client in flight):")
+    step = max(1, len(report["samples"]) // 20)
+    for sample in report["samples"][::step]:
+        jobs = sample["jobs"] or {}
+        print(f"  {sample['t']:>7}s: {jobs.get('pending', 0)}/{jobs.get('running', 0)}, {sample['in_flight']}")
+    for pid, mb in report["memory_mb"].items():
+        print(f"memory of pid {pid}: first {mb['first']} MB, peak {mb['peak']} MB, last {mb['last']} MB")
+
+
+def main() -> None:
+    """Run a load test and report it."""
+    parser = argparse.ArgumentParser(description="Load test the analyze API with fake providers")
+    parser.add_argument("--rate", type=float, default=1.0, help="Jobs submitted per second")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds during which jobs are submitted")
+    parser.add_argument("--warmup", type=float, default=0, help="Seconds of jobs left out of the statistics")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="PR sizes as files:weight pairs")
+    parser.add_argument("--mode", choices=("inprocess", "queue"), default="inprocess",
+                        help="Run jobs in the app or in worker processes (ANALYSIS_MODE)")
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes in queue mode")
+    parser.add_argument("--url", help="Load an already running app instead of starting one")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the started app")
+    parser.add_argument("--git-latency-ms", type=float, default=40, help="Median latency of a fake provider request")
+    parser.add_argument("--ai-latency-ms", type=float, default=800, help="Median latency of a fake model request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake requests that fail")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Seconds between status requests of a job")
+    parser.add_argument("--job-timeout", type=float, default=600, help="Seconds after which a job counts as timed out")
+    parser.add_argument("--client-threads", type=int, default=256, help="Jobs submitted and polled at once")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="Seconds between queue and memory samples")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the arrivals and PR choices")
+    parser.add_argument("--output", help="Write the full report, with every sample, to this JSON file")
+    parser.add_argument("--max-p95", type=float, help="Fail if the p95 end-to-end latency exceeds this many seconds")
+    parser.add_argument("--max-error-rate", type=float, help="Fail if the error rate exceeds this fraction")
+    args = parser.parse_args()
+    
+    processes: List[subprocess.Popen] = []
+    log = tempfile.NamedTemporaryFile(prefix="loadtest-app-", suffix=".log", delete=False)
+    try:
+        if args.url:
+            base_url = args.url
+        else:
+            base_url, processes = start_app(args, log)
+        load_test = LoadTest(
+            base_url, args.rate, args.duration, parse_mix(args.mix),
+            args.poll_interval, args.job_timeout, args.client_threads, args.seed
+        )
+        load_test.run([process.pid for process in processes[:1]], args.sample_interval)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        log.close()
+    
+    report = load_test.report(args.warmup)
+    print_report(report)
+    print(f"app log: {log.name}")
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    
+    failures = []
+    if args.max_p95 is not None and (report["latency"]["p95"] is None or report["latency"]["p95"] > args.max_p95):
+        failures.append(f"p95 latency {report['latency']['p95']}s is over {args.max_p95}s")
+    if args.max_error_rate is not None and report["error_rate"] > args.max_error_rate:
+        failures.append(f"error rate {report['error_rate']:.2%} is over {args.max_error_rate:.2%}")
+    if failures:
+        print("FAILED: " + "; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
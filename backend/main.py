@@ -1,20 +1,25 @@
 import os
-from typing import Dict, List, Any, Union
+from typing import Dict, List, Any, Optional, Union
 import re
-from urllib.parse import urlparse
 
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
-from models.feedback_model import AnalyzeRequest, AnalyzeResponse, FileIssues, Issue
-from services.github_service import GitHubService
-from services.gitlab_service import GitLabService
-from analysis.style_checker import StyleChecker
-from analysis.complexity_checker import ComplexityChecker
-from analysis.bug_checker import BugChecker
-from analysis.ai_feedback import AIFeedbackGenerator
-from utils.helpers import calculate_score
+from models.feedback_model import AnalyzeRequest, BatchAnalyzeRequest, RescoreRequest
+from pipeline import (
+    MIRROR_REPOS,
+    analyze_pull_request,
+    create_checkers,
+    get_git_service,
+    history_store,
+    parse_pr_url
+)
+from services.job_queue import get_job_queue
+from services.history_store import TREND_BUCKETS
+from services.webhooks import DEFAULT_WEBHOOK_DEBOUNCE_SECONDS, WebhookError, parse_event, pr_key, verify_signature
+from utils.blob_cache import BlobCache
+from utils.time_budget import JobCancelled, TimeBudget
 
 # Load environment variables
 load_dotenv()
@@ -24,10 +29,29 @@ load_dotenv()
 import uuid
 import threading
 import time
-from fastapi.encoders import jsonable_encoder
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 # In-memory job store (for demo; use Redis/DB for production)
 analysis_jobs = {}
+# Jobs of in-process batches; queued batches are looked up in the job queue
+batch_jobs = {}
+
+# Most pull requests one batch request may analyze
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "500"))
+
+# Worker pool that batch jobs are scheduled on
+analysis_executor = ThreadPoolExecutor(max_workers=int(os.getenv("ANALYSIS_WORKERS", "4")))
+
+# 'inprocess' runs jobs inside this server; 'queue' only enqueues them for worker.py processes
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "inprocess")
+job_queue = get_job_queue() if ANALYSIS_MODE == "queue" else None
+
+# Seconds a webhook-triggered job waits for further pushes before it starts
+WEBHOOK_DEBOUNCE_SECONDS = float(os.getenv("WEBHOOK_DEBOUNCE_SECONDS", DEFAULT_WEBHOOK_DEBOUNCE_SECONDS))
+
+# Whether webhook-triggered analyses are posted back to the pull request as a review
+PUBLISH_WEBHOOK_REVIEWS = os.getenv("PUBLISH_WEBHOOK_REVIEWS", "true") == "true"
 
 app = FastAPI(
     title="PR Review Agent API",
@@ -44,21 +68,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-def get_git_service(server: str):
-    """Get the appropriate git service based on the server type."""
-    if server.lower() == "github":
-        return GitHubService()
-    elif server.lower() == "gitlab":
-        return GitLabService()
-    elif server.lower() == "bitbucket":
-        # Import here to avoid circular imports
-        from services.bitbucket_service import BitbucketService
-        return BitbucketService()
-    else:
-        raise HTTPException(status_code=400, detail=f"Unsupported server: {server}")
-
-
 # Health check endpoint
 @app.get("/health")
 async def health_check():
@@ -66,168 +75,300 @@ async def health_check():
     return {"status": "ok"}
 
 
-# Helper function to parse PR URL
-def parse_pr_url(url: str):
-    """Parse PR URL to extract repo, PR number, and server."""
+# --- ASYNC ANALYSIS JOBS ---
+def run_analysis_job(job_id, request_dict, git_service=None, checkers=None):
+    """Run one analysis job, optionally reusing a batch's git service and checkers."""
+    job = analysis_jobs[job_id]
+    if job["status"] == "cancelled":
+        return
+    budget = TimeBudget()
+    job["budget"] = budget
+    job["status"] = "running"
+    waiting_jobs = sum(1 for other in list(analysis_jobs.values()) if other["status"] == "pending")
     try:
-        parsed_url = urlparse(url)
-        path_parts = parsed_url.path.strip('/').split('/')
-        hostname = parsed_url.netloc.lower()
-        
-        # URL patterns for different Git services
-        patterns = {
-            'github.com': {
-                'server': 'github',
-                'path_index': 2,
-                'path_value': 'pull',
-                'pr_index': 3,
-                'min_length': 4,
-                'repo_format': lambda p: f"{p[0]}/{p[1]}"
-            },
-            'gitlab.com': {
-                'server': 'gitlab',
-                'path_index': 3,
-                'path_value': 'merge_requests',
-                'pr_index': 4,
-                'min_length': 5,
-                'repo_format': lambda p: f"{p[0]}/{p[1]}"
-            },
-            'bitbucket.org': {
-                'server': 'bitbucket',
-                'path_index': 2,
-                'path_value': 'pull-requests',
-                'pr_index': 3,
-                'min_length': 4,
-                'repo_format': lambda p: f"{p[0]}/{p[1]}"
-            }
-        }
-        
-        # Find matching pattern
-        for domain, pattern in patterns.items():
-            if domain in hostname:
-                if (len(path_parts) >= pattern['min_length'] and 
-                    path_parts[pattern['path_index']] == pattern['path_value']):
-                    repo = pattern['repo_format'](path_parts)
-                    pr_number = int(path_parts[pattern['pr_index']])
-                    return repo, pr_number, pattern['server']
-                else:
-                    raise ValueError(f"Invalid {pattern['server']} PR URL format")
-        
-        # If no pattern matched
-        raise ValueError(f"Unsupported Git service: {hostname}")
+        result = analyze_pull_request(request_dict, git_service, checkers, budget, waiting_jobs)
+        if job["status"] != "cancelled":
+            job["result"] = result
+            job["status"] = "completed"
+    except JobCancelled:
+        job["status"] = "cancelled"
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to parse PR URL: {str(e)}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        job.pop("budget", None)
 
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Get a job's status, result and error from the queue or the in-memory store."""
+    if job_queue is not None:
+        return job_queue.get(job_id)
+    return analysis_jobs.get(job_id)
+
+
+def job_tenant(request: AnalyzeRequest) -> Optional[str]:
+    """Get the tenant a queued job is scheduled fairly against others for: the named one, or its repository."""
+    if request.tenant:
+        return request.tenant
+    if request.pr_url:
+        repo, _, _ = parse_pr_url(request.pr_url)
+        return repo
+    return request.repo
 
-# --- ASYNC ANALYSIS JOBS ---
-def run_analysis_job(job_id, request_dict):
-    try:
-        # Simulate analysis delay for demo (remove in prod)
-        # time.sleep(2)
-        request = AnalyzeRequest(**request_dict)
-        if request.pr_url:
-            repo, pr_number, server = parse_pr_url(request.pr_url)
-            request.repo = repo
-            request.pr_number = pr_number
-            request.server = server
-        if not request.repo or request.pr_number is None or not request.server:
-            request.repo = request.repo or "sample/repo"
-            request.pr_number = request.pr_number if request.pr_number is not None else 1
-            request.server = request.server or "github"
-        git_service = get_git_service(request.server)
-        try:
-            files_content = git_service.get_pr_files_content(request.repo, request.pr_number)
-            if not files_content:
-                raise ValueError("No files content returned")
-        except Exception as e:
-            print(f"Error fetching PR content: {str(e)}")
-            files_content = {
-                "src/main.py": "def calculate_sum(a, b):\n    return a + b\n\ndef main():\n    print('Hello world')\n    result = calculate_sum(5, 10)\n    print(f'Sum: {result}')\n\nif __name__ == '__main__':\n    main()",
-                "src/utils.py": "def format_string(text):\n    return text.strip().lower()\n\ndef is_valid_email(email):\n    # Very basic validation\n    return '@' in email"
-            }
-        style_checker = StyleChecker()
-        complexity_checker = ComplexityChecker()
-        bug_checker = BugChecker()
-        ai_feedback_generator = AIFeedbackGenerator()
-        enabled_checks = getattr(request, 'enabled_checks', {
-            'style': True,
-            'performance': True,
-            'security': True,
-            'complexity': True,
-            'best_practices': True,
-            'documentation': True
-        })
-        all_issues: Dict[str, List[Issue]] = {}
-        issue_counts = {
-            'style': 0,
-            'performance': 0,
-            'security': 0,
-            'complexity': 0,
-            'best_practices': 0,
-            'documentation': 0
-        }
-        if enabled_checks.get('style', True):
-            style_issues = style_checker.check_files(files_content)
-            for file_path, issues in style_issues.items():
-                all_issues.setdefault(file_path, []).extend(issues)
-                issue_counts['style'] += len(issues)
-        if enabled_checks.get('complexity', True):
-            complexity_issues = complexity_checker.check_files(files_content)
-            for file_path, issues in complexity_issues.items():
-                all_issues.setdefault(file_path, []).extend(issues)
-                issue_counts['complexity'] += len(issues)
-        if enabled_checks.get('security', True) or enabled_checks.get('performance', True):
-            bug_issues = bug_checker.check_files(files_content)
-            for file_path, issues in bug_issues.items():
-                all_issues.setdefault(file_path, []).extend(issues)
-                for issue in issues:
-                    if 'security' in issue.message.lower():
-                        issue_counts['security'] += 1
-                    else:
-                        issue_counts['performance'] += 1
-        ai_suggestions = ai_feedback_generator.generate_feedback_for_files(files_content)
-        for file_path, issues in ai_suggestions.items():
-            all_issues.setdefault(file_path, []).extend(issues)
-            for issue in issues:
-                if 'documentation' in issue.message.lower():
-                    issue_counts['documentation'] += 1
-                else:
-                    issue_counts['best_practices'] += 1
-        score_result = calculate_score(issue_counts)
-        from models.feedback_model import Score, CategoryScore
-        category_scores = CategoryScore(**score_result["categories"])
-        score = Score(overall=score_result["overall"], categories=category_scores)
-        feedback = [
-            FileIssues(file=file_path, issues=issues)
-            for file_path, issues in all_issues.items()
-            if issues
-        ]
-        result = AnalyzeResponse(
-            repo=request.repo,
-            pr_number=request.pr_number,
-            server=request.server,
-            feedback=feedback,
-            score=score
-        )
-        analysis_jobs[job_id]["status"] = "completed"
-        # Use jsonable_encoder to ensure all objects are serializable
-        analysis_jobs[job_id]["result"] = jsonable_encoder(result)
-    except Exception as e:
-        analysis_jobs[job_id]["status"] = "failed"
-        analysis_jobs[job_id]["error"] = str(e)
 
 @app.post("/analyze", response_model=dict)
 async def start_analysis(request: AnalyzeRequest, background_tasks: BackgroundTasks):
     """Start analysis job and return job ID immediately."""
     job_id = str(uuid.uuid4())
+    if job_queue is not None:
+        job_queue.enqueue(job_id, request.dict(), tenant=job_tenant(request))
+        return {"job_id": job_id, "status": "pending"}
     analysis_jobs[job_id] = {"status": "pending", "result": None, "error": None}
     background_tasks.add_task(run_analysis_job, job_id, request.dict())
     return {"job_id": job_id, "status": "pending"}
 
+
+@app.get("/queue/stats", response_model=dict)
+async def get_queue_stats():
+    """Get job counts per status and the live worker processes (this server's own jobs in-process)."""
+    if job_queue is None:
+        counts: Dict[str, int] = {}
+        for job in list(analysis_jobs.values()):
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {"jobs": counts, "workers": [{"worker_id": "inprocess", "pid": os.getpid()}]}
+    return job_queue.stats()
+
+
+def resolve_batch_targets(request: BatchAnalyzeRequest) -> List[tuple]:
+    """Expand a batch request into (server, repo, pr_number) targets."""
+    targets = [parse_pr_url(url) for url in request.pr_urls]
+    targets = [(server, repo, pr_number) for repo, pr_number, server in targets]
+    
+    pr_numbers = list(request.pr_numbers)
+    if request.pr_range_start is not None and request.pr_range_end is not None:
+        range_size = request.pr_range_end - request.pr_range_start + 1
+        if request.pr_range_start < 1 or range_size < 1:
+            raise HTTPException(status_code=400, detail="pr_range_start must be positive and not after pr_range_end")
+        if range_size > MAX_BATCH_SIZE:
+            raise HTTPException(status_code=400, detail=f"PR range is larger than {MAX_BATCH_SIZE} pull requests")
+        pr_numbers.extend(range(request.pr_range_start, request.pr_range_end + 1))
+    if pr_numbers:
+        if not request.repo or not request.server:
+            raise HTTPException(status_code=400, detail="repo and server are required with PR numbers")
+        targets.extend((request.server, request.repo, pr_number) for pr_number in pr_numbers)
+    
+    # Drop duplicates while keeping the requested order
+    targets = list(dict.fromkeys(targets))
+    if len(targets) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch is larger than {MAX_BATCH_SIZE} pull requests")
+    return targets
+
+
+@app.post("/analyze/batch", response_model=dict)
+async def start_batch_analysis(request: BatchAnalyzeRequest):
+    """Start analysis jobs for many PRs that share provider sessions, content and checkers."""
+    targets = resolve_batch_targets(request)
+    if not targets:
+        raise HTTPException(status_code=400, detail="No pull requests to analyze")
+    
+    batch_id = str(uuid.uuid4())
+    job_ids = []
+    
+    if job_queue is not None:
+        # Workers run each job in their own process with their own sessions and content caches
+        for server, repo, pr_number in targets:
+            job_id = str(uuid.uuid4())
+            job_queue.enqueue(job_id, {
+                "server": server,
+                "repo": repo,
+                "pr_number": pr_number,
+                "enabled_checks": request.enabled_checks,
+                "new_issues_only": request.new_issues_only,
+                "publish": request.publish
+            }, tenant=repo, batch_id=batch_id)
+            job_ids.append({"job_id": job_id, "server": server, "repo": repo, "pr_number": pr_number})
+        return {"batch_id": batch_id, "status": "pending", "jobs": job_ids}
+    
+    blob_cache = BlobCache()
+    checkers = create_checkers()
+    git_services = {}
+    for server, repo, pr_number in targets:
+        # Mirrored repositories get their own backend; others share one per server
+        service_key = (server, repo if repo in MIRROR_REPOS else None)
+        if service_key not in git_services:
+            try:
+                git_services[service_key] = get_git_service(server, repo, blob_cache)
+            except Exception as e:
+                # Each job will hit the same error and report it as its failure
+                print(f"Error creating {server} service for batch {batch_id}: {e}")
+                git_services[service_key] = None
+        
+        job_id = str(uuid.uuid4())
+        analysis_jobs[job_id] = {"status": "pending", "result": None, "error": None}
+        request_dict = {
+            "server": server,
+            "repo": repo,
+            "pr_number": pr_number,
+            "enabled_checks": request.enabled_checks,
+            "new_issues_only": request.new_issues_only,
+            "publish": request.publish
+        }
+        analysis_executor.submit(run_analysis_job, job_id, request_dict, git_services[service_key], checkers)
+        job_ids.append({"job_id": job_id, "server": server, "repo": repo, "pr_number": pr_number})
+    
+    batch_jobs[batch_id] = {"jobs": job_ids, "blob_cache": blob_cache}
+    return {"batch_id": batch_id, "status": "pending", "jobs": job_ids}
+
+
+@app.get("/analyze/batch/{batch_id}", response_model=dict)
+async def get_batch_status(batch_id: str):
+    """Get aggregated progress of a batch and the status of each of its jobs."""
+    if job_queue is not None:
+        # Aggregated from the queue, so any API process can answer for any batch
+        jobs = [
+            {
+                "job_id": job["job_id"],
+                "server": job["payload"].get("server"),
+                "repo": job["payload"].get("repo"),
+                "pr_number": job["payload"].get("pr_number"),
+                "status": job["status"]
+            }
+            for job in job_queue.batch(batch_id)
+        ]
+        blob_cache = None
+    else:
+        batch = batch_jobs.get(batch_id)
+        jobs = [
+            {**job, "status": (get_job(job["job_id"]) or {}).get("status", "failed")}
+            for job in (batch["jobs"] if batch else [])
+        ]
+        blob_cache = batch["blob_cache"] if batch else None
+    if not jobs:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    
+    counts = {"pending": 0, "running": 0, "completed": 0, "failed": 0, "cancelled": 0}
+    for job in jobs:
+        counts[job["status"]] = counts.get(job["status"], 0) + 1
+    
+    done = counts["completed"] + counts["failed"] + counts["cancelled"]
+    response = {
+        "batch_id": batch_id,
+        "status": "completed" if done == len(jobs) else "running",
+        "total": len(jobs),
+        "progress": round(done / len(jobs), 3),
+        "counts": counts,
+        "jobs": jobs
+    }
+    if blob_cache is not None:
+        # Queued jobs cache file contents in their worker processes, which are not reported here
+        response["cache"] = {"hits": blob_cache.hits, "misses": blob_cache.misses}
+    return response
+
+
+@app.delete("/analyze/{job_id}", response_model=dict)
+async def cancel_analysis(job_id: str):
+    """Cancel a pending or running job, killing its running subprocesses."""
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] not in ("pending", "running"):
+        raise HTTPException(status_code=409, detail=f"Job is already {job['status']}")
+    
+    cancel_job(job_id)
+    return {"job_id": job_id, "status": "cancelled"}
+
+
+def cancel_job(job_id: str) -> None:
+    """Cancel a pending or running job in the queue or the in-memory store."""
+    if job_queue is not None:
+        job_queue.cancel(job_id)
+        return
+    job = analysis_jobs[job_id]
+    job["status"] = "cancelled"
+    budget = job.get("budget")
+    if budget is not None:
+        budget.cancel()
+
+
+# --- WEBHOOKS ---
+def supersede_jobs(key: str, head_sha: Optional[str]) -> List[str]:
+    """Cancel a pull request's pending and running jobs for other head commits (all if head_sha is None)."""
+    if job_queue is not None:
+        return job_queue.supersede(key, head_sha)
+    cancelled = []
+    for job_id, job in list(analysis_jobs.items()):
+        if (job.get("pr_key") == key and job["status"] in ("pending", "running")
+                and (head_sha is None or job.get("head_sha") != head_sha)):
+            cancel_job(job_id)
+            cancelled.append(job_id)
+    return cancelled
+
+
+def latest_job_for(key: str) -> Optional[Dict[str, Any]]:
+    """Get 'job_id', 'head_sha' and 'status' of the newest job of a pull request."""
+    if job_queue is not None:
+        return job_queue.latest_for(key)
+    for job_id, job in reversed(list(analysis_jobs.items())):
+        if job.get("pr_key") == key:
+            return {"job_id": job_id, "head_sha": job.get("head_sha"), "status": job["status"]}
+    return None
+
+
+@app.post("/webhooks/{server}", response_model=dict)
+async def receive_webhook(server: str, request: Request):
+    """Schedule analysis for signed GitHub, GitLab and Bitbucket pull request events.
+    
+    Jobs start after WEBHOOK_DEBOUNCE_SECONDS so a burst of pushes only
+    analyzes the last one; jobs for commits that have been superseded are
+    cancelled, as are all jobs of closed pull requests.
+    """
+    body = await request.body()
+    try:
+        verify_signature(server, request.headers, body)
+        event = parse_event(server, request.headers, body)
+    except WebhookError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if event is None:
+        return {"status": "ignored"}
+    
+    key = pr_key(event["server"], event["repo"], event["pr_number"])
+    if event["action"] == "close":
+        return {"status": "closed", "cancelled": supersede_jobs(key, None)}
+    
+    latest = latest_job_for(key)
+    if latest and latest["head_sha"] == event["head_sha"] and latest["status"] in ("pending", "running", "completed"):
+        # Redelivery or an update that did not push commits
+        return {"status": "duplicate", "job_id": latest["job_id"]}
+    cancelled = supersede_jobs(key, event["head_sha"])
+    
+    job_id = str(uuid.uuid4())
+    request_dict = {
+        "server": event["server"],
+        "repo": event["repo"],
+        "pr_number": event["pr_number"],
+        "author": event["author"],
+        "publish": PUBLISH_WEBHOOK_REVIEWS
+    }
+    if job_queue is not None:
+        job_queue.enqueue(
+            job_id, request_dict, key, event["head_sha"], not_before=time.time() + WEBHOOK_DEBOUNCE_SECONDS,
+            tenant=event["repo"]
+        )
+    else:
+        analysis_jobs[job_id] = {
+            "status": "pending", "result": None, "error": None, "pr_key": key, "head_sha": event["head_sha"]
+        }
+        timer = threading.Timer(
+            WEBHOOK_DEBOUNCE_SECONDS, analysis_executor.submit, args=(run_analysis_job, job_id, request_dict)
+        )
+        timer.daemon = True
+        timer.start()
+    return {"job_id": job_id, "status": "pending", "superseded": cancelled, "starts_in": WEBHOOK_DEBOUNCE_SECONDS}
+
+
 @app.get("/analyze/{job_id}", response_model=dict)
 async def get_analysis_result(job_id: str):
     """Get analysis job status/result."""
-    job = analysis_jobs.get(job_id)
+    job = get_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     if job["status"] == "completed":
@@ -235,10 +376,85 @@ async def get_analysis_result(job_id: str):
         return {"status": "completed", "result": job["result"]}
     elif job["status"] == "failed":
         return {"status": "failed", "error": job["error"]}
+    elif job.get("shards"):
+        # Split across workers; shards completed so far
+        return {"status": job["status"], "shards": job["shards"]}
     else:
         return {"status": job["status"]}
 
 
+# --- ANALYSIS HISTORY ---
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """Parse an ISO 8601 date or datetime query parameter into a Unix timestamp."""
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+
+
+def require_history_store():
+    """Get the history store, or fail if it is disabled."""
+    if history_store is None:
+        raise HTTPException(status_code=404, detail="History store is disabled")
+    return history_store
+
+
+@app.get("/history/trends", response_model=dict)
+async def get_history_trends(repo: Optional[str] = None, author: Optional[str] = None,
+                             since: Optional[str] = None, until: Optional[str] = None, bucket: str = "day"):
+    """Get average scores and issue counts per day or week."""
+    if bucket not in TREND_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(TREND_BUCKETS)}")
+    store = require_history_store()
+    periods = store.trends(repo, author, parse_time(since), parse_time(until), bucket)
+    return {"repo": repo, "author": author, "bucket": bucket, "periods": periods}
+
+
+@app.get("/history/files", response_model=dict)
+async def get_history_files(repo: str, since: Optional[str] = None, until: Optional[str] = None, limit: int = 20):
+    """Get the files of a repository with the most reported issues."""
+    store = require_history_store()
+    return {"repo": repo, "files": store.top_files(repo, parse_time(since), parse_time(until), limit)}
+
+
+@app.post("/history/rescore", response_model=dict)
+async def rescore_history(request: RescoreRequest):
+    """Score past analyses again with new category weights, without re-running them."""
+    store = require_history_store()
+    started = time.monotonic()
+    scored = store.rescore(
+        request.weights, request.repo, request.author, parse_time(request.since), parse_time(request.until)
+    )
+    total = len(scored["id"])
+    return {
+        "analyses": total,
+        "average_score": round(float(scored["overall"].mean()), 2) if total else None,
+        "average_new_score": round(float(scored["new_overall"].mean()), 2) if total else None,
+        "seconds": round(time.monotonic() - started, 3),
+        "results": [
+            {
+                "id": int(scored["id"][i]),
+                "repo": scored["repo"][i],
+                "pr_number": int(scored["pr_number"][i]),
+                "score": int(scored["overall"][i]),
+                "new_score": int(scored["new_overall"][i])
+            }
+            # Most recent analyses first
+            for i in range(total - 1, max(-1, total - 1 - request.limit), -1)
+        ]
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # Several API processes only share jobs in queue mode
+    api_workers = int(os.getenv("API_WORKERS", "1"))
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=api_workers,
+        reload=api_workers == 1 and os.getenv("API_RELOAD", "true") == "true"
+    )
\ No newline at end of file
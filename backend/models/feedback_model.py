@@ -1,4 +1,4 @@
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, Field
 
 
@@ -9,6 +9,23 @@ class AnalyzeRequest(BaseModel):
     pr_number: Optional[int] = None
     pr_url: Optional[str] = None  # Full PR URL (alternative to separate repo/pr_number)
     enabled_checks: Dict[str, bool] = {}
+    new_issues_only: bool = True  # Hide issues that already exist on the base branch
+    author: Optional[str] = None  # PR author for the history store; looked up when missing
+    publish: bool = False  # Post the findings to the PR as one review
+    tenant: Optional[str] = None  # Team sharing workers fairly with others in queue mode; defaults to the repo
+
+
+class BatchAnalyzeRequest(BaseModel):
+    """Request model for the batch analyze endpoint."""
+    pr_urls: List[str] = []  # Full PR URLs, possibly across repositories
+    server: Optional[str] = None  # Used with repo and PR numbers instead of URLs
+    repo: Optional[str] = None
+    pr_numbers: List[int] = []
+    pr_range_start: Optional[int] = None  # Inclusive range of PR numbers
+    pr_range_end: Optional[int] = None
+    enabled_checks: Dict[str, bool] = {}
+    new_issues_only: bool = True
+    publish: bool = False
 
 
 class Issue(BaseModel):
@@ -50,4 +67,29 @@ class AnalyzeResponse(BaseModel):
     pr_number: int
     server: str
     feedback: List[FileIssues]
-    score: Score
\ No newline at end of file
+    score: Score
+    skipped_files: Dict[str, str] = {}  # file path -> reason it was not analyzed
+    triaged_files: Dict[str, str] = {}  # file path -> 'cosmetic' (style checked only) or 'no-op' (not analyzed)
+    base_sha: Optional[str] = None  # Set when pre-existing issues were removed
+    preexisting_issues: int = 0  # Issues hidden because they also exist on the base
+    status: str = "complete"  # 'partial' when time budgets cut the analysis short
+    skipped_stages: List[str] = []  # Stages not run because the job ran out of time
+    timed_out_files: Dict[str, List[str]] = {}  # stage -> files it could not analyze in time
+    stage_seconds: Dict[str, float] = {}  # Time spent in each stage
+    degradation_level: int = 0  # Steps of work shed because the service was under load
+    shed_work: List[str] = []  # Degradation steps that were applied to this job
+    function_metrics: Dict[str, List[Any]] = {}  # Per-function metrics table, one list per column
+    metrics_summary: Dict[str, Any] = {}  # PR-level distributions of the function metrics
+    published: Optional[Dict[str, int]] = None  # Review comments created, unchanged and removed
+    ai_usage: Optional[Dict[str, Any]] = None  # AI tokens spent and chunks skipped by the job token budget
+    shards: int = 0  # Jobs the PR was split into across workers (0 when one job analyzed it)
+
+
+class RescoreRequest(BaseModel):
+    """Request model for re-scoring past analyses with new weights."""
+    weights: Dict[str, float]  # Weight of each score category
+    repo: Optional[str] = None
+    author: Optional[str] = None
+    since: Optional[str] = None  # ISO 8601 date or datetime
+    until: Optional[str] = None
+    limit: int = 100  # Analyses listed individually in the response
\ No newline at end of file
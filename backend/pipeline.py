@@ -0,0 +1,743 @@
+import importlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Any, Optional, Tuple
+from urllib.parse import urlparse
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from dotenv import load_dotenv
+
+from models.feedback_model import AnalyzeRequest, AnalyzeResponse, FileIssues, Issue, Score, CategoryScore
+from services.github_service import GitHubService
+from services.gitlab_service import GitLabService
+from services.history_store import HistoryStore
+from services.review_publisher import publish_review
+from services.traffic_capture import TrafficRecorder
+from analysis.style_checker import StyleChecker
+from analysis.complexity_checker import ComplexityChecker
+from analysis.bug_checker import BugChecker
+from analysis.ai_feedback import AIFeedbackGenerator, FileChange
+from analysis.baseline import BaselineFilter, BaselineIndex
+from analysis.node_cache import NodeCache
+from analysis.metrics import FunctionMetrics
+from utils.helpers import calculate_score
+from utils.content_policy import ContentPolicy
+from utils.blob_cache import BlobCache
+from utils.time_budget import TimeBudget
+from utils.file_stream import DEFAULT_STREAM_WINDOW, prefetch
+from utils.load_monitor import LoadMonitor, shed_file, shed_steps
+
+# Load environment variables
+load_dotenv()
+
+# Base-branch issues shared by every job targeting the same base commit
+baseline_index = BaselineIndex()
+
+# Checker results per top-level function and class, reused by every job of this process
+node_cache = NodeCache()
+
+# Recent job latencies of this process, used to shed work under load
+load_monitor = LoadMonitor()
+
+# Completed analyses are persisted for trends and re-scoring unless HISTORY_ENABLED=false
+history_store = HistoryStore() if os.getenv("HISTORY_ENABLED", "true") == "true" else None
+
+# Repositories served from local bare mirrors instead of the provider API
+MIRROR_REPOS = {
+    repo.strip() for repo in os.getenv("MIRROR_REPOS", "").split(",") if repo.strip()
+}
+_mirror_service = None
+
+# Directory where every job's provider and model traffic is recorded as a replayable fixture archive
+TRAFFIC_RECORD_DIR = os.getenv("TRAFFIC_RECORD_DIR", "")
+
+# Provider service class used for every server instead of the real ones ('package.module:ClassName'),
+# e.g. the configurable-latency fake of the load tests
+GIT_SERVICE_BACKEND = os.getenv("GIT_SERVICE_BACKEND", "")
+
+# Lists the changed files of jobs whose AI review is ranked by how much each file changed
+_file_list_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="file-list")
+
+# Files fetched ahead of the one being analyzed
+STREAM_WINDOW = int(os.getenv("ANALYSIS_STREAM_WINDOW", DEFAULT_STREAM_WINDOW))
+
+# Python files above which a queued job is split into shards that several workers analyze (0 never splits)
+DEFAULT_SHARD_THRESHOLD = 200
+SHARD_THRESHOLD = int(os.getenv("SHARD_THRESHOLD", DEFAULT_SHARD_THRESHOLD))
+
+# Python files analyzed by each shard
+DEFAULT_SHARD_SIZE = 100
+SHARD_SIZE = int(os.getenv("SHARD_SIZE", DEFAULT_SHARD_SIZE))
+
+# Files that changed only cosmetically get the style checker alone, and unchanged ones no analysis
+TRIAGE_ENABLED = os.getenv("TRIAGE_ENABLED", "true") == "true"
+
+# Checker that reports each issue type, to rebuild checker results from shard responses
+ISSUE_CHECKERS = {'style': 'style', 'complexity': 'complexity', 'bug': 'bug', 'ai-suggestion': 'ai'}
+
+# Analyzed for requests that name no pull request
+SAMPLE_FILES = {
+    "src/main.py": "def calculate_sum(a, b):\n    return a + b\n\ndef main():\n    print('Hello world')\n    result = calculate_sum(5, 10)\n    print(f'Sum: {result}')\n\nif __name__ == '__main__':\n    main()",
+    "src/utils.py": "def format_string(text):\n    return text.strip().lower()\n\ndef is_valid_email(email):\n    # Very basic validation\n    return '@' in email"
+}
+
+
+# Initialize services
+def get_git_service(server: str, repo: str = None, blob_cache: BlobCache = None):
+    """Get the appropriate git service based on the server type."""
+    global _mirror_service
+    if GIT_SERVICE_BACKEND:
+        module_name, _, class_name = GIT_SERVICE_BACKEND.partition(":")
+        return getattr(importlib.import_module(module_name), class_name)(blob_cache=blob_cache)
+    if repo in MIRROR_REPOS:
+        # Shared across jobs so mirrors and cat-file processes stay warm; the provider
+        # API is only asked for the branch each PR targets
+        if _mirror_service is None:
+            from services.mirror_service import MirrorService
+            _mirror_service = MirrorService(
+                base_branch_lookup=lambda repo_name, pr_number: get_git_service(server).get_base_branch(
+                    repo_name, pr_number
+                )
+            )
+        return _mirror_service
+    if server.lower() == "github":
+        return GitHubService(blob_cache=blob_cache)
+    elif server.lower() == "gitlab":
+        return GitLabService(blob_cache=blob_cache)
+    elif server.lower() == "bitbucket":
+        # Import here to avoid circular imports
+        from services.bitbucket_service import BitbucketService
+        return BitbucketService(blob_cache=blob_cache)
+    else:
+        raise HTTPException(status_code=400, detail=f"Unsupported server: {server}")
+
+
+# Helper function to parse PR URL
+def parse_pr_url(url: str):
+    """Parse PR URL to extract repo, PR number, and server."""
+    try:
+        parsed_url = urlparse(url)
+        path_parts = parsed_url.path.strip('/').split('/')
+        hostname = parsed_url.netloc.lower()
+        
+        # URL patterns for different Git services
+        patterns = {
+            'github.com': {
+                'server': 'github',
+                'path_index': 2,
+                'path_value': 'pull',
+                'pr_index': 3,
+                'min_length': 4,
+                'repo_format': lambda p: f"{p[0]}/{p[1]}"
+            },
+            'gitlab.com': {
+                'server': 'gitlab',
+                'path_index': 3,
+                'path_value': 'merge_requests',
+                'pr_index': 4,
+                'min_length': 5,
+                'repo_format': lambda p: f"{p[0]}/{p[1]}"
+            },
+            'bitbucket.org': {
+                'server': 'bitbucket',
+                'path_index': 2,
+                'path_value': 'pull-requests',
+                'pr_index': 3,
+                'min_length': 4,
+                'repo_format': lambda p: f"{p[0]}/{p[1]}"
+            }
+        }
+        
+        # Find matching pattern
+        for domain, pattern in patterns.items():
+            if domain in hostname:
+                if (len(path_parts) >= pattern['min_length'] and 
+                    path_parts[pattern['path_index']] == pattern['path_value']):
+                    repo = pattern['repo_format'](path_parts)
+                    pr_number = int(path_parts[pattern['pr_index']])
+                    return repo, pr_number, pattern['server']
+                else:
+                    raise ValueError(f"Invalid {pattern['server']} PR URL format")
+        
+        # If no pattern matched
+        raise ValueError(f"Unsupported Git service: {hostname}")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to parse PR URL: {str(e)}")
+
+
+def iter_pr_files(git_service, repo: str, pr_number: int, content_policy: ContentPolicy,
+                  errors: List[str]) -> Iterator[Tuple[str, str]]:
+    """Stream the changed files of a pull request, ending the stream on fetch errors, which are added to ``errors``."""
+    try:
+        if hasattr(git_service, 'iter_pr_files_content'):
+            yield from git_service.iter_pr_files_content(repo, pr_number, content_policy)
+        else:
+            yield from git_service.get_pr_files_content(repo, pr_number, content_policy).items()
+    except Exception as e:
+        print(f"Error fetching PR content: {str(e)}")
+        errors.append(str(e))
+
+
+def iter_shard_files(git_service, shard: Dict[str, Any], content_policy: ContentPolicy,
+                     errors: List[str]) -> Iterator[Tuple[str, str]]:
+    """Stream the files of one shard from the pull request's head commit, ending the stream on fetch errors, which are added to ``errors``."""
+    file_paths = shard["files"]
+    try:
+        for start in range(0, len(file_paths), STREAM_WINDOW):
+            yield from git_service.get_files_content_at(
+                shard["head_repo"], file_paths[start:start + STREAM_WINDOW], shard["head_sha"], content_policy
+            ).items()
+    except Exception as e:
+        print(f"Error fetching shard {shard['index']} content: {str(e)}")
+        errors.append(str(e))
+
+
+def get_file_changes(git_service, repo: str, pr_number: int) -> Dict[str, FileChange]:
+    """Get how much each file of a pull request changed, or nothing if the files cannot be listed."""
+    if not hasattr(git_service, 'get_pr_files'):
+        return {}
+    try:
+        return {
+            file["filename"]: FileChange.from_pr_file(file)
+            for file in git_service.get_pr_files(repo, pr_number)
+        }
+    except Exception as e:
+        print(f"Error listing changed files of {repo}#{pr_number}: {str(e)}")
+        return {}
+
+
+def is_sample_request(request_dict: Dict[str, Any]) -> bool:
+    """Check whether a request names no pull request, so that the sample files are analyzed."""
+    if request_dict.get("pr_url"):
+        return False
+    return not request_dict.get("repo") or request_dict.get("pr_number") is None
+
+
+def resolve_request(request_dict: Dict[str, Any]) -> AnalyzeRequest:
+    """Build a request, taking repository, PR number and server from its URL or falling back to the sample PR."""
+    request = AnalyzeRequest(**request_dict)
+    if request.pr_url:
+        repo, pr_number, server = parse_pr_url(request.pr_url)
+        request.repo = repo
+        request.pr_number = pr_number
+        request.server = server
+    if not request.repo or request.pr_number is None or not request.server:
+        request.repo = request.repo or "sample/repo"
+        request.pr_number = request.pr_number if request.pr_number is not None else 1
+        request.server = request.server or "github"
+    return request
+
+
+def plan_shards(request_dict: Dict[str, Any], git_service=None) -> List[Dict[str, Any]]:
+    """Split the Python files of a large pull request into shards that separate jobs analyze.
+    
+    Shards read their files at the head commit the PR has now, so every
+    shard analyzes the same version of the PR. Providers that report how
+    many files a PR changes are asked that first, so smaller PRs are not
+    listed twice.
+    
+    Args:
+        request_dict: AnalyzeRequest fields
+        git_service: Optional provider service shared with other jobs
+    
+    Returns:
+        One dictionary per shard with its 'files', 'index', 'count',
+        'head_repo' and 'head_sha', or an empty list if the PR changes at most
+        SHARD_THRESHOLD Python files or its files cannot be listed
+    """
+    if SHARD_THRESHOLD <= 0:
+        return []
+    request = resolve_request(request_dict)
+    if git_service is None:
+        git_service = get_git_service(request.server, request.repo)
+    if not hasattr(git_service, 'get_pr_files') or not hasattr(git_service, 'get_pr_head'):
+        return []
+    try:
+        if hasattr(git_service, 'get_changed_file_count'):
+            changed_files = git_service.get_changed_file_count(request.repo, request.pr_number)
+            if changed_files is not None and changed_files <= SHARD_THRESHOLD:
+                return []
+        file_paths = [
+            file["filename"] for file in git_service.get_pr_files(request.repo, request.pr_number)
+            if file["status"] != "removed" and file["filename"].endswith('.py')
+        ]
+        if len(file_paths) <= SHARD_THRESHOLD:
+            return []
+        head_repo, head_sha = git_service.get_pr_head(request.repo, request.pr_number)
+    except Exception as e:
+        print(f"Error listing files of {request.repo}#{request.pr_number}, analyzing it in one job: {e}")
+        return []
+    
+    groups = [file_paths[start:start + SHARD_SIZE] for start in range(0, len(file_paths), SHARD_SIZE)]
+    return [
+        {"files": files, "index": index, "count": len(groups), "head_repo": head_repo, "head_sha": head_sha}
+        for index, files in enumerate(groups)
+    ]
+
+
+def create_checkers() -> Dict[str, Any]:
+    """Create the analysis checkers used by a job (or shared by a batch)."""
+    return {
+        'style': StyleChecker(),
+        'complexity': ComplexityChecker(cache=node_cache),
+        'bug': BugChecker(cache=node_cache),
+        'ai': AIFeedbackGenerator(cache=node_cache)
+    }
+
+
+def score_results(checker_results: Dict[str, Dict[str, List[Issue]]], metrics: FunctionMetrics,
+                  complexity_checker: ComplexityChecker) -> Tuple[List[FileIssues], Score, Dict[str, int], List[Tuple[str, str, Issue]]]:
+    """Group the issues of every checker by file and score them.
+    
+    Args:
+        checker_results: Dictionary mapping checker names to the issues of each file
+        metrics: Function metrics of every analyzed file
+        complexity_checker: Checker computing the complexity penalty
+    
+    Returns:
+        Tuple of (feedback per file, score, score penalties, and the file
+        path, score category and issue of every reported issue)
+    """
+    all_issues: Dict[str, List[Issue]] = {}
+    issue_counts = {
+        'style': 0,
+        'performance': 0,
+        'security': 0,
+        'complexity': 0,
+        'best_practices': 0,
+        'documentation': 0
+    }
+    # (file path, score category, issue) of every reported issue, for the history store
+    categorized_issues: List[Tuple[str, str, Issue]] = []
+    for file_path, issues in checker_results.get('style', {}).items():
+        all_issues.setdefault(file_path, []).extend(issues)
+        issue_counts['style'] += len(issues)
+        categorized_issues.extend((file_path, 'style', issue) for issue in issues)
+    for file_path, issues in checker_results.get('complexity', {}).items():
+        all_issues.setdefault(file_path, []).extend(issues)
+        issue_counts['complexity'] += len(issues)
+        categorized_issues.extend((file_path, 'complexity', issue) for issue in issues)
+    for file_path, issues in checker_results.get('bug', {}).items():
+        all_issues.setdefault(file_path, []).extend(issues)
+        for issue in issues:
+            category = 'security' if 'security' in issue.msg.lower() else 'performance'
+            issue_counts[category] += 1
+            categorized_issues.append((file_path, category, issue))
+    for file_path, issues in checker_results.get('ai', {}).items():
+        all_issues.setdefault(file_path, []).extend(issues)
+        for issue in issues:
+            category = 'documentation' if 'documentation' in issue.msg.lower() else 'best_practices'
+            issue_counts[category] += 1
+            categorized_issues.append((file_path, category, issue))
+    # Complexity is scored from the metrics of the functions still reported
+    reported_lines = {
+        path: {issue.line for issue in issues}
+        for path, issues in checker_results.get('complexity', {}).items()
+    }
+    penalties = {'complexity': complexity_checker.calculate_complexity_penalty(metrics, metrics.at_lines(reported_lines))}
+    score_result = calculate_score(issue_counts, penalties=penalties)
+    category_scores = CategoryScore(**score_result["categories"])
+    score = Score(overall=score_result["overall"], categories=category_scores)
+    feedback = [
+        FileIssues(file=file_path, issues=issues)
+        for file_path, issues in all_issues.items()
+        if issues
+    ]
+    return feedback, score, penalties, categorized_issues
+
+
+def publish_results(request: AnalyzeRequest, git_service, feedback: List[FileIssues], score: Score,
+                    partial: bool) -> Optional[Dict[str, int]]:
+    """Post the findings to the pull request as one review, returning None if publishing failed."""
+    # Mirrors only serve content; reviews always go through the provider API
+    publisher = git_service if hasattr(git_service, 'submit_review') else get_git_service(request.server)
+    try:
+        return publish_review(publisher, request.repo, request.pr_number, feedback, score, remove_stale=not partial)
+    except Exception as e:
+        print(f"Error publishing review for {request.repo}#{request.pr_number}: {e}")
+        return None
+
+
+def record_history(request: AnalyzeRequest, git_service, encoded: Dict[str, Any],
+                   categorized_issues: List[Tuple[str, str, Issue]], penalties: Dict[str, int]) -> None:
+    """Persist a completed analysis in the history store, if it is enabled."""
+    if history_store is None:
+        return
+    try:
+        author = request.author
+        if author is None and hasattr(git_service, 'get_pr_author'):
+            author = git_service.get_pr_author(request.repo, request.pr_number)
+        # Keyed by head commit, so analyzing the same commit again replaces the earlier analysis
+        head_sha = None
+        if hasattr(git_service, 'get_pr_head'):
+            _, head_sha = git_service.get_pr_head(request.repo, request.pr_number)
+        history_store.record(encoded, categorized_issues, penalties, author, head_sha)
+    except Exception as e:
+        print(f"Error recording history for {request.repo}#{request.pr_number}: {e}")
+
+
+def analyze_pull_request(request_dict: Dict[str, Any], git_service=None, checkers=None,
+                         budget: TimeBudget = None, waiting_jobs: int = 0,
+                         shard: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Fetch and analyze one pull request.
+    
+    Runs in the API process (in-process mode) or in a queue worker process.
+    Files are streamed from the provider through every checker one at a
+    time while the next ones are fetched, so memory stays flat however many
+    files the PR changes. Stages and files that do not fit in the time budget are left out and
+    the response is marked as partial. Under load (DEGRADE_MODE=adaptive)
+    work is shed in the order of ``DEGRADATION_STEPS``. With
+    TRAFFIC_RECORD_DIR set, the job's provider and model traffic is saved
+    there as a fixture archive (see ``services.traffic_capture``).
+    
+    Args:
+        request_dict: AnalyzeRequest fields
+        git_service: Optional provider service shared with other jobs
+        checkers: Optional checkers shared with other jobs (see ``create_checkers``)
+        budget: Optional time budget, kept by the caller to cancel the job
+        waiting_jobs: Jobs queued behind this one, used to pick the degradation level
+        shard: Optional shard of the PR to analyze (see ``plan_shards``); shard
+            results are neither published nor recorded until
+            ``merge_shard_results`` combines them
+        
+    Returns:
+        JSON-serializable AnalyzeResponse
+        
+    Raises:
+        JobCancelled: If the job was cancelled through ``budget``
+        Exception: If no file of the pull request could be fetched
+    """
+    if not TRAFFIC_RECORD_DIR or is_sample_request(request_dict):
+        return _analyze_pull_request(request_dict, git_service, checkers, budget, waiting_jobs, shard)
+    request = resolve_request(request_dict)
+    recorder = TrafficRecorder(request_dict, f"{request.server}-{request.repo}-{request.pr_number}", shard)
+    try:
+        return _analyze_pull_request(request_dict, git_service, checkers, budget, waiting_jobs, shard, recorder)
+    finally:
+        # Failed jobs are recorded too, to replay the failure
+        recorder.save(TRAFFIC_RECORD_DIR)
+
+
+def _analyze_pull_request(request_dict: Dict[str, Any], git_service, checkers, budget: Optional[TimeBudget],
+                          waiting_jobs: int, shard: Optional[Dict[str, Any]],
+                          recorder: Optional[TrafficRecorder] = None) -> Dict[str, Any]:
+    """Analyze one pull request (see ``analyze_pull_request``), recording its traffic with ``recorder``."""
+    if budget is None:
+        budget = TimeBudget()
+    degradation_level = load_monitor.level(waiting_jobs)
+    shed = shed_steps(degradation_level)
+    shed_work = []
+    request = resolve_request(request_dict)
+    if git_service is None:
+        git_service = get_git_service(request.server, request.repo)
+    if recorder is not None:
+        git_service = recorder.wrap_git_service(git_service)
+    content_policy = ContentPolicy()
+    if checkers is None:
+        checkers = create_checkers()
+    style_checker = checkers['style']
+    complexity_checker = checkers['complexity']
+    bug_checker = checkers['bug']
+    ai_feedback_generator = checkers['ai']
+    enabled_checks = getattr(request, 'enabled_checks', {
+        'style': True,
+        'performance': True,
+        'security': True,
+        'complexity': True,
+        'best_practices': True,
+        'documentation': True
+    })
+    run_style = enabled_checks.get('style', True)
+    run_complexity = enabled_checks.get('complexity', True)
+    run_bug = enabled_checks.get('security', True) or enabled_checks.get('performance', True)
+    ai_packer = None
+    if ai_feedback_generator.enabled and 'ai' in shed:
+        shed_work.append('ai')
+    elif ai_feedback_generator.enabled:
+        ai_packer = ai_feedback_generator.packer(budget)
+        if shard is not None and ai_packer.token_budget:
+            # The PR's AI tokens are shared by its shards
+            ai_packer.token_budget = max(1, ai_packer.token_budget // shard["count"])
+        if recorder is not None:
+            ai_packer.backend = recorder.wrap_model_backend(ai_packer.backend)
+    using_sample_content = is_sample_request(request_dict)
+    file_changes = None
+    if ai_packer is not None and ai_packer.token_budget and not using_sample_content:
+        # Listed alongside the content stream, to rank the chunks spending the job's AI tokens
+        file_changes = _file_list_executor.submit(get_file_changes, git_service, request.repo, request.pr_number)
+    # Under load, style is only reported on changed lines instead of being diffed against the base
+    changed_lines_only = ('style',) if 'style_unchanged' in shed and run_style else ()
+    compare_to_base = request.new_issues_only and not using_sample_content
+    triage_files = TRIAGE_ENABLED and not using_sample_content
+    baseline_filter = None
+    checker_results: Dict[str, Dict[str, List[Issue]]] = {}
+    file_metrics: Dict[str, FunctionMetrics] = {}
+    skipped_files: Dict[str, str] = {}
+    triaged_files: Dict[str, str] = {}
+    fetch_errors: List[str] = []
+    received = 0
+    admitted = 0
+    # Files flow from the fetcher through every checker one at a time; at most
+    # STREAM_WINDOW fetched files wait while one is analyzed, and each file's
+    # content is released as soon as its last checker is done with it
+    if using_sample_content:
+        pr_files = iter(SAMPLE_FILES.items())
+    elif shard is not None:
+        pr_files = iter_shard_files(git_service, shard, content_policy, fetch_errors)
+    else:
+        pr_files = iter_pr_files(git_service, request.repo, request.pr_number, content_policy, fetch_errors)
+    stream = prefetch(pr_files, STREAM_WINDOW)
+    try:
+        while True:
+            waited = time.monotonic()
+            file = next(stream, None)
+            budget.add_stage_seconds('fetch', time.monotonic() - waited)
+            if file is None:
+                break
+            received += 1
+            file_path, content = file
+            if budget.job_remaining() <= 0:
+                # Stop fetching; the rest of the PR could not be analyzed in time anyway
+                budget.skip_files('fetch', [file_path])
+                break
+            
+            # Checkers only analyze Python files
+            if not file_path.endswith('.py'):
+                content_policy.release(content)
+                continue
+            if 'low_priority_files' in shed and shed_file(file_path, admitted, load_monitor.max_files):
+                skipped_files[file_path] = "shed under load"
+                content_policy.release(content)
+                continue
+            admitted += 1
+            
+            if (compare_to_base or triage_files) and baseline_filter is None:
+                try:
+                    baseline_filter = BaselineFilter(
+                        baseline_index, git_service, request.repo, request.pr_number, checkers, changed_lines_only,
+                        compare_to_base
+                    )
+                except Exception as e:
+                    # Without a base, every file is analyzed in full and every issue reported
+                    print(f"Error resolving the base of {request.repo}#{request.pr_number}: {e}")
+                    compare_to_base = triage_files = False
+            
+            # Files whose code is unchanged from the base only need the style checker, or nothing at all
+            change_kind = 'semantic'
+            if triage_files:
+                try:
+                    change_kind = budget.run_file(
+                        'baseline', content, file_path,
+                        lambda content, path: baseline_filter.classify_file(path, content)
+                    ) or 'semantic'
+                except Exception as e:
+                    print(f"Error triaging {file_path} against base for {request.repo}#{request.pr_number}: {e}")
+            if change_kind != 'semantic':
+                triaged_files[file_path] = change_kind
+            if change_kind == 'no-op':
+                content_policy.release(content)
+                continue
+            
+            file_results: Dict[str, List[Issue]] = {}
+            if run_style:
+                file_results['style'] = budget.run_file(
+                    'style', content, file_path,
+                    lambda content, path: style_checker.check_file(content, path, budget)
+                )
+            if run_complexity and change_kind == 'semantic':
+                metrics = budget.run_file(
+                    'complexity', content, file_path,
+                    lambda content, path: complexity_checker.measure_file(content, path, budget)
+                )
+                if metrics is not None:
+                    file_metrics[file_path] = metrics
+                    file_results['complexity'] = complexity_checker.issues_from_metrics(metrics)
+            if run_bug and change_kind == 'semantic':
+                file_results['bug'] = budget.run_file(
+                    'bug', content, file_path,
+                    lambda content, path: bug_checker.check_file(content, path, budget)
+                )
+            file_results = {name: issues for name, issues in file_results.items() if issues is not None}
+            
+            if compare_to_base:
+                try:
+                    budget.run_file(
+                        'baseline', content, file_path,
+                        lambda content, path: baseline_filter.filter_file(path, content, file_results)
+                    )
+                except Exception as e:
+                    # Fall back to reporting every issue of the file
+                    print(f"Error comparing {file_path} against base for {request.repo}#{request.pr_number}: {e}")
+            
+            if ai_packer is not None and change_kind == 'semantic':
+                # Chunks are packed with those of other files into shared requests, ranked
+                # by how much of them changed and by the issues the other checkers found
+                change = None
+                if file_changes is not None and not using_sample_content:
+                    change = file_changes.result().get(file_path)
+                budget.run_file(
+                    'ai', content, file_path,
+                    lambda content, path: ai_packer.add_file(content, path, change, file_results)
+                )
+            
+            for name, issues in file_results.items():
+                checker_results.setdefault(name, {})[file_path] = issues
+            content_policy.release(content)
+    finally:
+        stream.close()
+    if fetch_errors and not received:
+        raise Exception(f"Could not fetch the files of {request.repo}#{request.pr_number}: {fetch_errors[0]}")
+    if fetch_errors:
+        # The files after the failed fetch were not analyzed
+        budget.skipped_stages.append('fetch')
+    if ai_packer is not None:
+        # Send the chunks still waiting for a full request
+        flush_started = time.monotonic()
+        ai_packer.flush()
+        budget.add_stage_seconds('ai', time.monotonic() - flush_started)
+        budget.skip_files('ai', ai_packer.unreviewed)
+        checker_results['ai'] = ai_packer.results
+    skipped_files.update(content_policy.skipped)
+    if content_policy.skipped:
+        print(f"Skipped {len(content_policy.skipped)} files for {request.repo}#{request.pr_number}")
+    compare_to_base = compare_to_base and baseline_filter is not None
+    base_sha = baseline_filter.base_sha if compare_to_base else None
+    preexisting_issues = baseline_filter.removed if compare_to_base else 0
+    if changed_lines_only and compare_to_base:
+        shed_work.append('style_unchanged')
+    metrics = FunctionMetrics.concat(file_metrics)
+    feedback, score, penalties, categorized_issues = score_results(checker_results, metrics, complexity_checker)
+    published = None
+    if request.publish and not using_sample_content and shard is None and budget.start_stage('publish'):
+        published = publish_results(request, git_service, feedback, score, budget.partial)
+        budget.end_stage('publish')
+    result = AnalyzeResponse(
+        repo=request.repo,
+        pr_number=request.pr_number,
+        server=request.server,
+        feedback=feedback,
+        score=score,
+        skipped_files=skipped_files,
+        triaged_files=triaged_files,
+        base_sha=base_sha,
+        preexisting_issues=preexisting_issues,
+        status="partial" if budget.partial else "complete",
+        skipped_stages=budget.skipped_stages,
+        timed_out_files=budget.skipped_files,
+        stage_seconds=budget.stage_seconds,
+        degradation_level=degradation_level,
+        function_metrics=metrics.to_columns(),
+        metrics_summary=metrics.summary(),
+        shed_work=shed_work,
+        published=published,
+        ai_usage=ai_packer.usage() if ai_packer is not None else None
+    )
+    load_monitor.record(budget.stage_seconds)
+    # Use jsonable_encoder to ensure all objects are serializable
+    encoded = jsonable_encoder(result)
+    if not using_sample_content and shard is None:
+        record_history(request, git_service, encoded, categorized_issues, penalties)
+    return encoded
+
+
+def _merge_ai_usage(usages: List[Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """Add up the AI token usage of several shards."""
+    usages = [usage for usage in usages if usage]
+    if not usages:
+        return None
+    merged: Dict[str, Any] = {"skipped": {}}
+    for usage in usages:
+        for key, value in usage.items():
+            if key == "skipped":
+                merged["skipped"].update(value)
+            elif value is not None:
+                merged[key] = merged.get(key, 0) + value
+            else:
+                merged.setdefault(key, None)
+    return merged
+
+
+def merge_shard_results(request_dict: Dict[str, Any], shard_results: List[Dict[str, Any]],
+                        git_service=None, checkers=None, budget: TimeBudget = None) -> Dict[str, Any]:
+    """Combine the responses of a pull request's shards into the response of the whole PR.
+    
+    Issues are scored again over all shards, so the score is the one a
+    single job would have given; the combined review is then published and
+    recorded in the history store like that of any other job.
+    
+    Args:
+        request_dict: AnalyzeRequest fields of the sharded job
+        shard_results: JSON-serializable AnalyzeResponse of every shard
+        git_service: Optional provider service shared with other jobs
+        checkers: Optional checkers shared with other jobs (see ``create_checkers``)
+        budget: Optional time budget, kept by the caller to cancel the merge
+    
+    Returns:
+        JSON-serializable AnalyzeResponse
+    
+    Raises:
+        JobCancelled: If the job was cancelled through ``budget``
+    """
+    if budget is None:
+        budget = TimeBudget()
+    request = resolve_request(request_dict)
+    if git_service is None:
+        git_service = get_git_service(request.server, request.repo)
+    complexity_checker = checkers['complexity'] if checkers is not None else ComplexityChecker()
+    
+    checker_results: Dict[str, Dict[str, List[Issue]]] = {}
+    skipped_files: Dict[str, str] = {}
+    triaged_files: Dict[str, str] = {}
+    timed_out_files: Dict[str, List[str]] = {}
+    stage_seconds: Dict[str, float] = {}
+    skipped_stages: List[str] = []
+    shed_work: List[str] = []
+    for shard_result in shard_results:
+        for file_issues in shard_result["feedback"]:
+            for issue in file_issues["issues"]:
+                file_results = checker_results.setdefault(ISSUE_CHECKERS.get(issue["type"], 'ai'), {})
+                file_results.setdefault(file_issues["file_path"], []).append(Issue(**issue))
+        skipped_files.update(shard_result["skipped_files"])
+        triaged_files.update(shard_result["triaged_files"])
+        for stage, files in shard_result["timed_out_files"].items():
+            timed_out_files.setdefault(stage, []).extend(files)
+        for stage, seconds in shard_result["stage_seconds"].items():
+            stage_seconds[stage] = stage_seconds.get(stage, 0.0) + seconds
+        skipped_stages.extend(stage for stage in shard_result["skipped_stages"] if stage not in skipped_stages)
+        shed_work.extend(step for step in shard_result["shed_work"] if step not in shed_work)
+    
+    metrics = FunctionMetrics.merge([
+        FunctionMetrics.from_columns(shard_result["function_metrics"]) for shard_result in shard_results
+    ])
+    feedback, score, penalties, categorized_issues = score_results(checker_results, metrics, complexity_checker)
+    partial = any(shard_result["status"] == "partial" for shard_result in shard_results)
+    budget.check_cancelled()
+    published = publish_results(request, git_service, feedback, score, partial) if request.publish else None
+    result = AnalyzeResponse(
+        repo=request.repo,
+        pr_number=request.pr_number,
+        server=request.server,
+        feedback=feedback,
+        score=score,
+        skipped_files=skipped_files,
+        triaged_files=triaged_files,
+        base_sha=next((shard_result["base_sha"] for shard_result in shard_results if shard_result["base_sha"]), None),
+        preexisting_issues=sum(shard_result["preexisting_issues"] for shard_result in shard_results),
+        status="partial" if partial else "complete",
+        skipped_stages=skipped_stages,
+        timed_out_files=timed_out_files,
+        stage_seconds=stage_seconds,
+        degradation_level=max((shard_result["degradation_level"] for shard_result in shard_results), default=0),
+        function_metrics=metrics.to_columns(),
+        metrics_summary=metrics.summary(),
+        shed_work=shed_work,
+        published=published,
+        ai_usage=_merge_ai_usage([shard_result["ai_usage"] for shard_result in shard_results]),
+        shards=len(shard_results)
+    )
+    encoded = jsonable_encoder(result)
+    budget.check_cancelled()
+    record_history(request, git_service, encoded, categorized_issues, penalties)
+    return encoded
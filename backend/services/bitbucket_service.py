@@ -1,58 +1,261 @@
 import os
-import requests
-from typing import Dict, List, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+from urllib.parse import quote
+
+from services.review_publisher import ReviewPlan, parse_marker
+from utils.blob_cache import BlobCache
+from utils.content_policy import ContentPolicy, STREAM_CHUNK_BYTES
+from utils.diff_positions import FileDiff, iter_text_lines, iter_unified_diff
+from utils.file_stream import fetch_concurrently
+from utils.helpers import create_http_session
+
+# Maximum number of file contents fetched at the same time
+DEFAULT_MAX_CONCURRENCY = 8
+
 
 class BitbucketService:
     """Service for interacting with Bitbucket API."""
     
-    def __init__(self):
-        self.base_url = "https://api.bitbucket.org/2.0"
+    def __init__(self, base_url: Optional[str] = None, max_concurrency: Optional[int] = None,
+                 blob_cache: Optional[BlobCache] = None):
+        """Initialize the Bitbucket service with a pooled HTTP session.
+        
+        Args:
+            base_url: API root URL (defaults to BITBUCKET_API_URL or Bitbucket Cloud)
+            max_concurrency: Maximum parallel content fetches (defaults to BITBUCKET_MAX_CONCURRENCY)
+            blob_cache: Optional cache of file contents shared between the PRs of a batch
+        """
+        self.base_url = (base_url or os.getenv("BITBUCKET_API_URL", "https://api.bitbucket.org/2.0")).rstrip("/")
         self.token = os.getenv("BITBUCKET_TOKEN", "")
         self.headers = {
-            "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json"
         }
+        if self.token:
+            self.headers["Authorization"] = f"Bearer {self.token}"
+        
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv("BITBUCKET_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+        self.max_concurrency = max(1, max_concurrency)
+        self.blob_cache = blob_cache
+        
+        # One connection pool shared by every request, sized for the content fetches
+        self.session = create_http_session(self.headers, self.max_concurrency)
     
     def get_pull_request(self, repo: str, pr_number: int) -> Dict[str, Any]:
         """Get pull request details from Bitbucket."""
         url = f"{self.base_url}/repositories/{repo}/pullrequests/{pr_number}"
-        response = requests.get(url, headers=self.headers)
+        response = self.session.get(url)
         
         if response.status_code != 200:
             raise Exception(f"Failed to get PR details: {response.status_code} - {response.text}")
         
         return response.json()
     
-    def get_pull_request_files(self, repo: str, pr_number: int) -> List[Dict[str, Any]]:
-        """Get files changed in a pull request."""
+    def _paginate(self, url: str) -> Iterator[Dict[str, Any]]:
+        """Yield the values of a paginated Bitbucket collection, following 'next' links."""
+        while url:
+            response = self.session.get(url)
+            
+            if response.status_code != 200:
+                raise Exception(f"Failed to get {url}: {response.status_code} - {response.text}")
+            
+            page = response.json()
+            yield from page.get("values", [])
+            url = page.get("next")
+    
+    def iter_pull_request_files(self, repo: str, pr_number: int) -> Iterator[Dict[str, Any]]:
+        """Stream files changed in a pull request, one diffstat page at a time."""
         url = f"{self.base_url}/repositories/{repo}/pullrequests/{pr_number}/diffstat"
-        response = requests.get(url, headers=self.headers)
-        
-        if response.status_code != 200:
-            raise Exception(f"Failed to get PR files: {response.status_code} - {response.text}")
         
-        files = []
-        for file_entry in response.json().get("values", []):
-            files.append({
-                "filename": file_entry.get("new", {}).get("path", ""),
+        for file_entry in self._paginate(url):
+            # Removed files only have an 'old' side
+            path_info = file_entry.get("new") or file_entry.get("old") or {}
+            yield {
+                "filename": path_info.get("path", ""),
                 "status": self._map_status(file_entry.get("status", "")),
                 "additions": file_entry.get("lines_added", 0),
                 "deletions": file_entry.get("lines_removed", 0),
                 "changes": file_entry.get("lines_added", 0) + file_entry.get("lines_removed", 0)
-            })
-        
-        return files
+            }
+    
+    def iter_pr_diff(self, repo: str, pr_number: int) -> Iterator[FileDiff]:
+        """Stream and parse the diff of a pull request, one file at a time."""
+        url = f"{self.base_url}/repositories/{repo}/pullrequests/{pr_number}/diff"
+        with self.session.get(url, stream=True) as response:
+            if response.status_code != 200:
+                raise Exception(f"Failed to get PR diff: {response.status_code} - {response.text}")
+            
+            response.encoding = response.encoding or "utf-8"
+            yield from iter_unified_diff(
+                iter_text_lines(response.iter_content(STREAM_CHUNK_BYTES, decode_unicode=True))
+            )
+    
+    def get_pull_request_files(self, repo: str, pr_number: int) -> List[Dict[str, Any]]:
+        """Get files changed in a pull request."""
+        return list(self.iter_pull_request_files(repo, pr_number))
+    
+    def get_pr_files(self, repo: str, pr_number: int) -> List[Dict[str, Any]]:
+        """Get files changed in a pull request (provider-neutral name)."""
+        return self.get_pull_request_files(repo, pr_number)
     
     def get_file_content(self, repo: str, file_path: str, ref: str) -> Optional[str]:
-        """Get file content from Bitbucket."""
-        url = f"{self.base_url}/repositories/{repo}/src/{ref}/{file_path}"
-        response = requests.get(url, headers=self.headers)
+        """Get file content from Bitbucket, or None if the file does not exist at the reference."""
+        url = f"{self.base_url}/repositories/{repo}/src/{ref}/{quote(file_path)}"
+        response = self.session.get(url)
         
-        if response.status_code != 200:
+        if response.status_code == 404:
             return None
+        if response.status_code != 200:
+            raise Exception(f"Failed to get {file_path}@{ref}: {response.status_code} - {response.text}")
         
         return response.text
     
+    def read_file_content(self, repo: str, file_path: str, ref: str,
+                          content_policy: ContentPolicy) -> Optional[str]:
+        """Stream file content from Bitbucket through a content policy.
+        
+        Raises:
+            FileNotFoundError: If the file does not exist at the reference
+        """
+        url = f"{self.base_url}/repositories/{repo}/src/{ref}/{quote(file_path)}"
+        with self.session.get(url, stream=True) as response:
+            if response.status_code == 404:
+                raise FileNotFoundError(f"{file_path} does not exist at {ref}")
+            if response.status_code != 200:
+                raise Exception(f"Failed to get {file_path}@{ref}: {response.status_code} - {response.text}")
+            
+            size = response.headers.get("Content-Length")
+            return content_policy.read(
+                file_path,
+                response.iter_content(STREAM_CHUNK_BYTES),
+                int(size) if size else None
+            )
+    
+    def _read_cached_file_content(self, repo: str, file_path: str, ref: str,
+                                  content_policy: ContentPolicy) -> Optional[str]:
+        """Read file content through the blob cache when one is configured."""
+        if self.blob_cache is None:
+            return self.read_file_content(repo, file_path, ref, content_policy)
+        return self.blob_cache.read_through(
+            (repo, ref, file_path), file_path, content_policy,
+            lambda: self.read_file_content(repo, file_path, ref, content_policy)
+        )
+    
+    def iter_pr_files_content(self, repo: str, pr_number: int,
+                              content_policy: Optional[ContentPolicy] = None) -> Iterator[Tuple[str, str]]:
+        """Stream the content of all files changed in a pull request.
+        
+        The PR's diff is streamed and each file's content is requested as
+        soon as its diff has been read, with at most ``max_concurrency``
+        fetches in flight; contents are yielded in the order they complete.
+        Added files are rebuilt from their diff instead of being fetched.
+        Files are listed from the diffstat instead when the diff is not available.
+        
+        Args:
+            repo: Repository name in format 'workspace/repo'
+            pr_number: Pull request number
+            content_policy: Size and memory policy (defaults to one built from the environment)
+        
+        Yields:
+            (file path, content) tuples
+        """
+        pr = self.get_pull_request(repo, pr_number)
+        source = pr.get("source", {})
+        ref = source.get("commit", {}).get("hash")
+        # PRs from forks keep their head commit in the source repository
+        source_repo = (source.get("repository") or {}).get("full_name") or repo
+        if content_policy is None:
+            content_policy = ContentPolicy()
+        
+        # Contents of listed added files, until their fetch picks them up
+        rebuilt: Dict[str, str] = {}
+        
+        def changed_paths() -> Iterator[str]:
+            listed = set()
+            try:
+                for file_diff in self.iter_pr_diff(repo, pr_number):
+                    if file_diff.deleted_file or not file_diff.path:
+                        continue
+                    content = file_diff.new_content() if file_diff.new_file else None
+                    if content is not None:
+                        rebuilt[file_diff.path] = content
+                    listed.add(file_diff.path)
+                    yield file_diff.path
+                return
+            except Exception as e:
+                print(f"Error reading diff of {repo}#{pr_number}, listing files from the diffstat: {e}")
+            for file in self.iter_pull_request_files(repo, pr_number):
+                if file["status"] != "removed" and file["filename"] and file["filename"] not in listed:
+                    yield file["filename"]
+        
+        def fetch(file_path: str) -> Optional[str]:
+            content = rebuilt.pop(file_path, None)
+            if content is None:
+                return self._read_cached_file_content(source_repo, file_path, ref, content_policy)
+            return content_policy.read(file_path, [content.encode('utf-8')])
+        
+        yield from fetch_concurrently(fetch, changed_paths(), self.max_concurrency)
+    
+    def get_pr_files_content(self, repo: str, pr_number: int,
+                             content_policy: Optional[ContentPolicy] = None) -> Dict[str, str]:
+        """Get content of all files changed in a pull request (see ``iter_pr_files_content``).
+        
+        Args:
+            repo: Repository name in format 'workspace/repo'
+            pr_number: Pull request number
+            content_policy: Size and memory policy (defaults to one built from the environment)
+        
+        Returns:
+            Dictionary mapping file paths to their content
+        """
+        return dict(self.iter_pr_files_content(repo, pr_number, content_policy))
+    
+    def get_base_sha(self, repo: str, pr_number: int) -> str:
+        """Get the commit SHA of a pull request's destination."""
+        return self.get_pull_request(repo, pr_number)["destination"]["commit"]["hash"]
+    
+    def get_base_branch(self, repo: str, pr_number: int) -> str:
+        """Get the name of a pull request's destination branch."""
+        return self.get_pull_request(repo, pr_number)["destination"]["branch"]["name"]
+    
+    def get_pr_head(self, repo: str, pr_number: int) -> Tuple[str, str]:
+        """Get the repository to read a pull request's files from and its head commit SHA."""
+        source = self.get_pull_request(repo, pr_number).get("source", {})
+        # PRs from forks keep their head commit in the source repository
+        source_repo = (source.get("repository") or {}).get("full_name") or repo
+        return source_repo, source["commit"]["hash"]
+    
+    def get_pr_author(self, repo: str, pr_number: int) -> str:
+        """Get the nickname of a pull request's author."""
+        author = self.get_pull_request(repo, pr_number)["author"]
+        return author.get("nickname") or author.get("display_name")
+    
+    def get_files_content_at(self, repo: str, file_paths: List[str], ref: str,
+                             content_policy: ContentPolicy) -> Dict[str, str]:
+        """Get content of several files at a reference, skipping files that do not exist there.
+        
+        Raises:
+            Exception: If a file could not be fetched for another reason than not existing
+        """
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = {
+                file_path: executor.submit(self._read_cached_file_content, repo, file_path, ref, content_policy)
+                for file_path in file_paths
+            }
+        
+        files_content = {}
+        for file_path, future in futures.items():
+            try:
+                content = future.result()
+            except FileNotFoundError:
+                # Files added by the PR do not exist at the base
+                continue
+            if content is not None:
+                files_content[file_path] = content
+        
+        return files_content
+    
     def _map_status(self, status: str) -> str:
         """Map Bitbucket file status to standardized status."""
         status_map = {
@@ -61,4 +264,56 @@ class BitbucketService:
             "modified": "modified",
             "renamed": "renamed"
         }
-        return status_map.get(status, "modified")
\ No newline at end of file
+        return status_map.get(status, "modified")
+    
+    def _send(self, method: str, url: str, **kwargs: Any) -> Any:
+        """Perform a write request and raise on any error status."""
+        response = self.session.request(method, url, **kwargs)
+        
+        if response.status_code >= 300:
+            raise Exception(f"Failed to {method} {url}: {response.status_code} - {response.text}")
+        
+        return response.json() if response.content else None
+    
+    def get_review_context(self, repo: str, pr_number: int) -> Dict[str, Any]:
+        """Get what is needed to publish a review: the diff and earlier comments.
+        
+        Returns:
+            Dictionary with 'patches' (file path -> parsed diff) and 'comments'
+            ((marker key, comment id) of comments posted earlier)
+        """
+        pr_url = f"{self.base_url}/repositories/{repo}/pullrequests/{pr_number}"
+        patches = {
+            file_diff.new_path: file_diff
+            for file_diff in self.iter_pr_diff(repo, pr_number)
+            if not file_diff.deleted_file
+        }
+        
+        comments = []
+        for comment in self._paginate(f"{pr_url}/comments"):
+            key = parse_marker((comment.get("content") or {}).get("raw"))
+            if key and not comment.get("deleted"):
+                comments.append((key, comment["id"]))
+        
+        return {"patches": patches, "comments": comments}
+    
+    def submit_review(self, repo: str, pr_number: int, plan: ReviewPlan, context: Dict[str, Any]) -> None:
+        """Apply a review plan.
+        
+        Bitbucket has no batched review API, so each new inline comment is
+        its own request; they are still created together from one plan.
+        """
+        comments_url = f"{self.base_url}/repositories/{repo}/pullrequests/{pr_number}/comments"
+        for comment in plan.comments:
+            self._send("POST", comments_url, json={
+                "content": {"raw": comment["body"]},
+                "inline": {"path": comment["path"], "to": comment["line"]}
+            })
+        
+        for comment_id in plan.stale:
+            self._send("DELETE", f"{comments_url}/{comment_id}")
+        
+        if plan.summary_id is not None:
+            self._send("PUT", f"{comments_url}/{plan.summary_id}", json={"content": {"raw": plan.summary}})
+        else:
+            self._send("POST", comments_url, json={"content": {"raw": plan.summary}})
\ No newline at end of file
@@ -1,23 +1,56 @@
 import os
-from typing import Dict, List, Any, Tuple
+from typing import Dict, Iterator, List, Any, Tuple, Optional
+from urllib.parse import quote
 
+import requests
 from github import Github
 from github.PullRequest import PullRequest
 from dotenv import load_dotenv
 
+from services.review_publisher import ReviewPlan, SUMMARY_KEY, parse_marker
+from utils.blob_cache import BlobCache
+from utils.content_policy import ContentPolicy, STREAM_CHUNK_BYTES
+from utils.diff_positions import added_file_content
+from utils.helpers import create_http_session, iter_files_from_tarball
+
 # Load environment variables
 load_dotenv()
 
+# Number of changed files above which the whole head tree is downloaded
+# as one archive instead of fetching every file separately
+DEFAULT_ARCHIVE_THRESHOLD = 100
+
+# Media type of JSON API responses (the session defaults to raw content)
+JSON_HEADERS = {"Accept": "application/vnd.github+json"}
+
 
 class GitHubService:
     """Service for interacting with GitHub API."""
     
-    def __init__(self):
-        """Initialize the GitHub service with token from environment variables."""
+    def __init__(self, archive_threshold: Optional[int] = None, blob_cache: Optional[BlobCache] = None):
+        """Initialize the GitHub service with token from environment variables.
+        
+        Args:
+            archive_threshold: Changed-file count above which PR contents are
+                fetched from a single tarball (defaults to GITHUB_ARCHIVE_THRESHOLD)
+            blob_cache: Optional cache of file contents keyed by blob SHA,
+                shared between the PRs of a batch
+        """
         self.token = os.getenv("GITHUB_TOKEN")
         if not self.token:
             raise ValueError("GITHUB_TOKEN environment variable not set")
-        self.client = Github(self.token)
+        self.api_url = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+        self.client = Github(self.token, base_url=self.api_url)
+        # Raw content downloads bypass PyGithub so they can be streamed
+        self.session = create_http_session({
+            "Authorization": f"token {self.token}",
+            "Accept": "application/vnd.github.raw"
+        }, pool_size=4)
+        
+        if archive_threshold is None:
+            archive_threshold = int(os.getenv("GITHUB_ARCHIVE_THRESHOLD", DEFAULT_ARCHIVE_THRESHOLD))
+        self.archive_threshold = archive_threshold
+        self.blob_cache = blob_cache
     
     def get_pull_request(self, repo_name: str, pr_number: int) -> PullRequest:
         """Get a pull request by repository name and PR number.
@@ -86,26 +119,303 @@ class GitHubService:
         content = repo.get_contents(file_path, ref=ref)
         return content.decoded_content.decode('utf-8')
     
-    def get_pr_files_content(self, repo_name: str, pr_number: int) -> Dict[str, str]:
-        """Get content of all files changed in a pull request.
+    def read_file_content(self, repo_name: str, file_path: str, ref: str,
+                          content_policy: ContentPolicy) -> Optional[str]:
+        """Stream the content of a file at a specific reference through a content policy.
         
         Args:
             repo_name: Repository name in format 'username/repo'
-            pr_number: Pull request number
+            file_path: Path to the file in the repository
+            ref: Git reference (branch, commit, tag)
+            content_policy: Policy deciding how much of the file is kept
+            
+        Returns:
+            File content as string, or None if the policy skipped the file
+        
+        Raises:
+            FileNotFoundError: If the file does not exist at the reference
+        """
+        url = f"{self.api_url}/repos/{repo_name}/contents/{quote(file_path)}"
+        with self.session.get(url, params={"ref": ref}, stream=True, timeout=60) as response:
+            if response.status_code == 404:
+                raise FileNotFoundError(f"{file_path} does not exist at {ref}")
+            response.raise_for_status()
+            size = response.headers.get("Content-Length")
+            return content_policy.read(
+                file_path,
+                response.iter_content(STREAM_CHUNK_BYTES),
+                int(size) if size else None
+            )
+    
+    def iter_archive_files_content(self, repo_name: str, file_paths: List[str], ref: str,
+                                   content_policy: Optional[ContentPolicy] = None) -> Iterator[Tuple[str, str]]:
+        """Stream the content of several files out of one tarball of a reference.
+        
+        Args:
+            repo_name: Repository name in format 'username/repo'
+            file_paths: Paths of the files to extract
+            ref: Git reference (branch, commit, tag)
+            content_policy: Optional policy applied to each extracted file
+            
+        Yields:
+            (file path, content) tuples in archive order
+        """
+        repo = self.client.get_repo(repo_name)
+        archive_url = repo.get_archive_link("tarball", ref=ref)
+        
+        with requests.get(
+            archive_url,
+            headers={"Authorization": f"token {self.token}"},
+            stream=True,
+            timeout=60
+        ) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            yield from iter_files_from_tarball(response.raw, file_paths, content_policy)
+    
+    def get_archive_files_content(self, repo_name: str, file_paths: List[str], ref: str,
+                                  content_policy: Optional[ContentPolicy] = None) -> Dict[str, str]:
+        """Get content of several files from one streamed tarball of a reference.
+        
+        Args:
+            repo_name: Repository name in format 'username/repo'
+            file_paths: Paths of the files to extract
+            ref: Git reference (branch, commit, tag)
+            content_policy: Optional policy applied to each extracted file
             
         Returns:
             Dictionary mapping file paths to their content
         """
+        return dict(self.iter_archive_files_content(repo_name, file_paths, ref, content_policy))
+    
+    def iter_pr_files_content(self, repo_name: str, pr_number: int,
+                              content_policy: Optional[ContentPolicy] = None) -> Iterator[Tuple[str, str]]:
+        """Stream the content of all files changed in a pull request.
+        
+        Added files are rebuilt from their patch in the file list when it
+        holds the whole file. PRs with more than ``archive_threshold`` other
+        changed files are read from a single tarball of the head commit;
+        smaller PRs (or the rest of a failed archive download) fall back to
+        one request per file. Every
+        file is streamed through ``content_policy`` and yielded as soon as it
+        has been read, so callers can analyze it while the next one downloads.
+        
+        Args:
+            repo_name: Repository name in format 'username/repo'
+            pr_number: Pull request number
+            content_policy: Size and memory policy (defaults to one built from the environment)
+            
+        Yields:
+            (file path, content) tuples
+        """
         pr = self.get_pull_request(repo_name, pr_number)
+        changed_files = [file for file in pr.get_files() if file.status != 'removed']
+        if content_policy is None:
+            content_policy = ContentPolicy()
+        
+        pending_files = []
+        for file in changed_files:
+            known = self.blob_cache.get(file.sha) if self.blob_cache is not None else None
+            if known is None and file.status == 'added' and file.patch:
+                known = added_file_content(file.patch)
+            if known is None:
+                pending_files.append(file)
+                continue
+            content = content_policy.read(file.filename, [known.encode('utf-8')])
+            if content is not None:
+                yield file.filename, content
+        
+        if len(pending_files) > self.archive_threshold:
+            shas = {file.filename: file.sha for file in pending_files}
+            extracted = set()
+            try:
+                for file_path, content in self.iter_archive_files_content(
+                    repo_name, list(shas), pr.head.sha, content_policy
+                ):
+                    extracted.add(file_path)
+                    self._cache_file(shas[file_path], content)
+                    yield file_path, content
+                return
+            except Exception as e:
+                print(f"Error getting archive for {repo_name}@{pr.head.sha}, fetching files individually: {e}")
+                pending_files = [file for file in pending_files if file.filename not in extracted]
+        
+        for file in pending_files:
+            try:
+                content = self.read_file_content(repo_name, file.filename, pr.head.sha, content_policy)
+            except Exception as e:
+                # Log error and continue with next file
+                print(f"Error getting content for {file.filename}: {e}")
+                continue
+            if content is not None:
+                self._cache_file(file.sha, content)
+                yield file.filename, content
+    
+    def get_pr_files_content(self, repo_name: str, pr_number: int,
+                             content_policy: Optional[ContentPolicy] = None) -> Dict[str, str]:
+        """Get content of all files changed in a pull request (see ``iter_pr_files_content``).
+        
+        Args:
+            repo_name: Repository name in format 'username/repo'
+            pr_number: Pull request number
+            content_policy: Size and memory policy (defaults to one built from the environment)
+            
+        Returns:
+            Dictionary mapping file paths to their content
+        """
+        return dict(self.iter_pr_files_content(repo_name, pr_number, content_policy))
+    
+    def get_base_sha(self, repo_name: str, pr_number: int) -> str:
+        """Get the commit SHA of a pull request's base.
+        
+        Args:
+            repo_name: Repository name in format 'username/repo'
+            pr_number: Pull request number
+            
+        Returns:
+            Base commit SHA
+        """
+        return self.get_pull_request(repo_name, pr_number).base.sha
+    
+    def get_base_branch(self, repo_name: str, pr_number: int) -> str:
+        """Get the name of the branch a pull request targets."""
+        return self.get_pull_request(repo_name, pr_number).base.ref
+    
+    def get_changed_file_count(self, repo_name: str, pr_number: int) -> int:
+        """Get the number of files a pull request changes, as reported by GitHub."""
+        return self.get_pull_request(repo_name, pr_number).changed_files
+    
+    def get_pr_head(self, repo_name: str, pr_number: int) -> Tuple[str, str]:
+        """Get the repository to read a pull request's files from and its head commit SHA.
+        
+        Args:
+            repo_name: Repository name in format 'username/repo'
+            pr_number: Pull request number
+        
+        Returns:
+            Tuple of (repository name, head commit SHA)
+        """
+        # Head commits of forks are readable through the base repository
+        return repo_name, self.get_pull_request(repo_name, pr_number).head.sha
+    
+    def get_pr_author(self, repo_name: str, pr_number: int) -> str:
+        """Get the login of a pull request's author."""
+        return self.get_pull_request(repo_name, pr_number).user.login
+    
+    def get_files_content_at(self, repo_name: str, file_paths: List[str], ref: str,
+                             content_policy: ContentPolicy) -> Dict[str, str]:
+        """Get content of several files at a reference, skipping files that do not exist there.
+        
+        Args:
+            repo_name: Repository name in format 'username/repo'
+            file_paths: Paths of the files to fetch
+            ref: Git reference (branch, commit, tag)
+            content_policy: Size and memory policy
+            
+        Returns:
+            Dictionary mapping file paths to their content
+        
+        Raises:
+            Exception: If a file could not be fetched for another reason than not existing
+        """
+        if len(file_paths) > self.archive_threshold:
+            try:
+                return self.get_archive_files_content(repo_name, file_paths, ref, content_policy)
+            except Exception as e:
+                print(f"Error getting archive for {repo_name}@{ref}, fetching files individually: {e}")
+        
         files_content = {}
+        for file_path in file_paths:
+            try:
+                content = self.read_file_content(repo_name, file_path, ref, content_policy)
+            except FileNotFoundError:
+                # Files added by the PR do not exist at the base
+                continue
+            if content is not None:
+                files_content[file_path] = content
         
-        for file in pr.get_files():
-            if file.status != 'removed':
-                try:
-                    content = self.get_file_content(repo_name, file.filename, pr.head.sha)
-                    files_content[file.filename] = content
-                except Exception as e:
-                    # Log error and continue with next file
-                    print(f"Error getting content for {file.filename}: {e}")
-        
-        return files_content
\ No newline at end of file
+        return files_content
+    
+    def _cache_file(self, blob_sha: str, content: str) -> None:
+        """Store a fetched content in the blob cache under its blob SHA."""
+        if self.blob_cache is not None:
+            self.blob_cache.put(blob_sha, content)
+    
+    def _api(self, method: str, url: str, **kwargs: Any) -> Any:
+        """Perform a JSON API request and raise on any error status."""
+        response = self.session.request(method, url, headers=JSON_HEADERS, timeout=60, **kwargs)
+        response.raise_for_status()
+        return response.json() if response.content else None
+    
+    def _paginate(self, url: str) -> Iterator[Dict[str, Any]]:
+        """Yield the items of a paginated API list, following 'next' links."""
+        params = {"per_page": 100}
+        while url:
+            response = self.session.get(url, params=params, headers=JSON_HEADERS, timeout=60)
+            response.raise_for_status()
+            yield from response.json()
+            url = response.links.get("next", {}).get("url")
+            params = None
+    
+    def get_review_context(self, repo_name: str, pr_number: int) -> Dict[str, Any]:
+        """Get what is needed to publish a review: the diff and earlier comments.
+        
+        Args:
+            repo_name: Repository name in format 'username/repo'
+            pr_number: Pull request number
+        
+        Returns:
+            Dictionary with 'head_sha', 'patches' (file path -> hunks) and
+            'comments' ((marker key, comment id) of comments posted earlier)
+        """
+        pr_url = f"{self.api_url}/repos/{repo_name}/pulls/{pr_number}"
+        head_sha = self._api("GET", pr_url)["head"]["sha"]
+        patches = {
+            file["filename"]: file.get("patch") or ""
+            for file in self._paginate(f"{pr_url}/files")
+            if file["status"] != "removed"
+        }
+        
+        comments = []
+        for comment in self._paginate(f"{pr_url}/comments"):
+            key = parse_marker(comment.get("body"))
+            if key and key != SUMMARY_KEY:
+                comments.append((key, ("review", comment["id"])))
+        for comment in self._paginate(f"{self.api_url}/repos/{repo_name}/issues/{pr_number}/comments"):
+            if parse_marker(comment.get("body")) == SUMMARY_KEY:
+                comments.append((SUMMARY_KEY, ("issue", comment["id"])))
+        
+        return {"head_sha": head_sha, "patches": patches, "comments": comments}
+    
+    def submit_review(self, repo_name: str, pr_number: int, plan: ReviewPlan, context: Dict[str, Any]) -> None:
+        """Apply a review plan: one review with every new comment, then clean-up.
+        
+        New inline comments go out in a single create-review call pinned to
+        the head commit the diff was read at. The summary is a regular PR
+        comment so it can be edited in place on the next run.
+        
+        Args:
+            repo_name: Repository name in format 'username/repo'
+            pr_number: Pull request number
+            plan: Comments to create and remove (see ``plan_review``)
+            context: Result of ``get_review_context``
+        """
+        repo_url = f"{self.api_url}/repos/{repo_name}"
+        if plan.comments:
+            self._api("POST", f"{repo_url}/pulls/{pr_number}/reviews", json={
+                "commit_id": context["head_sha"],
+                "event": "COMMENT",
+                "comments": [
+                    {"path": comment["path"], "line": comment["line"], "side": "RIGHT", "body": comment["body"]}
+                    for comment in plan.comments
+                ]
+            })
+        
+        for kind, comment_id in plan.stale:
+            comments_url = f"{repo_url}/issues/comments" if kind == "issue" else f"{repo_url}/pulls/comments"
+            self._api("DELETE", f"{comments_url}/{comment_id}")
+        
+        if plan.summary_id is not None:
+            self._api("PATCH", f"{repo_url}/issues/comments/{plan.summary_id[1]}", json={"body": plan.summary})
+        else:
+            self._api("POST", f"{repo_url}/issues/{pr_number}/comments", json={"body": plan.summary})
\ No newline at end of file
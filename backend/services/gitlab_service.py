@@ -1,33 +1,122 @@
 import os
-from typing import Dict, List, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+from urllib.parse import quote
 
-# This is a placeholder for GitLab integration
-# To be implemented in the future
+from dotenv import load_dotenv
+
+from services.review_publisher import ReviewPlan, parse_marker
+from utils.blob_cache import BlobCache
+from utils.content_policy import ContentPolicy, STREAM_CHUNK_BYTES
+from utils.diff_positions import added_file_content, diff_line_map
+from utils.file_stream import fetch_concurrently
+from utils.helpers import create_http_session
+
+# Load environment variables
+load_dotenv()
+
+# Maximum number of file contents fetched at the same time
+DEFAULT_MAX_CONCURRENCY = 8
+
+# Number of file diffs requested per page of the MR diffs endpoint
+DIFFS_PER_PAGE = 100
 
 
 class GitLabService:
-    """Service for interacting with GitLab API (placeholder)."""
+    """Service for interacting with GitLab API."""
     
-    def __init__(self):
-        """Initialize the GitLab service with token from environment variables."""
+    def __init__(self, base_url: Optional[str] = None, max_concurrency: Optional[int] = None,
+                 blob_cache: Optional[BlobCache] = None):
+        """Initialize the GitLab service with token from environment variables.
+        
+        Args:
+            base_url: API root URL (defaults to GITLAB_API_URL or gitlab.com)
+            max_concurrency: Maximum parallel content fetches (defaults to GITLAB_MAX_CONCURRENCY)
+            blob_cache: Optional cache of file contents shared between the PRs of a batch
+        """
         self.token = os.getenv("GITLAB_TOKEN")
         if not self.token:
             raise ValueError("GITLAB_TOKEN environment variable not set")
-        # GitLab client initialization would go here
-        self.client = None
+        self.base_url = (base_url or os.getenv("GITLAB_API_URL", "https://gitlab.com/api/v4")).rstrip("/")
+        
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv("GITLAB_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+        self.max_concurrency = max(1, max_concurrency)
+        self.blob_cache = blob_cache
+        
+        self.client = create_http_session({"PRIVATE-TOKEN": self.token}, self.max_concurrency)
+    
+    def _project_url(self, repo_name: str) -> str:
+        """Get the API URL of a project addressed by its full path."""
+        return f"{self.base_url}/projects/{quote(repo_name, safe='')}"
+    
+    def _get(self, url: str, **params: Any):
+        """Perform a GET request and raise on any non-200 response."""
+        response = self.client.get(url, params=params)
+        
+        if response.status_code != 200:
+            raise Exception(f"Failed to get {url}: {response.status_code} - {response.text}")
+        
+        return response
     
-    def get_merge_request(self, repo_name: str, mr_number: int) -> Any:
+    def _send(self, method: str, url: str, **kwargs: Any) -> Any:
+        """Perform a write request and raise on any error status."""
+        response = self.client.request(method, url, **kwargs)
+        
+        if response.status_code >= 300:
+            raise Exception(f"Failed to {method} {url}: {response.status_code} - {response.text}")
+        
+        return response.json() if response.content else None
+    
+    def _paginate(self, url: str) -> Iterator[Dict[str, Any]]:
+        """Yield the items of a paginated API list, following X-Next-Page."""
+        page = "1"
+        while page:
+            response = self._get(url, page=page, per_page=DIFFS_PER_PAGE)
+            yield from response.json()
+            page = response.headers.get("X-Next-Page")
+    
+    def get_merge_request(self, repo_name: str, mr_number: int) -> Dict[str, Any]:
         """Get a merge request by repository name and MR number.
         
         Args:
             repo_name: Repository name in format 'username/repo'
             mr_number: Merge request number
-            
+        
         Returns:
-            GitLab MergeRequest object
+            GitLab merge request data
+        """
+        return self._get(f"{self._project_url(repo_name)}/merge_requests/{mr_number}").json()
+    
+    def iter_mr_diffs(self, repo_name: str, mr_number: int) -> Iterator[Dict[str, Any]]:
+        """Stream the file diffs of a merge request.
+        
+        Uses the paginated ``/diffs`` endpoint, which returns the file list and
+        patches together, and falls back to the single-call ``/changes``
+        endpoint on GitLab versions that predate it.
+        
+        Args:
+            repo_name: Repository name in format 'username/repo'
+            mr_number: Merge request number
+        
+        Yields:
+            GitLab diff dictionaries
         """
-        # Placeholder implementation
-        raise NotImplementedError("GitLab integration not yet implemented")
+        url = f"{self._project_url(repo_name)}/merge_requests/{mr_number}/diffs"
+        page = "1"
+        
+        while page:
+            response = self.client.get(url, params={"page": page, "per_page": DIFFS_PER_PAGE})
+            
+            if response.status_code == 404 and page == "1":
+                changes_url = f"{self._project_url(repo_name)}/merge_requests/{mr_number}/changes"
+                yield from self._get(changes_url, access_raw_diffs="true").json().get("changes", [])
+                return
+            if response.status_code != 200:
+                raise Exception(f"Failed to get MR diffs: {response.status_code} - {response.text}")
+            
+            yield from response.json()
+            page = response.headers.get("X-Next-Page")
     
     def get_mr_files(self, repo_name: str, mr_number: int) -> List[Dict[str, Any]]:
         """Get files changed in a merge request.
@@ -35,12 +124,36 @@ class GitLabService:
         Args:
             repo_name: Repository name in format 'username/repo'
             mr_number: Merge request number
-            
+        
         Returns:
             List of file data dictionaries
         """
-        # Placeholder implementation
-        raise NotImplementedError("GitLab integration not yet implemented")
+        files = []
+        
+        for diff in self.iter_mr_diffs(repo_name, mr_number):
+            patch = diff.get("diff", "")
+            additions = 0
+            deletions = 0
+            for line in patch.split('\n'):
+                if line.startswith('+') and not line.startswith('+++'):
+                    additions += 1
+                elif line.startswith('-') and not line.startswith('---'):
+                    deletions += 1
+            
+            files.append({
+                "filename": diff.get("new_path") or diff.get("old_path"),
+                "status": self._map_status(diff),
+                "additions": additions,
+                "deletions": deletions,
+                "changes": additions + deletions,
+                "patch": patch
+            })
+        
+        return files
+    
+    def get_pr_files(self, repo_name: str, pr_number: int) -> List[Dict[str, Any]]:
+        """Get files changed in a merge request (provider-neutral name)."""
+        return self.get_mr_files(repo_name, pr_number)
     
     def get_mr_diff(self, repo_name: str, mr_number: int) -> str:
         """Get the diff content of a merge request.
@@ -48,12 +161,13 @@ class GitLabService:
         Args:
             repo_name: Repository name in format 'username/repo'
             mr_number: Merge request number
-            
+        
         Returns:
             Diff content as string
         """
-        # Placeholder implementation
-        raise NotImplementedError("GitLab integration not yet implemented")
+        return '\n'.join(
+            diff.get("diff", "") for diff in self.iter_mr_diffs(repo_name, mr_number)
+        )
     
     def get_file_content(self, repo_name: str, file_path: str, ref: str) -> str:
         """Get content of a file at a specific reference.
@@ -62,22 +176,248 @@ class GitLabService:
             repo_name: Repository name in format 'username/repo'
             file_path: Path to the file in the repository
             ref: Git reference (branch, commit, tag)
-            
+        
         Returns:
             File content as string
         """
-        # Placeholder implementation
-        raise NotImplementedError("GitLab integration not yet implemented")
+        url = f"{self._project_url(repo_name)}/repository/files/{quote(file_path, safe='')}/raw"
+        return self._get(url, ref=ref).content.decode('utf-8')
     
-    def get_mr_files_content(self, repo_name: str, mr_number: int) -> Dict[str, str]:
-        """Get content of all files changed in a merge request.
+    def read_file_content(self, repo_name: str, file_path: str, ref: str,
+                          content_policy: ContentPolicy) -> Optional[str]:
+        """Stream the content of a file at a specific reference through a content policy.
         
         Args:
             repo_name: Repository name in format 'username/repo'
-            mr_number: Merge request number
+            file_path: Path to the file in the repository
+            ref: Git reference (branch, commit, tag)
+            content_policy: Policy deciding how much of the file is kept
+        
+        Returns:
+            File content as string, or None if the policy skipped the file
+        
+        Raises:
+            FileNotFoundError: If the file does not exist at the reference
+        """
+        url = f"{self._project_url(repo_name)}/repository/files/{quote(file_path, safe='')}/raw"
+        with self.client.get(url, params={"ref": ref}, stream=True) as response:
+            if response.status_code == 404:
+                raise FileNotFoundError(f"{file_path} does not exist at {ref}")
+            if response.status_code != 200:
+                raise Exception(f"Failed to get {url}: {response.status_code} - {response.text}")
             
+            size = response.headers.get("Content-Length")
+            return content_policy.read(
+                file_path,
+                response.iter_content(STREAM_CHUNK_BYTES),
+                int(size) if size else None
+            )
+    
+    def _read_cached_file_content(self, repo_name: str, file_path: str, ref: str,
+                                  content_policy: ContentPolicy) -> Optional[str]:
+        """Read file content through the blob cache when one is configured."""
+        if self.blob_cache is None:
+            return self.read_file_content(repo_name, file_path, ref, content_policy)
+        return self.blob_cache.read_through(
+            (repo_name, ref, file_path), file_path, content_policy,
+            lambda: self.read_file_content(repo_name, file_path, ref, content_policy)
+        )
+    
+    def iter_mr_files_content(self, repo_name: str, mr_number: int,
+                              content_policy: Optional[ContentPolicy] = None) -> Iterator[Tuple[str, str]]:
+        """Stream the content of all files changed in a merge request.
+        
+        File contents are fetched at the MR head commit as soon as each diff
+        page arrives, with at most ``max_concurrency`` requests in flight, and
+        yielded in the order they complete. New files whose diff is neither
+        too large nor collapsed are rebuilt from it instead of being fetched.
+        
+        Args:
+            repo_name: Repository name in format 'username/repo'
+            mr_number: Merge request number
+            content_policy: Size and memory policy (defaults to one built from the environment)
+        
+        Yields:
+            (file path, content) tuples
+        """
+        mr = self.get_merge_request(repo_name, mr_number)
+        head_sha = (mr.get("diff_refs") or {}).get("head_sha") or mr.get("sha")
+        if content_policy is None:
+            content_policy = ContentPolicy()
+        
+        # Patches of listed new files, until their fetch picks them up
+        new_file_patches: Dict[str, str] = {}
+        
+        def changed_paths() -> Iterator[str]:
+            for diff in self.iter_mr_diffs(repo_name, mr_number):
+                if diff.get("deleted_file"):
+                    continue
+                if diff.get("new_file") and diff.get("diff") and not (diff.get("too_large") or diff.get("collapsed")):
+                    new_file_patches[diff["new_path"]] = diff["diff"]
+                yield diff.get("new_path")
+        
+        def fetch(file_path: str) -> Optional[str]:
+            patch = new_file_patches.pop(file_path, None)
+            content = added_file_content(patch) if patch else None
+            if content is None:
+                return self._read_cached_file_content(repo_name, file_path, head_sha, content_policy)
+            return content_policy.read(file_path, [content.encode('utf-8')])
+        
+        yield from fetch_concurrently(fetch, changed_paths(), self.max_concurrency)
+    
+    def get_mr_files_content(self, repo_name: str, mr_number: int,
+                             content_policy: Optional[ContentPolicy] = None) -> Dict[str, str]:
+        """Get content of all files changed in a merge request (see ``iter_mr_files_content``).
+        
+        Args:
+            repo_name: Repository name in format 'username/repo'
+            mr_number: Merge request number
+            content_policy: Size and memory policy (defaults to one built from the environment)
+        
         Returns:
             Dictionary mapping file paths to their content
         """
-        # Placeholder implementation
-        raise NotImplementedError("GitLab integration not yet implemented")
\ No newline at end of file
+        return dict(self.iter_mr_files_content(repo_name, mr_number, content_policy))
+    
+    def iter_pr_files_content(self, repo_name: str, pr_number: int,
+                              content_policy: Optional[ContentPolicy] = None) -> Iterator[Tuple[str, str]]:
+        """Stream the content of all files changed in a merge request (provider-neutral name)."""
+        return self.iter_mr_files_content(repo_name, pr_number, content_policy)
+    
+    def get_pr_files_content(self, repo_name: str, pr_number: int,
+                             content_policy: Optional[ContentPolicy] = None) -> Dict[str, str]:
+        """Get content of all files changed in a merge request (provider-neutral name)."""
+        return self.get_mr_files_content(repo_name, pr_number, content_policy)
+    
+    def get_base_sha(self, repo_name: str, mr_number: int) -> str:
+        """Get the commit SHA a merge request's diff is computed against."""
+        mr = self.get_merge_request(repo_name, mr_number)
+        return mr["diff_refs"]["base_sha"]
+    
+    def get_base_branch(self, repo_name: str, mr_number: int) -> str:
+        """Get the name of the branch a merge request targets."""
+        return self.get_merge_request(repo_name, mr_number)["target_branch"]
+    
+    def get_changed_file_count(self, repo_name: str, mr_number: int) -> Optional[int]:
+        """Get the number of files a merge request changes, as reported by GitLab.
+        
+        GitLab reports large counts as a lower bound such as '1000+', which is
+        returned as 1000; None if the count is not known yet.
+        """
+        count = self.get_merge_request(repo_name, mr_number).get("changes_count")
+        return int(str(count).rstrip("+")) if count else None
+    
+    def get_pr_head(self, repo_name: str, mr_number: int) -> Tuple[str, str]:
+        """Get the project to read a merge request's files from and its head commit SHA."""
+        mr = self.get_merge_request(repo_name, mr_number)
+        return repo_name, (mr.get("diff_refs") or {}).get("head_sha") or mr.get("sha")
+    
+    def get_pr_author(self, repo_name: str, mr_number: int) -> str:
+        """Get the username of a merge request's author."""
+        return self.get_merge_request(repo_name, mr_number)["author"]["username"]
+    
+    def get_files_content_at(self, repo_name: str, file_paths: List[str], ref: str,
+                             content_policy: ContentPolicy) -> Dict[str, str]:
+        """Get content of several files at a reference, skipping files that do not exist there.
+        
+        Raises:
+            Exception: If a file could not be fetched for another reason than not existing
+        """
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = {
+                file_path: executor.submit(self._read_cached_file_content, repo_name, file_path, ref, content_policy)
+                for file_path in file_paths
+            }
+        
+        files_content = {}
+        for file_path, future in futures.items():
+            try:
+                content = future.result()
+            except FileNotFoundError:
+                # Files added by the MR do not exist at the base
+                continue
+            if content is not None:
+                files_content[file_path] = content
+        
+        return files_content
+    
+    def _map_status(self, diff: Dict[str, Any]) -> str:
+        """Map GitLab diff flags to standardized status."""
+        if diff.get("new_file"):
+            return "added"
+        if diff.get("deleted_file"):
+            return "removed"
+        if diff.get("renamed_file"):
+            return "renamed"
+        return "modified"
+    
+    def get_review_context(self, repo_name: str, mr_number: int) -> Dict[str, Any]:
+        """Get what is needed to publish a review: diff refs, patches and earlier comments.
+        
+        Args:
+            repo_name: Repository name in format 'username/repo'
+            mr_number: Merge request number
+        
+        Returns:
+            Dictionary with 'diff_refs', 'patches' (file path -> hunks),
+            'old_paths' (file path -> path at the base) and 'comments'
+            ((marker key, note id) of notes posted earlier)
+        """
+        mr = self.get_merge_request(repo_name, mr_number)
+        patches = {}
+        old_paths = {}
+        for diff in self.iter_mr_diffs(repo_name, mr_number):
+            if not diff.get("deleted_file"):
+                patches[diff["new_path"]] = diff.get("diff", "")
+                old_paths[diff["new_path"]] = diff.get("old_path") or diff["new_path"]
+        
+        comments = []
+        discussions_url = f"{self._project_url(repo_name)}/merge_requests/{mr_number}/discussions"
+        for discussion in self._paginate(discussions_url):
+            for note in discussion.get("notes", []):
+                key = parse_marker(note.get("body"))
+                if key:
+                    comments.append((key, note["id"]))
+        
+        return {"diff_refs": mr["diff_refs"], "patches": patches, "old_paths": old_paths, "comments": comments}
+    
+    def submit_review(self, repo_name: str, mr_number: int, plan: ReviewPlan, context: Dict[str, Any]) -> None:
+        """Apply a review plan: one batch of draft notes published together, then clean-up.
+        
+        Args:
+            repo_name: Repository name in format 'username/repo'
+            mr_number: Merge request number
+            plan: Comments to create and remove (see ``plan_review``)
+            context: Result of ``get_review_context``
+        """
+        mr_url = f"{self._project_url(repo_name)}/merge_requests/{mr_number}"
+        diff_refs = context["diff_refs"]
+        line_maps = {}
+        for comment in plan.comments:
+            path = comment["path"]
+            if path not in line_maps:
+                line_maps[path] = diff_line_map(context["patches"][path])
+            position = {
+                "position_type": "text",
+                "base_sha": diff_refs["base_sha"],
+                "start_sha": diff_refs["start_sha"],
+                "head_sha": diff_refs["head_sha"],
+                "old_path": context["old_paths"][path],
+                "new_path": path,
+                "new_line": comment["line"]
+            }
+            # Context lines are addressed by both sides, added lines by the new side only
+            old_line = line_maps[path][comment["line"]]
+            if old_line is not None:
+                position["old_line"] = old_line
+            self._send("POST", f"{mr_url}/draft_notes", json={"note": comment["body"], "position": position})
+        if plan.comments:
+            self._send("POST", f"{mr_url}/draft_notes/bulk_publish")
+        
+        for note_id in plan.stale:
+            self._send("DELETE", f"{mr_url}/notes/{note_id}")
+        
+        if plan.summary_id is not None:
+            self._send("PUT", f"{mr_url}/notes/{plan.summary_id}", json={"body": plan.summary})
+        else:
+            self._send("POST", f"{mr_url}/notes", json={"body": plan.summary})
\ No newline at end of file
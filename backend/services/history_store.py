@@ -0,0 +1,288 @@
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Any, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from models.feedback_model import Issue
+from utils.helpers import SCORE_CATEGORIES, calculate_scores
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_HISTORY_PATH = "analysis_history.db"
+
+# Period lengths accepted by trend queries
+TREND_BUCKETS = {"day": 86400, "week": 7 * 86400}
+
+
+class HistoryStore:
+    """Indexed history of completed analyses, stored in SQLite.
+    
+    Every analysis is one row of the ``analyses`` table with a column per
+    category for its issue count and its checker penalty, so re-scoring
+    loads those columns straight into NumPy arrays. Per-file counts and
+    individual issues are kept in their own tables for drill-down. Analyzing
+    the same head commit of a pull request again replaces its earlier
+    analysis, so re-runs are not counted twice.
+    """
+    
+    def __init__(self, path: Optional[str] = None):
+        """Initialize the store and create its tables.
+        
+        Args:
+            path: Database file (HISTORY_DB_PATH)
+        """
+        self.path = path or os.getenv("HISTORY_DB_PATH", DEFAULT_HISTORY_PATH)
+        
+        category_columns = ", ".join(
+            f"{category}_count INTEGER NOT NULL DEFAULT 0, {category}_penalty REAL"
+            for category in SCORE_CATEGORIES
+        )
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS analyses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    repo TEXT NOT NULL,
+                    server TEXT NOT NULL,
+                    pr_number INTEGER NOT NULL,
+                    author TEXT,
+                    base_sha TEXT,
+                    created_at REAL NOT NULL,
+                    overall INTEGER NOT NULL,
+                    {category_columns}
+                )
+            """)
+            # Columns added after the first release of the store
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(analyses)")}
+            if "head_sha" not in existing:
+                conn.execute("ALTER TABLE analyses ADD COLUMN head_sha TEXT")
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_analyses_head ON analyses (repo, server, pr_number, head_sha)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_repo ON analyses (repo, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_author ON analyses (author, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_time ON analyses (created_at)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS file_counts (
+                    analysis_id INTEGER NOT NULL,
+                    file TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    count INTEGER NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_file_counts_analysis ON file_counts (analysis_id)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS issues (
+                    analysis_id INTEGER NOT NULL,
+                    file TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    line INTEGER NOT NULL,
+                    message TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_issues_analysis ON issues (analysis_id)")
+    
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection; one per call keeps the store safe across threads and processes."""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+    
+    def record(
+        self,
+        response: Dict[str, Any],
+        issues: List[Tuple[str, str, Issue]],
+        penalties: Optional[Dict[str, float]] = None,
+        author: Optional[str] = None,
+        head_sha: Optional[str] = None
+    ) -> int:
+        """Persist a completed analysis, replacing an earlier one of the same head commit.
+        
+        Args:
+            response: JSON-encoded AnalyzeResponse
+            issues: (file path, score category, issue) of every reported issue
+            penalties: Penalties computed by checkers per category (see ``calculate_score``)
+            author: Login of the pull request's author
+            head_sha: Head commit analyzed; analyses without one are never replaced
+        
+        Returns:
+            Id of the stored analysis
+        """
+        penalties = penalties or {}
+        counts = {category: 0 for category in SCORE_CATEGORIES}
+        file_counts: Dict[Tuple[str, str], int] = {}
+        for file_path, category, _ in issues:
+            counts[category] += 1
+            file_counts[(file_path, category)] = file_counts.get((file_path, category), 0) + 1
+        
+        columns = ["repo", "server", "pr_number", "author", "base_sha", "head_sha", "created_at", "overall"]
+        values = [
+            response["repo"], response["server"], response["pr_number"], author,
+            response.get("base_sha"), head_sha, time.time(), response["score"]["overall"]
+        ]
+        for category in SCORE_CATEGORIES:
+            columns += [f"{category}_count", f"{category}_penalty"]
+            values += [counts[category], penalties.get(category)]
+        
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if head_sha is not None:
+                    replaced = conn.execute(
+                        "SELECT id FROM analyses WHERE repo = ? AND server = ? AND pr_number = ? AND head_sha = ?",
+                        (response["repo"], response["server"], response["pr_number"], head_sha)
+                    ).fetchall()
+                    for (replaced_id,) in replaced:
+                        for table, column in (("file_counts", "analysis_id"), ("issues", "analysis_id"), ("analyses", "id")):
+                            conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (replaced_id,))
+                cursor = conn.execute(
+                    f"INSERT INTO analyses ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    values
+                )
+                analysis_id = cursor.lastrowid
+                conn.executemany(
+                    "INSERT INTO file_counts (analysis_id, file, category, count) VALUES (?, ?, ?, ?)",
+                    [(analysis_id, file_path, category, count) for (file_path, category), count in file_counts.items()]
+                )
+                conn.executemany(
+                    "INSERT INTO issues (analysis_id, file, category, type, line, message) VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (analysis_id, file_path, category, issue.type, issue.line, issue.msg)
+                        for file_path, category, issue in issues
+                    ]
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return analysis_id
+    
+    def _where(self, repo: Optional[str], author: Optional[str],
+               since: Optional[float], until: Optional[float]) -> Tuple[str, list]:
+        """Build the WHERE clause of a query over analyses."""
+        conditions = []
+        params: list = []
+        if repo:
+            conditions.append("repo = ?")
+            params.append(repo)
+        if author:
+            conditions.append("author = ?")
+            params.append(author)
+        if since is not None:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("created_at < ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(conditions)) if conditions else "", params
+    
+    def load_columns(self, repo: Optional[str] = None, author: Optional[str] = None,
+                     since: Optional[float] = None, until: Optional[float] = None) -> Dict[str, np.ndarray]:
+        """Load the score columns of matching analyses as arrays.
+        
+        Returns:
+            Dictionary with 'id', 'pr_number', 'created_at' and 'overall' arrays,
+            'repo' as a list, and 'counts' and 'penalties' matrices with one
+            column per ``SCORE_CATEGORIES`` entry (missing penalties are NaN)
+        """
+        where, params = self._where(repo, author, since, until)
+        count_columns = ", ".join(f"{category}_count" for category in SCORE_CATEGORIES)
+        penalty_columns = ", ".join(f"{category}_penalty" for category in SCORE_CATEGORIES)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT id, repo, pr_number, created_at, overall, {count_columns}, {penalty_columns} "
+                f"FROM analyses{where} ORDER BY created_at",
+                params
+            ).fetchall()
+        
+        width = len(SCORE_CATEGORIES)
+        numeric = np.array([row[2:] for row in rows], dtype=np.float64).reshape(len(rows), 3 + 2 * width)
+        return {
+            "id": np.array([row[0] for row in rows], dtype=np.int64),
+            "repo": [row[1] for row in rows],
+            "pr_number": numeric[:, 0].astype(np.int64),
+            "created_at": numeric[:, 1],
+            "overall": numeric[:, 2].astype(np.int64),
+            "counts": numeric[:, 3:3 + width],
+            "penalties": numeric[:, 3 + width:]
+        }
+    
+    def rescore(self, weights: Dict[str, float], repo: Optional[str] = None, author: Optional[str] = None,
+                since: Optional[float] = None, until: Optional[float] = None) -> Dict[str, Any]:
+        """Score past analyses again with new category weights.
+        
+        Args:
+            weights: Weight of each score category
+            repo, author, since, until: Optional filters
+        
+        Returns:
+            Dictionary with the loaded columns plus 'new_overall' and 'new_categories' arrays
+        """
+        columns = self.load_columns(repo, author, since, until)
+        overall, categories = calculate_scores(columns["counts"], weights, columns["penalties"])
+        columns["new_overall"] = overall
+        columns["new_categories"] = categories
+        return columns
+    
+    def trends(self, repo: Optional[str] = None, author: Optional[str] = None, since: Optional[float] = None,
+               until: Optional[float] = None, bucket: str = "day") -> List[Dict[str, Any]]:
+        """Aggregate scores and issue counts per period.
+        
+        Args:
+            repo, author, since, until: Optional filters
+            bucket: Period length, 'day' or 'week'
+        
+        Returns:
+            One dictionary per period with the number of analyses, the average
+            overall score and the issue count of every category
+        """
+        seconds = TREND_BUCKETS[bucket]
+        where, params = self._where(repo, author, since, until)
+        sums = ", ".join(f"SUM({category}_count)" for category in SCORE_CATEGORIES)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT CAST(created_at / ? AS INTEGER) AS period, COUNT(*), AVG(overall), {sums} "
+                f"FROM analyses{where} GROUP BY period ORDER BY period",
+                [seconds] + params
+            ).fetchall()
+        
+        return [
+            {
+                "period_start": row[0] * seconds,
+                "analyses": row[1],
+                "average_score": round(row[2], 2),
+                "issues": dict(zip(SCORE_CATEGORIES, row[3:]))
+            }
+            for row in rows
+        ]
+    
+    def top_files(self, repo: str, since: Optional[float] = None, until: Optional[float] = None,
+                  limit: int = 20) -> List[Dict[str, Any]]:
+        """Get the files with the most reported issues in a repository.
+        
+        Returns:
+            One dictionary per file with its issue count per category and in total
+        """
+        where, params = self._where(repo, None, since, until)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT f.file, f.category, SUM(f.count) FROM file_counts f "
+                f"JOIN (SELECT id FROM analyses{where}) a ON a.id = f.analysis_id "
+                "GROUP BY f.file, f.category",
+                params
+            ).fetchall()
+        
+        files: Dict[str, Dict[str, int]] = {}
+        for file_path, category, count in rows:
+            files.setdefault(file_path, {})[category] = count
+        ranked = sorted(files.items(), key=lambda item: -sum(item[1].values()))[:limit]
+        return [{"file": file_path, "total": sum(counts.values()), "issues": counts} for file_path, counts in ranked]
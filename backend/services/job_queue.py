@@ -0,0 +1,613 @@
+import importlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Any, Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_QUEUE_PATH = "analysis_jobs.db"
+DEFAULT_VISIBILITY_TIMEOUT = 120
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Tenant of jobs enqueued without one
+DEFAULT_TENANT = "default"
+
+
+def parse_tenant_weights(value: str) -> Dict[str, float]:
+    """Parse 'tenant=weight' pairs separated by commas, e.g. 'acme/monorepo=0.5,payments=2'.
+    
+    Raises:
+        Exception: If a weight is not a positive number
+    """
+    weights = {}
+    for pair in value.split(","):
+        tenant, _, weight = pair.strip().rpartition("=")
+        if not tenant:
+            continue
+        try:
+            weights[tenant] = float(weight)
+        except ValueError:
+            raise Exception(f"Invalid weight for tenant {tenant}: {weight}")
+        # A weight of 0 would divide the tenant's virtual time into NULL and put it first forever
+        if not weights[tenant] > 0:
+            raise Exception(f"Weight of tenant {tenant} must be positive, got {weight}")
+    return weights
+
+
+class JobQueue:
+    """Interface of a durable analysis job queue shared by API and worker processes.
+    
+    A claimed job is leased to one worker until its visibility timeout
+    expires. Workers extend the lease with :meth:`heartbeat`; jobs whose lease
+    expires (the worker crashed or hung) become claimable again until they
+    have been attempted ``max_attempts`` times.
+    
+    Jobs belong to a tenant (a repository unless the request names one) and
+    are claimed with weighted fair queuing across tenants, so one tenant's
+    backlog does not hold up the others. A worker may :meth:`split` a large
+    job into shard tasks that other workers claim; the worker finishing the
+    last shard merges their results into the job's own.
+    
+    External brokers are plugged in by subclassing and pointing
+    JOB_QUEUE_BACKEND at the class ('package.module:ClassName').
+    """
+    
+    def enqueue(self, job_id: str, payload: Dict[str, Any], pr_key: Optional[str] = None,
+                head_sha: Optional[str] = None, not_before: Optional[float] = None,
+                tenant: Optional[str] = None, batch_id: Optional[str] = None) -> None:
+        """Add a pending job.
+        
+        Args:
+            job_id: Job identifier
+            payload: AnalyzeRequest fields
+            pr_key: Pull request the job analyzes, for superseding (see ``supersede``)
+            head_sha: Head commit the job was scheduled for
+            not_before: Unix time before which the job is not claimed
+            tenant: Repository or team the job is scheduled fairly against others for
+            batch_id: Batch request the job belongs to (see ``batch``)
+        """
+        raise NotImplementedError
+    
+    def batch(self, batch_id: str) -> List[Dict[str, Any]]:
+        """Get 'job_id', 'payload' and 'status' of every job of a batch in the order they were enqueued."""
+        raise NotImplementedError
+    
+    def supersede(self, pr_key: str, head_sha: Optional[str]) -> List[str]:
+        """Cancel the pending and running jobs of a pull request scheduled for another head commit.
+        
+        Args:
+            pr_key: Pull request key
+            head_sha: Current head commit, or None to cancel every job of the pull request
+        
+        Returns:
+            Ids of the cancelled jobs
+        """
+        raise NotImplementedError
+    
+    def latest_for(self, pr_key: str) -> Optional[Dict[str, Any]]:
+        """Get 'job_id', 'head_sha' and 'status' of the newest job of a pull request."""
+        raise NotImplementedError
+    
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Lease the oldest pending job of the tenant that has been served least to a worker.
+        
+        Returns:
+            Dictionary with 'job_id', 'payload', 'attempts', 'parent_id' (set
+            for shard tasks) and 'shards' (number of shards of a split job
+            whose merge must be redone), or None if no job is pending
+        """
+        raise NotImplementedError
+    
+    def split(self, job_id: str, worker_id: str, payloads: List[Dict[str, Any]]) -> List[str]:
+        """Replace a running job by shard tasks; the job waits until the worker finishing the last one merges them.
+        
+        Args:
+            job_id: Job the worker holds the lease of
+            worker_id: Worker splitting the job
+            payloads: Payload of each shard task
+        
+        Returns:
+            Ids of the shard tasks, or an empty list if the worker no longer owns the job
+        """
+        raise NotImplementedError
+    
+    def finish_shard(self, job_id: str, worker_id: str, result: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Store a shard task's result and, if it was the last shard, lease its job to the worker.
+        
+        Returns:
+            Results of every shard in order when the worker must now merge
+            them and complete the job, otherwise None
+        """
+        raise NotImplementedError
+    
+    def shard_results(self, job_id: str) -> List[Dict[str, Any]]:
+        """Get the results of a split job's shards in order."""
+        raise NotImplementedError
+    
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Extend a job's lease.
+        
+        Returns:
+            False if the worker no longer owns the job
+        """
+        raise NotImplementedError
+    
+    def complete(self, job_id: str, worker_id: str, result: Dict[str, Any]) -> bool:
+        """Store a job's result. Returns False if the worker no longer owns the job."""
+        raise NotImplementedError
+    
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        """Mark a job as failed. Returns False if the worker no longer owns the job."""
+        raise NotImplementedError
+    
+    def depth(self) -> int:
+        """Get the number of pending jobs."""
+        raise NotImplementedError
+    
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a pending or running job.
+        
+        The worker running the job notices the cancellation on its next lease
+        check and stops. Returns False if the job does not exist or has finished.
+        """
+        raise NotImplementedError
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job's status, result and error, or None if it does not exist."""
+        raise NotImplementedError
+    
+    def worker_heartbeat(self, worker_id: str, info: Dict[str, Any]) -> None:
+        """Record that a worker process is alive."""
+        raise NotImplementedError
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get job counts per status, the workers seen recently and the tenants with pending jobs."""
+        raise NotImplementedError
+
+
+class SQLiteJobQueue(JobQueue):
+    """Job queue stored in a SQLite database, usable by processes on one machine."""
+    
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        visibility_timeout: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+        tenant_weights: Optional[Dict[str, float]] = None
+    ):
+        """Initialize the queue and create its tables.
+        
+        Args:
+            path: Database file (JOB_QUEUE_PATH)
+            visibility_timeout: Seconds a claimed job stays leased without a heartbeat
+                (JOB_VISIBILITY_TIMEOUT)
+            max_attempts: Claims allowed before a job whose worker keeps dying fails
+                (JOB_MAX_ATTEMPTS)
+            tenant_weights: Share of the workers each tenant gets relative to
+                others, 1 when not listed (TENANT_WEIGHTS)
+        """
+        self.path = path or os.getenv("JOB_QUEUE_PATH", DEFAULT_QUEUE_PATH)
+        if visibility_timeout is None:
+            visibility_timeout = float(os.getenv("JOB_VISIBILITY_TIMEOUT", DEFAULT_VISIBILITY_TIMEOUT))
+        if max_attempts is None:
+            max_attempts = int(os.getenv("JOB_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        if tenant_weights is None:
+            tenant_weights = parse_tenant_weights(os.getenv("TENANT_WEIGHTS", ""))
+        self.tenant_weights = tenant_weights
+        
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    worker_id TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_expires REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            # Columns added after the first release of the queue
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in (
+                ("pr_key", "TEXT"), ("head_sha", "TEXT"), ("not_before", "REAL"),
+                ("tenant", "TEXT"), ("parent_id", "TEXT"), ("shard_index", "INTEGER"),
+                ("batch_id", "TEXT")
+            ):
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_pr_key ON jobs (pr_key, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_parent ON jobs (parent_id, shard_index)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id, created_at)")
+            # Work each tenant has been served, in claims divided by its weight ("virtual time")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tenants (
+                    tenant TEXT PRIMARY KEY,
+                    weight REAL NOT NULL,
+                    served REAL NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS workers (
+                    worker_id TEXT PRIMARY KEY,
+                    info TEXT,
+                    last_seen REAL NOT NULL
+                )
+            """)
+    
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection; one per call keeps the queue safe across threads and processes."""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+    
+    def enqueue(self, job_id: str, payload: Dict[str, Any], pr_key: Optional[str] = None,
+                head_sha: Optional[str] = None, not_before: Optional[float] = None,
+                tenant: Optional[str] = None, batch_id: Optional[str] = None) -> None:
+        """Add a pending job."""
+        tenant = tenant or DEFAULT_TENANT
+        weight = self.tenant_weights.get(tenant, 1.0)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # A tenant returning from idle starts at the virtual time of the busy
+                # tenants, instead of using the credit of its idle period to take over
+                virtual_time = conn.execute(
+                    "SELECT MIN(served / weight) FROM tenants WHERE tenant IN "
+                    "(SELECT tenant FROM jobs WHERE status IN ('pending', 'running'))"
+                ).fetchone()[0] or 0.0
+                conn.execute(
+                    "INSERT INTO tenants (tenant, weight, served) VALUES (?, ?, ?) "
+                    "ON CONFLICT(tenant) DO UPDATE SET weight = excluded.weight, "
+                    "served = MAX(served, excluded.served)",
+                    (tenant, weight, virtual_time * weight)
+                )
+                conn.execute(
+                    "INSERT INTO jobs (job_id, payload, status, pr_key, head_sha, not_before, tenant, batch_id, "
+                    "created_at, updated_at) VALUES (?, ?, 'pending', ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, json.dumps(payload), pr_key, head_sha, not_before, tenant, batch_id, now, now)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    
+    def batch(self, batch_id: str) -> List[Dict[str, Any]]:
+        """Get 'job_id', 'payload' and 'status' of every job of a batch; split jobs report 'running'."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT job_id, payload, status FROM jobs WHERE batch_id = ? ORDER BY created_at, rowid",
+                (batch_id,)
+            ).fetchall()
+        return [
+            {
+                "job_id": row["job_id"],
+                "payload": json.loads(row["payload"]),
+                "status": "running" if row["status"] == "sharded" else row["status"]
+            }
+            for row in rows
+        ]
+    
+    def supersede(self, pr_key: str, head_sha: Optional[str]) -> List[str]:
+        """Cancel the pending and running jobs of a pull request scheduled for another head commit."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT job_id FROM jobs WHERE pr_key = ? AND parent_id IS NULL "
+                    "AND status IN ('pending', 'running', 'sharded') AND (? IS NULL OR head_sha IS NOT ?)",
+                    (pr_key, head_sha, head_sha)
+                ).fetchall()
+                job_ids = [row["job_id"] for row in rows]
+                for job_id in job_ids:
+                    self._cancel(conn, job_id)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return job_ids
+    
+    def latest_for(self, pr_key: str) -> Optional[Dict[str, Any]]:
+        """Get 'job_id', 'head_sha' and 'status' of the newest job of a pull request."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT job_id, head_sha, status FROM jobs WHERE pr_key = ? AND parent_id IS NULL "
+                "ORDER BY created_at DESC LIMIT 1",
+                (pr_key,)
+            ).fetchone()
+        return dict(row) if row else None
+    
+    def _cancel(self, conn: sqlite3.Connection, job_id: str) -> bool:
+        """Cancel a pending, running or split job and the shard tasks of a split job."""
+        now = time.time()
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'cancelled', worker_id = NULL, updated_at = ? "
+            "WHERE job_id = ? AND status IN ('pending', 'running', 'sharded')",
+            (now, job_id)
+        )
+        conn.execute(
+            "UPDATE jobs SET status = 'cancelled', worker_id = NULL, updated_at = ? "
+            "WHERE parent_id = ? AND status IN ('pending', 'running')",
+            (now, job_id)
+        )
+        return cursor.rowcount == 1
+    
+    def _fail_split_jobs(self, conn: sqlite3.Connection, now: float) -> None:
+        """Fail split jobs one of whose shards failed, and cancel their other shards."""
+        rows = conn.execute(
+            "SELECT parent.job_id, shard.shard_index, shard.error FROM jobs AS parent "
+            "JOIN jobs AS shard ON shard.parent_id = parent.job_id "
+            "WHERE parent.status = 'sharded' AND shard.status = 'failed'"
+        ).fetchall()
+        for row in rows:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? "
+                "WHERE job_id = ? AND status = 'sharded'",
+                (f"Shard {row['shard_index']} failed: {row['error']}", now, row["job_id"])
+            )
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', worker_id = NULL, updated_at = ? "
+                "WHERE parent_id = ? AND status IN ('pending', 'running')",
+                (now, row["job_id"])
+            )
+    
+    def _expire_leases(self, conn: sqlite3.Connection, now: float) -> None:
+        """Return jobs whose lease expired to the queue, or fail them after too many attempts."""
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = 'Worker lost while processing job', "
+            "worker_id = NULL, updated_at = ? "
+            "WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+            (now, now, self.max_attempts)
+        )
+        conn.execute(
+            "UPDATE jobs SET status = 'pending', worker_id = NULL, updated_at = ? "
+            "WHERE status = 'running' AND lease_expires < ?",
+            (now, now)
+        )
+        self._fail_split_jobs(conn, now)
+    
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Lease the oldest pending job of the tenant that has been served least to a worker.
+        
+        Every claim adds one unit of work to its tenant's virtual time; a
+        huge pull request is split into shards of bounded size, so it pays
+        per shard and small jobs of other tenants are claimed in between.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            # IMMEDIATE takes the write lock up front so two workers never claim the same job
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._expire_leases(conn, now)
+                row = conn.execute(
+                    "SELECT jobs.job_id, jobs.payload, jobs.attempts, jobs.tenant, jobs.parent_id, "
+                    "(SELECT COUNT(*) FROM jobs AS shard WHERE shard.parent_id = jobs.job_id) AS shards "
+                    "FROM jobs LEFT JOIN tenants ON tenants.tenant = jobs.tenant "
+                    "WHERE jobs.status = 'pending' AND (jobs.not_before IS NULL OR jobs.not_before <= ?) "
+                    "ORDER BY COALESCE(tenants.served / tenants.weight, 0), jobs.created_at, jobs.shard_index "
+                    "LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker_id = ?, attempts = attempts + 1, "
+                    "lease_expires = ?, updated_at = ? WHERE job_id = ?",
+                    (worker_id, now + self.visibility_timeout, now, row["job_id"])
+                )
+                conn.execute("UPDATE tenants SET served = served + 1 WHERE tenant = ?", (row["tenant"],))
+                conn.execute("COMMIT")
+                return {
+                    "job_id": row["job_id"],
+                    "payload": json.loads(row["payload"]),
+                    "attempts": row["attempts"] + 1,
+                    "parent_id": row["parent_id"],
+                    "shards": row["shards"]
+                }
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    
+    def split(self, job_id: str, worker_id: str, payloads: List[Dict[str, Any]]) -> List[str]:
+        """Replace a running job by shard tasks; the job waits until the worker finishing the last one merges them."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                job = conn.execute(
+                    "SELECT tenant, pr_key, head_sha, created_at FROM jobs "
+                    "WHERE job_id = ? AND worker_id = ? AND status = 'running'",
+                    (job_id, worker_id)
+                ).fetchone()
+                if job is None:
+                    conn.execute("ROLLBACK")
+                    return []
+                shard_ids = [f"{job_id}-shard-{index}" for index in range(len(payloads))]
+                # Shards keep the job's place in its tenant's queue
+                conn.executemany(
+                    "INSERT INTO jobs (job_id, payload, status, pr_key, head_sha, tenant, parent_id, shard_index, "
+                    "created_at, updated_at) VALUES (?, ?, 'pending', ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (shard_id, json.dumps(payload), job["pr_key"], job["head_sha"], job["tenant"],
+                         job_id, index, job["created_at"], now)
+                        for index, (shard_id, payload) in enumerate(zip(shard_ids, payloads))
+                    ]
+                )
+                conn.execute(
+                    "UPDATE jobs SET status = 'sharded', worker_id = NULL, lease_expires = NULL, updated_at = ? "
+                    "WHERE job_id = ?",
+                    (now, job_id)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return shard_ids
+    
+    def finish_shard(self, job_id: str, worker_id: str, result: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Store a shard task's result and, if it was the last shard, lease its job to the worker."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = 'completed', result = ?, worker_id = NULL, updated_at = ? "
+                    "WHERE job_id = ? AND worker_id = ? AND status = 'running'",
+                    (json.dumps(result), now, job_id, worker_id)
+                )
+                parent_id = conn.execute("SELECT parent_id FROM jobs WHERE job_id = ?", (job_id,)).fetchone()[0]
+                # Only one worker sees its job's last shard complete, inside this transaction
+                merging = cursor.rowcount == 1 and conn.execute(
+                    "UPDATE jobs SET status = 'running', worker_id = ?, lease_expires = ?, updated_at = ? "
+                    "WHERE job_id = ? AND status = 'sharded' AND NOT EXISTS "
+                    "(SELECT 1 FROM jobs WHERE parent_id = ? AND status != 'completed')",
+                    (worker_id, now + self.visibility_timeout, now, parent_id, parent_id)
+                ).rowcount == 1
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return self.shard_results(parent_id) if merging else None
+    
+    def shard_results(self, job_id: str) -> List[Dict[str, Any]]:
+        """Get the results of a split job's shards in order."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT result FROM jobs WHERE parent_id = ? ORDER BY shard_index", (job_id,)
+            ).fetchall()
+        return [json.loads(row["result"]) for row in rows if row["result"]]
+    
+    def _update_owned(self, job_id: str, worker_id: str, assignments: str, params: tuple) -> bool:
+        """Update a running job only if the worker still holds its lease."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments}, updated_at = ? "
+                "WHERE job_id = ? AND worker_id = ? AND status = 'running'",
+                params + (time.time(), job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+    
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Extend a job's lease."""
+        return self._update_owned(
+            job_id, worker_id, "lease_expires = ?", (time.time() + self.visibility_timeout,)
+        )
+    
+    def complete(self, job_id: str, worker_id: str, result: Dict[str, Any]) -> bool:
+        """Store a job's result."""
+        return self._update_owned(
+            job_id, worker_id, "status = 'completed', result = ?, worker_id = NULL", (json.dumps(result),)
+        )
+    
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        """Mark a job as failed, and the job a failed shard task belongs to."""
+        failed = self._update_owned(
+            job_id, worker_id, "status = 'failed', error = ?, worker_id = NULL", (error,)
+        )
+        if failed:
+            with self._connect() as conn:
+                self._fail_split_jobs(conn, time.time())
+        return failed
+    
+    def depth(self) -> int:
+        """Get the number of pending jobs."""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'pending'").fetchone()[0]
+    
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a pending or running job, with its shard tasks if it was split."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cancelled = self._cancel(conn, job_id)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return cancelled
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job's status, result and error; split jobs report 'running' with their shard progress."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT status, result, error, attempts FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            job = {
+                "status": row["status"],
+                "result": json.loads(row["result"]) if row["result"] else None,
+                "error": row["error"],
+                "attempts": row["attempts"]
+            }
+            if row["status"] == "sharded":
+                progress = conn.execute(
+                    "SELECT COUNT(*) AS total, SUM(status = 'completed') AS completed FROM jobs WHERE parent_id = ?",
+                    (job_id,)
+                ).fetchone()
+                job["status"] = "running"
+                job["shards"] = {"total": progress["total"], "completed": progress["completed"] or 0}
+        return job
+    
+    def worker_heartbeat(self, worker_id: str, info: Dict[str, Any]) -> None:
+        """Record that a worker process is alive."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO workers (worker_id, info, last_seen) VALUES (?, ?, ?) "
+                "ON CONFLICT(worker_id) DO UPDATE SET info = excluded.info, last_seen = excluded.last_seen",
+                (worker_id, json.dumps(info), time.time())
+            )
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get job counts per status, the workers seen within one visibility timeout and the busy tenants."""
+        with self._connect() as conn:
+            counts = {
+                row["status"]: row["count"]
+                for row in conn.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status")
+            }
+            workers: List[Dict[str, Any]] = [
+                {"worker_id": row["worker_id"], "last_seen": row["last_seen"], **json.loads(row["info"] or "{}")}
+                for row in conn.execute(
+                    "SELECT worker_id, info, last_seen FROM workers WHERE last_seen > ?",
+                    (time.time() - self.visibility_timeout,)
+                )
+            ]
+            tenants = [
+                dict(row)
+                for row in conn.execute(
+                    "SELECT tenants.tenant, weight, served, COUNT(*) AS pending FROM tenants "
+                    "JOIN jobs ON jobs.tenant = tenants.tenant AND jobs.status = 'pending' "
+                    "GROUP BY tenants.tenant ORDER BY served / weight"
+                )
+            ]
+        return {"jobs": counts, "workers": workers, "tenants": tenants}
+
+
+def get_job_queue() -> JobQueue:
+    """Create the job queue configured by JOB_QUEUE_BACKEND (SQLite by default)."""
+    backend = os.getenv("JOB_QUEUE_BACKEND", "")
+    if not backend or backend == "sqlite":
+        return SQLiteJobQueue()
+    
+    module_name, _, class_name = backend.partition(":")
+    queue_class = getattr(importlib.import_module(module_name), class_name)
+    return queue_class()
@@ -0,0 +1,487 @@
+import base64
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Any, Optional, Set, Tuple, TypeVar
+
+from dotenv import load_dotenv
+
+from utils.content_policy import ContentPolicy, STREAM_CHUNK_BYTES
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_REMOTE_URL = "https://github.com/{repo}.git"
+DEFAULT_HEAD_REF = "refs/pull/{pr_number}/head"
+DEFAULT_BASE_REF = "refs/heads/{base_branch}"
+DEFAULT_DISK_BUDGET_MB = 2048
+# Seconds a git command may run before it is killed
+DEFAULT_GIT_TIMEOUT = 600
+# Seconds the fetched head and base of a PR are reused before they are fetched again
+DEFAULT_REFS_TTL = 30
+
+T = TypeVar("T")
+
+
+class CatFileReader:
+    """Long-lived ``git cat-file --batch`` process for reading blobs from one repository."""
+    
+    def __init__(self, git_dir: str):
+        """Start the cat-file process.
+        
+        Args:
+            git_dir: Path to the bare repository
+        """
+        self.process = subprocess.Popen(
+            ['git', '--git-dir', git_dir, 'cat-file', '--batch'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        self.lock = threading.Lock()
+    
+    def read(self, object_name: str) -> Optional[bytes]:
+        """Read an object's raw content.
+        
+        Args:
+            object_name: Any object name git understands, e.g. '<sha>:path/to/file.py'
+            
+        Returns:
+            Object content, or None if the object does not exist
+        """
+        return self.read_with(object_name, lambda chunks, size: b''.join(chunks))
+    
+    def read_with(self, object_name: str, consume: Callable[[Iterator[bytes], int], T]) -> Optional[T]:
+        """Stream an object's content into a consumer.
+        
+        Args:
+            object_name: Any object name git understands, e.g. '<sha>:path/to/file.py'
+            consume: Called with an iterator of content chunks and the object size;
+                any content it leaves unread is discarded
+            
+        Returns:
+            Result of ``consume``, or None if the object does not exist
+        """
+        with self.lock:
+            self.process.stdin.write(object_name.encode('utf-8') + b'\n')
+            self.process.stdin.flush()
+            
+            # Header is '<sha> <type> <size>' or '<name> missing'
+            header = self.process.stdout.readline()
+            if not header:
+                raise RuntimeError("git cat-file process exited unexpectedly")
+            parts = header.split()
+            if len(parts) != 3:
+                return None
+            
+            size = int(parts[2])
+            remaining = [size]
+            
+            def chunks() -> Iterator[bytes]:
+                while remaining[0] > 0:
+                    chunk = self.process.stdout.read(min(STREAM_CHUNK_BYTES, remaining[0]))
+                    if not chunk:
+                        raise RuntimeError("git cat-file process exited unexpectedly")
+                    remaining[0] -= len(chunk)
+                    yield chunk
+            
+            try:
+                return consume(chunks(), size)
+            finally:
+                # Drain unread content so the next request starts at a header
+                for _ in chunks():
+                    pass
+                self.process.stdout.read(1)  # Trailing newline after the content
+    
+    def close(self) -> None:
+        """Stop the cat-file process."""
+        with self.lock:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except Exception:
+                self.process.kill()
+
+
+class MirrorService:
+    """Service that reads pull request contents from local bare mirror repositories.
+    
+    Only the PR head and base refs are fetched (incrementally, after the first
+    time), and blobs are read through one ``git cat-file --batch`` process per
+    mirror, so no provider API calls are made for file contents. Mirrors are
+    evicted least-recently-used first once the cache exceeds its disk budget,
+    except while a job is reading them.
+    """
+    
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        remote_url: Optional[str] = None,
+        head_ref: Optional[str] = None,
+        base_ref: Optional[str] = None,
+        disk_budget_mb: Optional[int] = None,
+        base_branch_lookup: Optional[Callable[[str, int], str]] = None
+    ):
+        """Initialize the mirror service from arguments or environment variables.
+        
+        Args:
+            cache_dir: Directory holding the bare mirrors (MIRROR_CACHE_DIR)
+            remote_url: Remote URL template with a '{repo}' placeholder (MIRROR_REMOTE_URL)
+            head_ref: Remote ref template for the PR head, with a '{pr_number}'
+                placeholder (MIRROR_HEAD_REF)
+            base_ref: Remote ref template the PR is compared against, with
+                '{pr_number}' and '{base_branch}' placeholders (MIRROR_BASE_REF)
+            disk_budget_mb: Total size allowed for all mirrors (MIRROR_DISK_BUDGET_MB)
+            base_branch_lookup: Called with the repository and PR number to get the
+                name of the branch the PR targets, for the '{base_branch}' placeholder
+        """
+        self.cache_dir = cache_dir or os.getenv(
+            "MIRROR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "pr-review-mirrors")
+        )
+        self.remote_url = remote_url or os.getenv("MIRROR_REMOTE_URL", DEFAULT_REMOTE_URL)
+        self.head_ref = head_ref or os.getenv("MIRROR_HEAD_REF", DEFAULT_HEAD_REF)
+        self.base_ref = base_ref or os.getenv("MIRROR_BASE_REF", DEFAULT_BASE_REF)
+        if disk_budget_mb is None:
+            disk_budget_mb = int(os.getenv("MIRROR_DISK_BUDGET_MB", DEFAULT_DISK_BUDGET_MB))
+        self.disk_budget = disk_budget_mb * 1024 * 1024
+        self.base_branch_lookup = base_branch_lookup
+        self.token = os.getenv("MIRROR_TOKEN") or os.getenv("GITHUB_TOKEN")
+        self.git_timeout = int(os.getenv("MIRROR_GIT_TIMEOUT", DEFAULT_GIT_TIMEOUT))
+        self.refs_ttl = float(os.getenv("MIRROR_REFS_TTL", DEFAULT_REFS_TTL))
+        
+        os.makedirs(self.cache_dir, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        # Signalled when a mirror stops being read or evicted
+        self._released = threading.Condition(self._lock)
+        self._repo_locks: Dict[str, threading.Lock] = {}
+        self._readers: Dict[str, CatFileReader] = {}
+        # Number of ongoing reads of each mirror, which keep it from being evicted
+        self._leases: Dict[str, int] = {}
+        self._evicting: Set[str] = set()
+        # (repo, PR number) -> (time fetched, (base SHA, head SHA))
+        self._refs: Dict[Tuple[str, int], Tuple[float, Tuple[str, str]]] = {}
+    
+    def _mirror_path(self, repo_name: str) -> str:
+        """Get the local path of a repository's mirror."""
+        return os.path.join(self.cache_dir, repo_name.replace('/', '__') + '.git')
+    
+    def _repo_lock(self, repo_name: str) -> threading.Lock:
+        """Get the lock serializing fetches and eviction for one mirror."""
+        with self._lock:
+            return self._repo_locks.setdefault(repo_name, threading.Lock())
+    
+    @contextmanager
+    def _lease(self, repo_name: str) -> Iterator[None]:
+        """Keep a mirror from being evicted while it is read, waiting out an ongoing eviction."""
+        with self._released:
+            while repo_name in self._evicting:
+                self._released.wait()
+            self._leases[repo_name] = self._leases.get(repo_name, 0) + 1
+        try:
+            yield
+        finally:
+            with self._released:
+                self._leases[repo_name] -= 1
+                if not self._leases[repo_name]:
+                    del self._leases[repo_name]
+                self._released.notify_all()
+    
+    def _git(self, git_dir: str, *args: str) -> str:
+        """Run a git command against a mirror and return its output."""
+        env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+        remote_url = self.remote_url.format(repo='')
+        if self.token and remote_url.startswith('https://'):
+            # Passed through the environment so the token does not show up in process listings
+            credentials = base64.b64encode(f"x-access-token:{self.token}".encode()).decode()
+            env.update({
+                'GIT_CONFIG_COUNT': '1',
+                'GIT_CONFIG_KEY_0': 'http.extraHeader',
+                'GIT_CONFIG_VALUE_0': f"Authorization: Basic {credentials}"
+            })
+        result = subprocess.run(
+            ['git', '--git-dir', git_dir] + list(args),
+            capture_output=True,
+            check=True,
+            env=env,
+            timeout=self.git_timeout
+        )
+        return result.stdout.decode('utf-8')
+    
+    def _get_reader(self, repo_name: str) -> CatFileReader:
+        """Get (or start) the cat-file reader for a mirror."""
+        with self._lock:
+            reader = self._readers.get(repo_name)
+            if reader is None or reader.process.poll() is not None:
+                reader = CatFileReader(self._mirror_path(repo_name))
+                self._readers[repo_name] = reader
+            return reader
+    
+    def _remote_base_ref(self, repo_name: str, pr_number: int) -> str:
+        """Get the remote ref of the branch a PR targets."""
+        base_branch = ''
+        if '{base_branch}' in self.base_ref:
+            if self.base_branch_lookup is None:
+                raise Exception(f"No base branch lookup configured for MIRROR_BASE_REF {self.base_ref}")
+            base_branch = self.base_branch_lookup(repo_name, pr_number)
+        return self.base_ref.format(pr_number=pr_number, base_branch=base_branch)
+    
+    def fetch_refs(self, repo_name: str, pr_number: int) -> Tuple[str, str]:
+        """Fetch the PR head and base refs into the mirror.
+        
+        Refs fetched within the last ``refs_ttl`` seconds are reused, so the
+        calls of one job fetch once.
+        
+        Args:
+            repo_name: Repository name in format 'username/repo'
+            pr_number: Pull request number
+        
+        Returns:
+            Tuple of (base commit SHA, head commit SHA)
+        """
+        key = (repo_name, pr_number)
+        git_dir = self._mirror_path(repo_name)
+        local_head = f"refs/pr/{pr_number}/head"
+        local_base = f"refs/pr/{pr_number}/base"
+        
+        with self._repo_lock(repo_name):
+            # Checked under the lock so concurrent calls wait for one fetch
+            with self._lock:
+                cached = self._refs.get(key)
+            if cached is not None and time.monotonic() - cached[0] < self.refs_ttl and os.path.isdir(git_dir):
+                return cached[1]
+            
+            base_ref = self._remote_base_ref(repo_name, pr_number)
+            if not os.path.isdir(git_dir):
+                subprocess.run(
+                    ['git', 'init', '--bare', '--quiet', git_dir],
+                    check=True,
+                    timeout=self.git_timeout
+                )
+            
+            self._git(
+                git_dir, 'fetch', '--quiet', '--no-tags',
+                self.remote_url.format(repo=repo_name),
+                f"+{self.head_ref.format(pr_number=pr_number)}:{local_head}",
+                f"+{base_ref}:{local_base}"
+            )
+            head_sha = self._git(git_dir, 'rev-parse', local_head).strip()
+            base_sha = self._git(git_dir, 'merge-base', local_base, local_head).strip()
+            
+            # Mark the mirror as recently used for LRU eviction
+            os.utime(git_dir)
+            with self._lock:
+                self._refs[key] = (time.monotonic(), (base_sha, head_sha))
+        
+        self._enforce_disk_budget(keep=repo_name)
+        return base_sha, head_sha
+    
+    def get_pr_files(self, repo_name: str, pr_number: int) -> List[Dict[str, Any]]:
+        """Get files changed in a pull request.
+        
+        Args:
+            repo_name: Repository name in format 'username/repo'
+            pr_number: Pull request number
+        
+        Returns:
+            List of file data dictionaries
+        """
+        with self._lease(repo_name):
+            base_sha, head_sha = self.fetch_refs(repo_name, pr_number)
+            git_dir = self._mirror_path(repo_name)
+            commit_range = f"{base_sha}..{head_sha}"
+            numstat = self._git(git_dir, 'diff', '--numstat', '-z', '--no-renames', commit_range)
+            name_status = self._git(git_dir, 'diff', '--name-status', '-z', '--no-renames', commit_range).split('\0')
+        status_map = {'A': 'added', 'D': 'removed', 'M': 'modified'}
+        statuses = {
+            name_status[i + 1]: status_map.get(name_status[i][:1], 'modified')
+            for i in range(0, len(name_status) - 1, 2)
+        }
+        
+        files = []
+        for entry in numstat.split('\0'):
+            if not entry:
+                continue
+            additions, deletions, filename = entry.split('\t', 2)
+            # Binary files report '-' for both counts
+            additions = int(additions) if additions != '-' else 0
+            deletions = int(deletions) if deletions != '-' else 0
+            files.append({
+                "filename": filename,
+                "status": statuses.get(filename, 'modified'),
+                "additions": additions,
+                "deletions": deletions,
+                "changes": additions + deletions
+            })
+        
+        return files
+    
+    def get_file_content(self, repo_name: str, file_path: str, ref: str) -> Optional[str]:
+        """Get content of a file at a specific reference in the mirror.
+        
+        Args:
+            repo_name: Repository name in format 'username/repo'
+            file_path: Path to the file in the repository
+            ref: Commit SHA or local ref name
+        
+        Returns:
+            File content as string, or None if the file does not exist
+        """
+        with self._lease(repo_name):
+            data = self._get_reader(repo_name).read(f"{ref}:{file_path}")
+        if data is None:
+            return None
+        return data.decode('utf-8')
+    
+    def read_file_content(self, repo_name: str, file_path: str, ref: str,
+                          content_policy: ContentPolicy) -> Optional[str]:
+        """Stream the content of a file in the mirror through a content policy.
+        
+        Args:
+            repo_name: Repository name in format 'username/repo'
+            file_path: Path to the file in the repository
+            ref: Commit SHA or local ref name
+            content_policy: Policy deciding how much of the file is kept
+        
+        Returns:
+            File content as string, or None if missing or skipped by the policy
+        """
+        with self._lease(repo_name):
+            return self._get_reader(repo_name).read_with(
+                f"{ref}:{file_path}",
+                lambda chunks, size: content_policy.read(file_path, chunks, size)
+            )
+    
+    def iter_pr_files_content(self, repo_name: str, pr_number: int,
+                              content_policy: Optional[ContentPolicy] = None) -> Iterator[Tuple[str, str]]:
+        """Stream the content of all files changed in a pull request.
+        
+        Args:
+            repo_name: Repository name in format 'username/repo'
+            pr_number: Pull request number
+            content_policy: Size and memory policy (defaults to one built from the environment)
+        
+        Yields:
+            (file path, content) tuples
+        """
+        if content_policy is None:
+            content_policy = ContentPolicy()
+        
+        # Held until the last file is read, so the mirror is not evicted between files
+        with self._lease(repo_name):
+            base_sha, head_sha = self.fetch_refs(repo_name, pr_number)
+            changed_files = self._git(
+                self._mirror_path(repo_name), 'diff', '--name-only', '-z', '--no-renames',
+                '--diff-filter=d', f"{base_sha}..{head_sha}"
+            ).split('\0')
+            
+            for filename in changed_files:
+                if not filename:
+                    continue
+                try:
+                    content = self.read_file_content(repo_name, filename, head_sha, content_policy)
+                except Exception as e:
+                    # Log error and continue with next file
+                    print(f"Error getting content for {filename}: {e}")
+                    continue
+                if content is not None:
+                    yield filename, content
+    
+    def get_pr_files_content(self, repo_name: str, pr_number: int,
+                             content_policy: Optional[ContentPolicy] = None) -> Dict[str, str]:
+        """Get content of all files changed in a pull request (see ``iter_pr_files_content``)."""
+        return dict(self.iter_pr_files_content(repo_name, pr_number, content_policy))
+    
+    def get_base_sha(self, repo_name: str, pr_number: int) -> str:
+        """Get the merge base of a pull request's head and base refs."""
+        base_sha, _ = self.fetch_refs(repo_name, pr_number)
+        return base_sha
+    
+    def get_pr_head(self, repo_name: str, pr_number: int) -> Tuple[str, str]:
+        """Get the mirror to read a pull request's files from and its head commit SHA."""
+        _, head_sha = self.fetch_refs(repo_name, pr_number)
+        return repo_name, head_sha
+    
+    def get_files_content_at(self, repo_name: str, file_paths: List[str], ref: str,
+                             content_policy: ContentPolicy) -> Dict[str, str]:
+        """Get content of several files at a commit, skipping files that do not exist there."""
+        files_content = {}
+        with self._lease(repo_name):
+            for file_path in file_paths:
+                content = self.read_file_content(repo_name, file_path, ref, content_policy)
+                if content is not None:
+                    files_content[file_path] = content
+        return files_content
+    
+    def _enforce_disk_budget(self, keep: str) -> None:
+        """Evict least recently used mirrors until the cache fits its disk budget.
+        
+        Args:
+            keep: Repository whose mirror must not be evicted
+        """
+        mirrors = []
+        total_size = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_dir() or not entry.name.endswith('.git'):
+                continue
+            size = _directory_size(entry.path)
+            total_size += size
+            mirrors.append((entry.stat().st_mtime, entry.name, size))
+        
+        keep_name = os.path.basename(self._mirror_path(keep))
+        for _, name, size in sorted(mirrors):
+            if total_size <= self.disk_budget:
+                break
+            if name == keep_name:
+                continue
+            
+            repo_name = name[:-len('.git')].replace('__', '/')
+            repo_lock = self._repo_lock(repo_name)
+            # Skip mirrors that are being fetched right now
+            if not repo_lock.acquire(blocking=False):
+                continue
+            try:
+                with self._lock:
+                    # Skip mirrors that are being read right now; new reads wait for the eviction
+                    if self._leases.get(repo_name):
+                        continue
+                    self._evicting.add(repo_name)
+                    reader = self._readers.pop(repo_name, None)
+                    for key in [key for key in self._refs if key[0] == repo_name]:
+                        del self._refs[key]
+                try:
+                    if reader is not None:
+                        reader.close()
+                    shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+                finally:
+                    with self._released:
+                        self._evicting.discard(repo_name)
+                        self._released.notify_all()
+                total_size -= size
+                print(f"Evicted mirror {repo_name} ({size} bytes) from cache")
+            finally:
+                repo_lock.release()
+    
+    def close(self) -> None:
+        """Stop all cat-file processes."""
+        with self._lock:
+            readers = list(self._readers.values())
+            self._readers.clear()
+        for reader in readers:
+            reader.close()
+
+
+def _directory_size(path: str) -> int:
+    """Get the total size of all files under a directory."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
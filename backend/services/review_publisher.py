@@ -0,0 +1,177 @@
+import hashlib
+import re
+from typing import Dict, List, Any, Optional, Tuple, Union
+
+from models.feedback_model import FileIssues, Issue, Score
+from utils.diff_positions import FileDiff, parse_patch
+
+# Hidden marker identifying comments posted by this service
+MARKER = "pr-review-agent"
+MARKER_PATTERN = re.compile(r'<!-- ' + MARKER + r':([0-9a-z]+) -->')
+SUMMARY_KEY = "summary"
+
+# Issues outside the diff listed in the summary comment
+MAX_SUMMARY_ISSUES = 50
+
+
+class ReviewPlan:
+    """Changes needed to bring a pull request's review comments up to date."""
+    
+    def __init__(self, comments: List[Dict[str, Any]], stale: List[Any], unchanged: int,
+                 outside_diff: int, summary: str, summary_id: Optional[Any]):
+        """Initialize the plan.
+        
+        Args:
+            comments: New inline comments with 'path', 'line' and 'body'
+            stale: Provider ids of previously posted comments whose issue is gone
+            unchanged: Previously posted comments that are still current
+            outside_diff: Issues on lines the provider cannot comment on
+            summary: Body of the summary comment
+            summary_id: Provider id of the previous summary comment, if any
+        """
+        self.comments = comments
+        self.stale = stale
+        self.unchanged = unchanged
+        self.outside_diff = outside_diff
+        self.summary = summary
+        self.summary_id = summary_id
+
+
+def fingerprint(file_path: str, issue: Issue, line_text: str) -> str:
+    """Identify an issue across runs, so the same finding is never posted twice.
+    
+    The line is identified by its text rather than its number, so an issue
+    whose line only moved (lines added or removed above it) keeps its key.
+    
+    Args:
+        file_path: Path of the file
+        issue: Issue found on the line
+        line_text: Text of the line in the new version of the file
+    
+    Returns:
+        Hex key embedded in the comment's marker
+    """
+    line_hash = hashlib.sha1(line_text.strip().encode('utf-8')).hexdigest()
+    key = f"{file_path}\0{issue.type}\0{issue.msg}\0{line_hash}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+def marker(key: str) -> str:
+    """Hidden marker embedded in a comment body."""
+    return f"<!-- {MARKER}:{key} -->"
+
+
+def parse_marker(body: str) -> Optional[str]:
+    """Get the key of a comment posted by this service, or None for other comments."""
+    match = MARKER_PATTERN.search(body or "")
+    return match.group(1) if match else None
+
+
+def _summary_body(score: Score, outside: List[tuple]) -> str:
+    """Format the summary comment with the score and the issues outside the diff."""
+    categories = score.categories.dict()
+    lines = [
+        f"**PR Review Agent score: {score.overall}/100**",
+        "",
+        " | ".join(f"{name.replace('_', ' ')}: {value}" for name, value in categories.items()),
+    ]
+    if outside:
+        lines += ["", "Issues outside the changed lines:", ""]
+        lines += [f"- `{path}:{issue.line}` {issue.msg}" for path, issue in outside[:MAX_SUMMARY_ISSUES]]
+        if len(outside) > MAX_SUMMARY_ISSUES:
+            lines.append(f"- ... and {len(outside) - MAX_SUMMARY_ISSUES} more")
+    lines += ["", marker(SUMMARY_KEY)]
+    return "\n".join(lines)
+
+
+def plan_review(feedback: List[FileIssues], score: Score, patches: Dict[str, Union[str, FileDiff]],
+                existing: List[Tuple[str, Any]]) -> ReviewPlan:
+    """Work out which comments to post, keep and remove.
+    
+    Args:
+        feedback: Issues per file from the analysis
+        score: Score of the analysis
+        patches: Unified diff hunks per changed file, or the file's already
+            parsed diff for providers that return the whole diff at once
+        existing: (marker key, provider id) of every comment previously posted
+            by this service (``SUMMARY_KEY`` for the summary comment)
+    
+    Returns:
+        Review plan for the provider to apply
+    """
+    # Keep one comment per key; duplicates left by concurrent runs are removed
+    posted: Dict[str, Any] = {}
+    stale = []
+    for key, comment_id in existing:
+        if key in posted:
+            stale.append(comment_id)
+        else:
+            posted[key] = comment_id
+    summary_id = posted.pop(SUMMARY_KEY, None)
+    comments = []
+    outside = []
+    current = set()
+    
+    for file_issues in feedback:
+        # Text of the lines shown in the diff, the only ones comments can go on
+        patch = patches.get(file_issues.file, "")
+        lines = (patch if isinstance(patch, FileDiff) else parse_patch(patch)).new_lines
+        for issue in file_issues.issues:
+            if issue.line not in lines:
+                outside.append((file_issues.file, issue))
+                continue
+            key = fingerprint(file_issues.file, issue, lines[issue.line])
+            if key in current:
+                continue
+            current.add(key)
+            if key in posted:
+                continue
+            comments.append({
+                "path": file_issues.file,
+                "line": issue.line,
+                "body": f"**{issue.type}**: {issue.msg}\n\n{marker(key)}"
+            })
+    
+    stale += [comment_id for key, comment_id in posted.items() if key not in current]
+    return ReviewPlan(
+        comments,
+        stale,
+        unchanged=len(current) - len(comments),
+        outside_diff=len(outside),
+        summary=_summary_body(score, outside),
+        summary_id=summary_id
+    )
+
+
+def publish_review(git_service: Any, repo: str, pr_number: int, feedback: List[FileIssues],
+                   score: Score, remove_stale: bool = True) -> Dict[str, int]:
+    """Publish an analysis as one review on the pull request.
+    
+    Comments this service posted earlier are matched by their marker: ones
+    still current are left alone, ones for fixed issues are removed, and
+    the summary comment is edited in place.
+    
+    Args:
+        git_service: Provider service with ``get_review_context`` and ``submit_review``
+        repo: Repository name
+        pr_number: Pull request number
+        feedback: Issues per file from the analysis
+        score: Score of the analysis
+        remove_stale: Whether comments for issues no longer reported are
+            removed; partial analyses keep them, as their checks may not have run
+    
+    Returns:
+        Dictionary with the number of 'created', 'unchanged' and 'removed'
+        comments and of issues 'outside_diff'
+    """
+    context = git_service.get_review_context(repo, pr_number)
+    plan = plan_review(feedback, score, context["patches"], context["comments"])
+    if not remove_stale:
+        plan.stale = []
+    git_service.submit_review(repo, pr_number, plan, context)
+    return {
+        "created": len(plan.comments),
+        "unchanged": plan.unchanged,
+        "removed": len(plan.stale),
+        "outside_diff": plan.outside_diff
+    }
@@ -0,0 +1,460 @@
+"""Record the provider and model traffic of analysis jobs, and replay it offline.
+
+With TRAFFIC_RECORD_DIR set, every job's provider calls (PR metadata, file
+lists, contents) and model replies are written to one compressed fixture
+archive per job. A fixture is replayed with no network, at its recorded
+latency, through the replay backends:
+    
+    GIT_SERVICE_BACKEND=services.traffic_capture:ReplayGitService
+    AI_BACKEND=services.traffic_capture:ReplayModelBackend
+    TRAFFIC_REPLAY_FILE=fixtures/github-acme_app-1234-1760000000.zip
+
+or as a repeatable benchmark of the recorded job:
+    
+    python -m services.traffic_capture fixtures/github-acme_app-1234-1760000000.zip --repeat 5
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import zipfile
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from analysis.ai_backends import ModelBackend
+from utils.content_policy import ContentPolicy
+
+# Load environment variables
+load_dotenv()
+
+# Strings at least this long are stored once per archive, however often they are returned
+BLOB_MIN_CHARS = 256
+
+# Provider methods whose results are recorded; other attributes pass through to the real service
+RECORDED_METHODS = (
+    "get_pr_files",
+    "iter_pr_files_content",
+    "get_pr_files_content",
+    "get_base_sha",
+    "get_pr_head",
+    "get_changed_file_count",
+    "get_files_content_at",
+    "get_pr_author",
+    "get_review_context"
+)
+
+# Methods returning a stream of (file path, content) items, recorded item by item
+STREAMING_METHODS = ("iter_pr_files_content",)
+
+# Methods returning a dictionary of file contents that pass through the job's content policy
+CONTENT_METHODS = ("get_pr_files_content", "get_files_content_at")
+
+
+def call_key(method: str, args: tuple, kwargs: Dict[str, Any]) -> str:
+    """Identify a call by its method and arguments, leaving out the job's content policy."""
+    args = [arg for arg in args if not isinstance(arg, ContentPolicy)]
+    kwargs = {name: value for name, value in kwargs.items() if not isinstance(value, ContentPolicy)}
+    return json.dumps([method, args, kwargs], sort_keys=True, default=str)
+
+
+def prompt_key(system: str, prompt: str) -> str:
+    """Identify a model request by a hash of its instructions and prompt."""
+    return hashlib.sha256(f"{system}\0{prompt}".encode('utf-8')).hexdigest()
+
+
+class TrafficArchive:
+    """Calls of one job, in call order per call key, with how long each took.
+    
+    Results are stored as JSON; long strings (file contents) are replaced
+    by references to blobs stored once each, and the archive is written as
+    an LZMA-compressed zip file.
+    """
+    
+    def __init__(self, meta: Optional[Dict[str, Any]] = None):
+        """Initialize an empty archive.
+        
+        Args:
+            meta: Description of the recorded job, e.g. its request
+        """
+        self.meta = meta or {}
+        self.calls: Dict[str, List[Dict[str, Any]]] = {}
+        self.blobs: Dict[str, str] = {}
+        self._served: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    def _pack(self, value: Any) -> Any:
+        """Replace long strings in a JSON-like value by blob references."""
+        if isinstance(value, str) and len(value) >= BLOB_MIN_CHARS:
+            digest = hashlib.sha1(value.encode('utf-8', 'surrogatepass')).hexdigest()
+            self.blobs.setdefault(digest, value)
+            return {"$blob": digest}
+        if isinstance(value, dict):
+            return {key: self._pack(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._pack(item) for item in value]
+        return value
+    
+    def _unpack(self, value: Any) -> Any:
+        """Resolve the blob references of a packed value."""
+        if isinstance(value, dict):
+            if set(value) == {"$blob"}:
+                return self.blobs[value["$blob"]]
+            return {key: self._unpack(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._unpack(item) for item in value]
+        return value
+    
+    def add(self, key: str, seconds: float, result: Any = None, error: Optional[str] = None,
+            items: Optional[List[Tuple[float, Any]]] = None) -> None:
+        """Record one call.
+        
+        Args:
+            key: Call key (see ``call_key`` and ``prompt_key``)
+            seconds: Time the call took, or until its stream started
+            result: Value the call returned
+            error: Message of the exception the call raised
+            items: (seconds since the previous item, item) of a streaming call
+        """
+        entry: Dict[str, Any] = {"seconds": round(seconds, 4)}
+        with self._lock:
+            if error is not None:
+                entry["error"] = error
+            if items is not None:
+                entry["items"] = [[round(delay, 4), self._pack(item)] for delay, item in items]
+            else:
+                entry["result"] = self._pack(result)
+            self.calls.setdefault(key, []).append(entry)
+    
+    def next_call(self, key: str) -> Dict[str, Any]:
+        """Get the recorded call answering the next call with a key.
+        
+        Repeated calls are answered in recorded order; calls beyond the
+        recorded ones get the last answer again.
+        
+        Raises:
+            Exception: If no call with the key was recorded
+        """
+        with self._lock:
+            entries = self.calls.get(key)
+            if not entries:
+                raise Exception(f"No recorded response for {key}")
+            index = self._served.get(key, 0)
+            self._served[key] = index + 1
+            entry = entries[min(index, len(entries) - 1)]
+        return {
+            **entry,
+            "result": self._unpack(entry.get("result")),
+            "items": [(delay, self._unpack(item)) for delay, item in entry.get("items") or []]
+        }
+    
+    def save(self, path: str) -> None:
+        """Write the archive as a compressed zip file."""
+        with self._lock, zipfile.ZipFile(path, "w", compression=zipfile.ZIP_LZMA) as archive:
+            archive.writestr("meta.json", json.dumps(self.meta, default=str))
+            archive.writestr("calls.json", json.dumps(self.calls))
+            for digest, content in self.blobs.items():
+                archive.writestr(f"blobs/{digest}", content.encode('utf-8', 'surrogatepass'))
+    
+    @classmethod
+    def load(cls, path: str) -> "TrafficArchive":
+        """Read an archive written by :meth:`save`."""
+        with zipfile.ZipFile(path) as archive:
+            traffic = cls(json.loads(archive.read("meta.json")))
+            traffic.calls = json.loads(archive.read("calls.json"))
+            for name in archive.namelist():
+                if name.startswith("blobs/"):
+                    traffic.blobs[name[len("blobs/"):]] = archive.read(name).decode('utf-8', 'surrogatepass')
+        return traffic
+
+
+class RecordingGitService:
+    """Provider service wrapper recording the results of ``RECORDED_METHODS`` into an archive."""
+    
+    def __init__(self, service: Any, archive: TrafficArchive):
+        """Initialize the wrapper.
+        
+        Args:
+            service: Provider service whose calls are recorded
+            archive: Archive the calls are added to
+        """
+        self._service = service
+        self._archive = archive
+    
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._service, name)
+        if name not in RECORDED_METHODS:
+            return attribute
+        if name in STREAMING_METHODS:
+            return lambda *args, **kwargs: self._record_stream(name, attribute, args, kwargs)
+        return lambda *args, **kwargs: self._record(name, attribute, args, kwargs)
+    
+    def _record(self, name: str, method: Callable, args: tuple, kwargs: Dict[str, Any]) -> Any:
+        """Call a method and record its result or error."""
+        key = call_key(name, args, kwargs)
+        started = time.monotonic()
+        try:
+            result = method(*args, **kwargs)
+        except Exception as e:
+            self._archive.add(key, time.monotonic() - started, error=str(e))
+            raise
+        self._archive.add(key, time.monotonic() - started, result=result)
+        return result
+    
+    def _record_stream(self, name: str, method: Callable, args: tuple, kwargs: Dict[str, Any]) -> Iterator[Any]:
+        """Call a streaming method and record every item with the time it took to arrive."""
+        key = call_key(name, args, kwargs)
+        started = time.monotonic()
+        last = started
+        items: List[Tuple[float, Any]] = []
+        error = None
+        try:
+            for item in method(*args, **kwargs):
+                now = time.monotonic()
+                items.append((now - last, item))
+                last = now
+                yield item
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            # Also recorded when the job stops reading early, with the items it read
+            self._archive.add(key, 0.0, error=error, items=items)
+
+
+class RecordingModelBackend(ModelBackend):
+    """Model backend wrapper recording every reply by a hash of its prompt."""
+    
+    def __init__(self, backend: ModelBackend, archive: TrafficArchive):
+        """Initialize the wrapper.
+        
+        Args:
+            backend: Model backend whose replies are recorded
+            archive: Archive the replies are added to
+        """
+        self.backend = backend
+        self.archive = archive
+    
+    def complete(self, system: str, prompt: str, max_tokens: int, timeout: float) -> str:
+        """Get the model's reply to a prompt, recording it."""
+        key = prompt_key(system, prompt)
+        started = time.monotonic()
+        try:
+            reply = self.backend.complete(system, prompt, max_tokens, timeout)
+        except Exception as e:
+            self.archive.add(key, time.monotonic() - started, error=str(e))
+            raise
+        self.archive.add(key, time.monotonic() - started, result=reply)
+        return reply
+
+
+class TrafficRecorder:
+    """Records one job's traffic and saves it as a fixture archive."""
+    
+    def __init__(self, request_dict: Dict[str, Any], name: str, shard: Optional[Dict[str, Any]] = None):
+        """Initialize the recorder.
+        
+        Args:
+            request_dict: AnalyzeRequest fields of the job, stored with its traffic
+            name: Name of the archive, e.g. the server, repository and PR number
+            shard: Shard of the PR the job analyzes, if any
+        """
+        self.name = re.sub(r'[^\w.-]+', '_', name)
+        self.archive = TrafficArchive({
+            "request": request_dict, "shard": shard, "recorded_at": time.time(), "ai": False
+        })
+    
+    def wrap_git_service(self, service: Any) -> RecordingGitService:
+        """Wrap the job's provider service."""
+        return RecordingGitService(service, self.archive)
+    
+    def wrap_model_backend(self, backend: ModelBackend) -> RecordingModelBackend:
+        """Wrap the model backend of the job's AI stage."""
+        self.archive.meta["ai"] = True
+        return RecordingModelBackend(backend, self.archive)
+    
+    def save(self, directory: str) -> Optional[str]:
+        """Write the archive into a directory, named after the job and the time.
+        
+        Returns:
+            Path of the archive, or None if it could not be written
+        """
+        suffix = f"-shard{self.archive.meta['shard']['index']}" if self.archive.meta["shard"] else ""
+        path = os.path.join(directory, f"{self.name}{suffix}-{int(self.archive.meta['recorded_at'] * 1000)}.zip")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            self.archive.save(path)
+        except Exception as e:
+            print(f"Error saving traffic recording {path}: {e}")
+            return None
+        return path
+
+
+# Archives loaded by the replay backends, shared by every job of the process
+_archives: Dict[str, TrafficArchive] = {}
+_archives_lock = threading.Lock()
+
+
+def load_archive(path: Optional[str] = None) -> TrafficArchive:
+    """Get the archive to replay (TRAFFIC_REPLAY_FILE), loading it once per process.
+    
+    Raises:
+        Exception: If no archive is configured
+    """
+    path = path or os.getenv("TRAFFIC_REPLAY_FILE", "")
+    if not path:
+        raise Exception("TRAFFIC_REPLAY_FILE is not set")
+    with _archives_lock:
+        if path not in _archives:
+            _archives[path] = TrafficArchive.load(path)
+        return _archives[path]
+
+
+def _latency_scale() -> float:
+    """Factor applied to recorded latencies (TRAFFIC_REPLAY_LATENCY_SCALE, 0 for none)."""
+    return float(os.getenv("TRAFFIC_REPLAY_LATENCY_SCALE", "1.0"))
+
+
+class ReplayGitService:
+    """Provider service answering from a fixture archive, after the recorded latency.
+    
+    Calls that were not recorded raise, so a replay never falls back to the
+    network; reviews are not published.
+    """
+    
+    def __init__(self, blob_cache: Any = None, archive: Optional[TrafficArchive] = None,
+                 latency_scale: Optional[float] = None):
+        """Initialize the service.
+        
+        Args:
+            blob_cache: Accepted for compatibility with the real services; unused
+            archive: Archive to replay (defaults to TRAFFIC_REPLAY_FILE)
+            latency_scale: Factor applied to recorded latencies (TRAFFIC_REPLAY_LATENCY_SCALE)
+        """
+        self.archive = archive if archive is not None else load_archive()
+        self.latency_scale = latency_scale if latency_scale is not None else _latency_scale()
+    
+    def __getattr__(self, name: str) -> Any:
+        if name not in RECORDED_METHODS:
+            raise AttributeError(name)
+        if name in STREAMING_METHODS:
+            return lambda *args, **kwargs: self._replay_stream(name, args, kwargs)
+        return lambda *args, **kwargs: self._replay(name, args, kwargs)
+    
+    def _replay(self, name: str, args: tuple, kwargs: Dict[str, Any]) -> Any:
+        """Answer a call with its recorded result or error."""
+        entry = self.archive.next_call(call_key(name, args, kwargs))
+        time.sleep(entry["seconds"] * self.latency_scale)
+        if "error" in entry:
+            raise Exception(entry["error"])
+        result = entry["result"]
+        content_policy = next((arg for arg in args if isinstance(arg, ContentPolicy)), None)
+        if name in CONTENT_METHODS and content_policy is not None:
+            # Replayed contents count against the job's memory budget like fetched ones
+            result = {
+                file_path: content
+                for file_path, content in (
+                    (file_path, content_policy.read(file_path, [content.encode('utf-8')]))
+                    for file_path, content in result.items()
+                )
+                if content is not None
+            }
+        return result
+    
+    def _replay_stream(self, name: str, args: tuple, kwargs: Dict[str, Any]) -> Iterator[Tuple[str, str]]:
+        """Stream recorded (file path, content) items at their recorded pace."""
+        entry = self.archive.next_call(call_key(name, args, kwargs))
+        content_policy = next((arg for arg in args if isinstance(arg, ContentPolicy)), None) or ContentPolicy()
+        for delay, (file_path, content) in entry["items"]:
+            time.sleep(delay * self.latency_scale)
+            content = content_policy.read(file_path, [content.encode('utf-8')])
+            if content is not None:
+                yield file_path, content
+        if "error" in entry:
+            raise Exception(entry["error"])
+    
+    def submit_review(self, *args: Any, **kwargs: Any) -> None:
+        """Drop a review; replays never write to the provider."""
+        return None
+
+
+class ReplayModelBackend(ModelBackend):
+    """Model backend answering from a fixture archive, after the recorded latency."""
+    
+    def __init__(self, archive: Optional[TrafficArchive] = None, latency_scale: Optional[float] = None):
+        """Initialize the backend.
+        
+        Args:
+            archive: Archive to replay (defaults to TRAFFIC_REPLAY_FILE)
+            latency_scale: Factor applied to recorded latencies (TRAFFIC_REPLAY_LATENCY_SCALE)
+        """
+        self.archive = archive if archive is not None else load_archive()
+        self.latency_scale = latency_scale if latency_scale is not None else _latency_scale()
+    
+    def complete(self, system: str, prompt: str, max_tokens: int, timeout: float) -> str:
+        """Get the recorded reply to a prompt."""
+        entry = self.archive.next_call(prompt_key(system, prompt))
+        delay = entry["seconds"] * self.latency_scale
+        if delay > timeout:
+            time.sleep(max(timeout, 0))
+            raise Exception(f"Model request timed out after {timeout:.1f}s")
+        time.sleep(delay)
+        if "error" in entry:
+            raise Exception(entry["error"])
+        return entry["result"]
+
+
+def main() -> None:
+    """Replay a recorded job several times and report how long each run took."""
+    parser = argparse.ArgumentParser(description="Replay a recorded analysis job with no network")
+    parser.add_argument("archive", help="Fixture archive written with TRAFFIC_RECORD_DIR")
+    parser.add_argument("--repeat", type=int, default=1, help="Number of runs")
+    parser.add_argument(
+        "--latency-scale", type=float, default=None,
+        help="Factor applied to recorded latencies, 0 for none (TRAFFIC_REPLAY_LATENCY_SCALE)"
+    )
+    parser.add_argument("--output", help="Write the last run's response to this JSON file")
+    args = parser.parse_args()
+    
+    # Replays must not add to the analysis history
+    os.environ["HISTORY_ENABLED"] = "false"
+    import pipeline
+    from analysis.ai_feedback import AIFeedbackGenerator
+    from analysis.baseline import BaselineIndex
+    from analysis.node_cache import NodeCache
+    
+    archive = TrafficArchive.load(args.archive)
+    request_dict = {**archive.meta["request"], "publish": False}
+    print(f"Replaying {request_dict.get('repo')}#{request_dict.get('pr_number')} "
+          f"({sum(len(entries) for entries in archive.calls.values())} calls, {len(archive.blobs)} blobs)")
+    # Base issues are indexed in a scratch database, so replays neither read nor fill the shared one
+    scratch_dir = tempfile.TemporaryDirectory()
+    for run in range(args.repeat):
+        # Each run starts cold, with the recorded answers from the first call on
+        archive._served.clear()
+        pipeline.baseline_index = BaselineIndex(os.path.join(scratch_dir.name, f"baseline-{run}.db"))
+        pipeline.node_cache = NodeCache()
+        checkers = pipeline.create_checkers()
+        checkers['ai'] = AIFeedbackGenerator(
+            ReplayModelBackend(archive, args.latency_scale) if archive.meta.get("ai") else None, pipeline.node_cache
+        )
+        started = time.monotonic()
+        result = pipeline.analyze_pull_request(
+            request_dict, ReplayGitService(archive=archive, latency_scale=args.latency_scale), checkers,
+            shard=archive.meta.get("shard")
+        )
+        elapsed = time.monotonic() - started
+        stages = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in result["stage_seconds"].items())
+        print(f"run {run + 1}: {elapsed:.2f}s, status {result['status']}, score {result['score']['overall']} ({stages})")
+    scratch_dir.cleanup()
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(result, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
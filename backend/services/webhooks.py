@@ -0,0 +1,146 @@
+import hashlib
+import hmac
+import json
+import os
+from typing import Dict, Any, Mapping, Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_WEBHOOK_DEBOUNCE_SECONDS = 10
+
+# Actions that put new commits up for review, per provider
+REVIEW_ACTIONS = {
+    "github": {"opened", "reopened", "synchronize", "ready_for_review"},
+    "gitlab": {"open", "reopen", "update"},
+    "bitbucket": {"pullrequest:created", "pullrequest:updated"},
+}
+
+# Actions after which no analysis of the pull request is wanted
+CLOSE_ACTIONS = {
+    "github": {"closed"},
+    "gitlab": {"close", "merge"},
+    "bitbucket": {"pullrequest:fulfilled", "pullrequest:rejected"},
+}
+
+
+class WebhookError(Exception):
+    """Raised for webhook deliveries that cannot be accepted."""
+    
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _header(headers: Mapping[str, str], name: str) -> str:
+    """Get a header case-insensitively."""
+    return headers.get(name) or headers.get(name.lower()) or ""
+
+
+def verify_signature(server: str, headers: Mapping[str, str], body: bytes) -> None:
+    """Check that a delivery was signed with the provider's webhook secret.
+    
+    GitHub and Bitbucket sign the body with HMAC-SHA256; GitLab sends the
+    secret itself in the X-Gitlab-Token header.
+    
+    Args:
+        server: 'github', 'gitlab' or 'bitbucket'
+        headers: Request headers
+        body: Raw request body
+    
+    Raises:
+        WebhookError: If no secret is configured or the signature does not match
+    """
+    if server not in REVIEW_ACTIONS:
+        raise WebhookError(400, f"Unsupported server: {server}")
+    secret = os.getenv(f"{server.upper()}_WEBHOOK_SECRET")
+    if not secret:
+        raise WebhookError(503, f"{server} webhooks are not configured")
+    
+    if server == "gitlab":
+        valid = hmac.compare_digest(_header(headers, "X-Gitlab-Token"), secret)
+    else:
+        header = "X-Hub-Signature-256" if server == "github" else "X-Hub-Signature"
+        expected = "sha256=" + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+        valid = hmac.compare_digest(_header(headers, header), expected)
+    if not valid:
+        raise WebhookError(401, "Invalid webhook signature")
+
+
+def parse_event(server: str, headers: Mapping[str, str], body: bytes) -> Optional[Dict[str, Any]]:
+    """Extract the pull request and its head commit from a webhook delivery.
+    
+    Args:
+        server: 'github', 'gitlab' or 'bitbucket'
+        headers: Request headers
+        body: Raw request body
+    
+    Returns:
+        Dictionary with 'server', 'repo', 'pr_number', 'head_sha', 'author'
+        and 'action' ('review' or 'close'), or None for events that are not
+        about pull request commits
+    """
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise WebhookError(400, "Webhook body is not JSON")
+    
+    try:
+        if server == "github":
+            if _header(headers, "X-GitHub-Event") != "pull_request":
+                return None
+            action = payload["action"]
+            pr = payload["pull_request"]
+            event = {
+                "repo": payload["repository"]["full_name"],
+                "pr_number": pr["number"],
+                "head_sha": pr["head"]["sha"],
+                "author": pr["user"]["login"],
+            }
+        elif server == "gitlab":
+            if _header(headers, "X-Gitlab-Event") != "Merge Request Hook":
+                return None
+            attributes = payload["object_attributes"]
+            action = attributes.get("action")
+            # Updates without a new commit (title, labels, ...) leave oldrev out
+            if action == "update" and "oldrev" not in attributes:
+                return None
+            event = {
+                "repo": payload["project"]["path_with_namespace"],
+                "pr_number": attributes["iid"],
+                "head_sha": attributes["last_commit"]["id"],
+                # 'user' is whoever triggered the event; the author is looked up later
+                "author": None,
+            }
+        elif server == "bitbucket":
+            action = _header(headers, "X-Event-Key")
+            if not action.startswith("pullrequest:"):
+                return None
+            pr = payload["pullrequest"]
+            event = {
+                "repo": payload["repository"]["full_name"],
+                "pr_number": pr["id"],
+                "head_sha": pr["source"]["commit"]["hash"],
+                "author": pr.get("author", {}).get("nickname"),
+            }
+        else:
+            raise WebhookError(400, f"Unsupported server: {server}")
+    except (KeyError, TypeError) as e:
+        raise WebhookError(400, f"Malformed {server} webhook payload: missing {e}")
+    
+    if action in REVIEW_ACTIONS[server]:
+        event["action"] = "review"
+    elif action in CLOSE_ACTIONS[server]:
+        event["action"] = "close"
+    else:
+        return None
+    event["server"] = server
+    return event
+
+
+def pr_key(server: str, repo: str, pr_number: int) -> str:
+    """Key identifying a pull request across jobs."""
+    return f"{server}:{repo}#{pr_number}"
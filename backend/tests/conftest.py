@@ -0,0 +1,91 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+
+# Handler of one route: called with the query parameters, returns
+# (status, body, headers); dict and list bodies are sent as JSON
+Route = Callable[[Dict[str, str]], Tuple[int, Any, Dict[str, str]]]
+
+
+class FakeServer:
+    """Local HTTP server answering provider API requests from a route table.
+    
+    Routes are matched on the raw request path, so percent-encoded project
+    paths (GitLab's 'group%2Fproject') are matched as the client sent them.
+    Every request is recorded as (path, query parameters).
+    """
+    
+    def __init__(self):
+        """Start the server on a free local port."""
+        self.routes: Dict[str, Route] = {}
+        self.requests: List[Tuple[str, Dict[str, str]]] = []
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+    
+    @property
+    def url(self) -> str:
+        """Root URL of the server."""
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+    
+    def route(self, path: str, handler: Route) -> None:
+        """Answer requests for a path with a handler."""
+        self.routes[path] = handler
+    
+    def json(self, path: str, body: Any, status: int = 200) -> None:
+        """Answer requests for a path with a fixed JSON body."""
+        self.route(path, lambda params: (status, body, {}))
+    
+    def _handler(self) -> type:
+        """Build the request handler class bound to this server."""
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                params = dict(parse_qsl(parts.query))
+                with server._lock:
+                    server.requests.append((parts.path, params))
+                handler = server.routes.get(parts.path)
+                if handler is None:
+                    status, body, headers = 404, {"message": "404 Not Found"}, {}
+                else:
+                    status, body, headers = handler(params)
+                
+                if isinstance(body, (dict, list)):
+                    body = json.dumps(body)
+                    headers = dict(headers, **{"Content-Type": "application/json"})
+                if isinstance(body, str):
+                    body = body.encode('utf-8')
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
+    
+    def close(self) -> None:
+        """Stop the server."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def fake_server():
+    """A running fake provider API, stopped after the test."""
+    server = FakeServer()
+    yield server
+    server.close()
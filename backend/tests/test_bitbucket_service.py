@@ -0,0 +1,94 @@
+import pytest
+
+from services.bitbucket_service import BitbucketService
+from utils.content_policy import ContentPolicy
+
+PR = "/2.0/repositories/team/repo/pullrequests/3"
+HEAD_SHA = "c" * 40
+
+PR_DIFF = "\n".join([
+    "diff --git a/app.py b/app.py",
+    "index 1111111..2222222 100644",
+    "--- a/app.py",
+    "+++ b/app.py",
+    "@@ -1,2 +1,2 @@",
+    " import os",
+    "-x = 1",
+    "+x = 2",
+    "diff --git a/new.py b/new.py",
+    "new file mode 100644",
+    "--- /dev/null",
+    "+++ b/new.py",
+    "@@ -0,0 +1,2 @@",
+    "+def f():",
+    "+    return 1",
+    "diff --git a/old.py b/old.py",
+    "deleted file mode 100644",
+    "--- a/old.py",
+    "+++ /dev/null",
+    "@@ -1 +0,0 @@",
+    "-print('bye')",
+    "",
+])
+
+
+def diffstat_entry(path, status="modified"):
+    """A file entry of the PR diffstat."""
+    side = {"path": path}
+    return {
+        "status": status,
+        "old": None if status == "added" else side,
+        "new": None if status == "removed" else side,
+        "lines_added": 1,
+        "lines_removed": 1,
+    }
+
+
+@pytest.fixture
+def bitbucket(fake_server, monkeypatch):
+    """Bitbucket service pointed at the fake server, for a PR opened from a fork."""
+    monkeypatch.delenv("BITBUCKET_TOKEN", raising=False)
+    fake_server.json(PR, {
+        "source": {"commit": {"hash": HEAD_SHA}, "repository": {"full_name": "fork/repo"}},
+        "destination": {"commit": {"hash": "d" * 40}, "branch": {"name": "main"}},
+    })
+    return BitbucketService(base_url=f"{fake_server.url}/2.0", max_concurrency=2)
+
+
+def test_diffstat_follows_next_links(fake_server, bitbucket):
+    fake_server.json(f"{PR}/diffstat", {
+        "values": [diffstat_entry("a.py"), diffstat_entry("b.py", "added")],
+        "next": f"{fake_server.url}{PR}/diffstat/page2",
+    })
+    fake_server.json(f"{PR}/diffstat/page2", {"values": [diffstat_entry("c.py", "removed")]})
+    
+    files = bitbucket.get_pull_request_files("team/repo", 3)
+    
+    assert [(file["filename"], file["status"]) for file in files] == [
+        ("a.py", "modified"), ("b.py", "added"), ("c.py", "removed")
+    ]
+    assert [path for path, _ in fake_server.requests] == [f"{PR}/diffstat", f"{PR}/diffstat/page2"]
+
+
+def test_contents_read_from_source_repository_at_head(fake_server, bitbucket):
+    fake_server.route(f"{PR}/diff", lambda params: (200, PR_DIFF, {"Content-Type": "text/plain"}))
+    fake_server.route(
+        f"/2.0/repositories/fork/repo/src/{HEAD_SHA}/app.py",
+        lambda params: (200, "import os\nx = 2\n", {})
+    )
+    
+    contents = bitbucket.get_pr_files_content("team/repo", 3, ContentPolicy())
+    
+    assert contents == {"app.py": "import os\nx = 2\n", "new.py": "def f():\n    return 1\n"}
+    # The added file is rebuilt from the diff and the deleted one is not read
+    assert not any("/src/" in path and not path.endswith("/app.py") for path, _ in fake_server.requests)
+
+
+def test_files_listed_from_diffstat_without_diff(fake_server, bitbucket):
+    fake_server.json(f"{PR}/diff", {"error": {"message": "diff too large"}}, status=500)
+    fake_server.json(f"{PR}/diffstat", {"values": [diffstat_entry("a.py"), diffstat_entry("gone.py", "removed")]})
+    fake_server.route(f"/2.0/repositories/fork/repo/src/{HEAD_SHA}/a.py", lambda params: (200, "a = 1\n", {}))
+    
+    contents = bitbucket.get_pr_files_content("team/repo", 3, ContentPolicy())
+    
+    assert contents == {"a.py": "a = 1\n"}
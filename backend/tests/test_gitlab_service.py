@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+from services.gitlab_service import GitLabService
+from utils.content_policy import ContentPolicy
+
+PROJECT = "/api/v4/projects/group%2Fproject"
+MR = f"{PROJECT}/merge_requests/7"
+HEAD_SHA = "a" * 40
+
+
+def diff_entry(path, patch="@@ -1 +1 @@\n-old\n+new\n", **flags):
+    """A file entry as returned by the MR diffs and changes endpoints."""
+    entry = {"old_path": path, "new_path": path, "diff": patch,
+             "new_file": False, "deleted_file": False, "renamed_file": False}
+    entry.update(flags)
+    return entry
+
+
+@pytest.fixture
+def gitlab(fake_server, monkeypatch):
+    """GitLab service pointed at the fake server."""
+    monkeypatch.setenv("GITLAB_TOKEN", "test-token")
+    service = GitLabService(base_url=f"{fake_server.url}/api/v4", max_concurrency=3)
+    fake_server.json(MR, {"sha": HEAD_SHA, "diff_refs": {"base_sha": "b" * 40, "head_sha": HEAD_SHA}})
+    return service
+
+
+def test_diffs_follow_next_page(fake_server, gitlab):
+    pages = {
+        "1": [diff_entry("a.py"), diff_entry("b.py")],
+        "2": [diff_entry("c.py")],
+        "3": [diff_entry("d.py")],
+    }
+    
+    def diffs(params):
+        page = params["page"]
+        return 200, pages[page], {"X-Next-Page": {"1": "2", "2": "3"}.get(page, "")}
+    
+    fake_server.route(f"{MR}/diffs", diffs)
+    
+    files = gitlab.get_mr_files("group/project", 7)
+    
+    assert [file["filename"] for file in files] == ["a.py", "b.py", "c.py", "d.py"]
+    assert [params["page"] for path, params in fake_server.requests if path == f"{MR}/diffs"] == ["1", "2", "3"]
+    assert files[0]["additions"] == 1 and files[0]["deletions"] == 1
+
+
+def test_falls_back_to_changes_endpoint(fake_server, gitlab):
+    fake_server.json(f"{MR}/diffs", {"message": "404 Not Found"}, status=404)
+    fake_server.route(f"{MR}/changes", lambda params: (
+        200 if params.get("access_raw_diffs") == "true" else 400,
+        {"changes": [diff_entry("a.py"), diff_entry("gone.py", deleted_file=True)]},
+        {}
+    ))
+    
+    files = gitlab.get_mr_files("group/project", 7)
+    
+    assert [(file["filename"], file["status"]) for file in files] == [("a.py", "modified"), ("gone.py", "removed")]
+
+
+def test_contents_fetched_concurrently_at_head_sha(fake_server, gitlab):
+    paths = [f"pkg/module_{index}.py" for index in range(6)]
+    fake_server.json(f"{MR}/diffs", [diff_entry(path) for path in paths] + [
+        diff_entry("pkg/new.py", "@@ -0,0 +1,2 @@\n+x = 1\n+y = 2\n", new_file=True),
+        diff_entry("pkg/old.py", deleted_file=True),
+    ])
+    lock = threading.Lock()
+    in_flight = {"now": 0, "peak": 0}
+    refs = []
+    
+    def raw(path):
+        def handler(params):
+            with lock:
+                refs.append(params.get("ref"))
+                in_flight["now"] += 1
+                in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+            time.sleep(0.2)
+            with lock:
+                in_flight["now"] -= 1
+            return 200, f"# {path}\n", {}
+        return handler
+    
+    for path in paths:
+        fake_server.route(f"{PROJECT}/repository/files/{path.replace('/', '%2F')}/raw", raw(path))
+    
+    contents = gitlab.get_mr_files_content("group/project", 7, ContentPolicy())
+    
+    assert contents == dict({path: f"# {path}\n" for path in paths}, **{"pkg/new.py": "x = 1\ny = 2\n"})
+    # Every fetch reads the head commit; the new file is rebuilt from its diff
+    assert refs == [HEAD_SHA] * len(paths)
+    assert 1 < in_flight["peak"] <= gitlab.max_concurrency
@@ -0,0 +1,127 @@
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services.mirror_service import MirrorService
+from utils.content_policy import ContentPolicy
+
+
+def git(cwd, *args):
+    """Run git in a working tree and return its output."""
+    result = subprocess.run(
+        ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com', '-c', 'init.defaultBranch=main'] + list(args),
+        cwd=cwd, capture_output=True, check=True
+    )
+    return result.stdout.decode('utf-8').strip()
+
+
+def commit(cwd, files, message):
+    """Write files (None deletes one) and commit them."""
+    for path, content in files.items():
+        full_path = os.path.join(cwd, path)
+        if content is None:
+            os.remove(full_path)
+            continue
+        with open(full_path, 'w') as f:
+            f.write(content)
+    git(cwd, 'add', '-A')
+    git(cwd, 'commit', '--quiet', '-m', message)
+    return git(cwd, 'rev-parse', 'HEAD')
+
+
+@pytest.fixture
+def remote(tmp_path):
+    """A local repository with PR 7 open against main, which moved on after the PR forked."""
+    root = tmp_path / 'remote'
+    work = root / 'team' / 'repo'
+    work.mkdir(parents=True)
+    git(work, 'init', '--quiet')
+    fork_point = commit(work, {'app.py': 'x = 1\n', 'old.py': 'y = 1\n'}, 'initial')
+    git(work, 'checkout', '--quiet', '-b', 'feature')
+    head = commit(work, {'app.py': 'x = 2\n', 'new.py': 'z = 1\n', 'old.py': None}, 'feature')
+    git(work, 'update-ref', 'refs/pull/7/head', head)
+    git(work, 'checkout', '--quiet', 'main')
+    commit(work, {'later.py': 'w = 1\n'}, 'main moves on')
+    return {'root': root, 'work': work, 'fork_point': fork_point, 'head': head}
+
+
+@pytest.fixture
+def mirrors(tmp_path, remote, monkeypatch):
+    """Mirror service reading from the local repository, with no network access."""
+    monkeypatch.delenv("MIRROR_TOKEN", raising=False)
+    monkeypatch.delenv("GITHUB_TOKEN", raising=False)
+    service = MirrorService(
+        cache_dir=str(tmp_path / 'cache'),
+        remote_url=f"file://{remote['root']}/{{repo}}",
+        base_branch_lookup=lambda repo_name, pr_number: 'main'
+    )
+    yield service
+    service.close()
+
+
+def test_pr_compared_with_merge_base(mirrors, remote):
+    files = mirrors.get_pr_files('team/repo', 7)
+    
+    # later.py was added to main after the PR forked and is not part of it
+    assert sorted((file['filename'], file['status']) for file in files) == [
+        ('app.py', 'modified'), ('new.py', 'added'), ('old.py', 'removed')
+    ]
+    assert mirrors.get_pr_head('team/repo', 7) == ('team/repo', remote['head'])
+    assert mirrors.get_base_sha('team/repo', 7) == remote['fork_point']
+
+
+def test_contents_read_from_mirror(mirrors, remote):
+    contents = mirrors.get_pr_files_content('team/repo', 7, ContentPolicy())
+    assert contents == {'app.py': 'x = 2\n', 'new.py': 'z = 1\n'}
+    
+    # Reads only need the mirror once the refs are fetched
+    shutil.rmtree(remote['root'])
+    base = mirrors.get_files_content_at('team/repo', ['app.py', 'new.py'], remote['fork_point'], ContentPolicy())
+    assert base == {'app.py': 'x = 1\n'}
+    assert mirrors.get_file_content('team/repo', 'new.py', remote['head']) == 'z = 1\n'
+
+
+def test_concurrent_calls_fetch_once(mirrors, monkeypatch):
+    fetches = []
+    git_command = mirrors._git
+    
+    def counting_git(git_dir, *args):
+        if args[0] == 'fetch':
+            fetches.append(args)
+        return git_command(git_dir, *args)
+    
+    monkeypatch.setattr(mirrors, '_git', counting_git)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        shas = list(executor.map(lambda _: mirrors.get_base_sha('team/repo', 7), range(4)))
+    
+    assert len(set(shas)) == 1
+    assert len(fetches) == 1
+
+
+def test_disk_budget_evicts_unused_mirrors(tmp_path, remote, monkeypatch):
+    monkeypatch.delenv("MIRROR_TOKEN", raising=False)
+    monkeypatch.delenv("GITHUB_TOKEN", raising=False)
+    # Every call fetches, and so checks the budget
+    monkeypatch.setenv("MIRROR_REFS_TTL", "0")
+    other = remote['root'] / 'team' / 'other'
+    shutil.copytree(remote['work'], other)
+    service = MirrorService(
+        cache_dir=str(tmp_path / 'cache'),
+        remote_url=f"file://{remote['root']}/{{repo}}",
+        disk_budget_mb=0,
+        base_branch_lookup=lambda repo_name, pr_number: 'main'
+    )
+    try:
+        service.fetch_refs('team/repo', 7)
+        # A mirror being read is kept
+        with service._lease('team/repo'):
+            service.fetch_refs('team/other', 7)
+            assert os.path.isdir(service._mirror_path('team/repo'))
+        service.fetch_refs('team/other', 7)
+        assert not os.path.isdir(service._mirror_path('team/repo'))
+        assert os.path.isdir(service._mirror_path('team/other'))
+    finally:
+        service.close()
@@ -0,0 +1,78 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+from utils.content_policy import ContentPolicy
+
+DEFAULT_BLOB_CACHE_MB = 256
+
+
+class BlobCache:
+    """Thread-safe LRU cache of file contents shared by several analysis jobs.
+    
+    Keys identify one version of a file: the blob SHA where the provider
+    reports it, otherwise a (repository, commit, path) tuple.
+    """
+    
+    def __init__(self, max_bytes: Optional[int] = None):
+        """Initialize the cache.
+        
+        Args:
+            max_bytes: Total content size kept before evicting (BLOB_CACHE_MB)
+        """
+        if max_bytes is None:
+            max_bytes = int(os.getenv("BLOB_CACHE_MB", DEFAULT_BLOB_CACHE_MB)) * 1024 * 1024
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, str]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Hashable) -> Optional[str]:
+        """Get cached content, marking it as recently used."""
+        with self._lock:
+            content = self._entries.get(key)
+            if content is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return content
+    
+    def put(self, key: Hashable, content: str) -> None:
+        """Store content, evicting least recently used entries if needed."""
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = content
+            self.size += len(content)
+            while self.size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+    
+    def read_through(self, key: Hashable, file_path: str, content_policy: ContentPolicy,
+                     load: Callable[[], Optional[str]]) -> Optional[str]:
+        """Get a file's content from the cache, loading and storing it on a miss.
+        
+        Cache hits still go through ``content_policy`` so they count against
+        the requesting job's memory budget.
+        
+        Args:
+            key: Cache key of this file version
+            file_path: Path to the file (used for reporting)
+            content_policy: Policy of the requesting job
+            load: Fetches the content through ``content_policy`` on a miss
+        
+        Returns:
+            File content, or None if it is missing or skipped by the policy
+        """
+        content = self.get(key)
+        if content is not None:
+            return content_policy.read(file_path, [content.encode('utf-8')])
+        
+        content = load()
+        if content is not None:
+            self.put(key, content)
+        return content
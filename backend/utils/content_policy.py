@@ -0,0 +1,263 @@
+import codecs
+import os
+import threading
+from typing import Dict, Iterable, Iterator, Optional
+
+# Bytes inspected to detect binary and generated files
+SNIFF_BYTES = 8192
+
+# Size of chunks requested from streamed responses
+STREAM_CHUNK_BYTES = 64 * 1024
+
+DEFAULT_MAX_FILE_KB = 512
+DEFAULT_OVERSIZE_MODE = "truncate"
+DEFAULT_JOB_MEMORY_BUDGET_MB = 64
+
+OVERSIZE_MODES = ("skip", "truncate", "sample")
+
+# Markers tools put in the header comment of files that should not be reviewed,
+# e.g. Go's "// Code generated ... DO NOT EDIT." line
+GENERATED_MARKERS = (
+    b"@generated",
+    b"DO NOT EDIT",
+    b"Code generated by",
+    b"auto-generated",
+    b"autogenerated",
+)
+
+# Line prefixes of comments that may carry a generated marker; the header ends at the first other line
+HEADER_COMMENT_PREFIXES = (b"#", b"//", b"/*", b"*", b"--", b"<!--", b";")
+
+# Lines of the header comment searched for generated markers
+HEADER_LINES = 40
+
+# A first line longer than this is treated as a minified bundle
+MINIFIED_LINE_LENGTH = 1000
+
+
+class ContentPolicy:
+    """Per-file size policy and per-job memory budget for fetched file contents.
+    
+    Providers pass each file's content to :meth:`read` as a stream of byte
+    chunks. The first bytes are inspected to drop binary and generated files,
+    oversized files are skipped, truncated or sampled according to
+    ``oversize_mode``, and every byte held is charged against the job's
+    memory budget until :meth:`release` is called.
+    """
+    
+    def __init__(
+        self,
+        max_file_bytes: Optional[int] = None,
+        oversize_mode: Optional[str] = None,
+        memory_budget_bytes: Optional[int] = None
+    ):
+        """Initialize the policy from arguments or environment variables.
+        
+        Args:
+            max_file_bytes: Largest file kept whole (MAX_FILE_KB)
+            oversize_mode: 'skip', 'truncate' or 'sample' for larger files (OVERSIZE_MODE)
+            memory_budget_bytes: Total content held at once per job (JOB_MEMORY_BUDGET_MB)
+        """
+        if max_file_bytes is None:
+            max_file_bytes = int(os.getenv("MAX_FILE_KB", DEFAULT_MAX_FILE_KB)) * 1024
+        if oversize_mode is None:
+            oversize_mode = os.getenv("OVERSIZE_MODE", DEFAULT_OVERSIZE_MODE)
+        if memory_budget_bytes is None:
+            memory_budget_bytes = int(os.getenv("JOB_MEMORY_BUDGET_MB", DEFAULT_JOB_MEMORY_BUDGET_MB)) * 1024 * 1024
+        if oversize_mode not in OVERSIZE_MODES:
+            raise ValueError(f"Invalid oversize mode: {oversize_mode}")
+        
+        self.max_file_bytes = max_file_bytes
+        self.oversize_mode = oversize_mode
+        self.memory_budget_bytes = memory_budget_bytes
+        self.held_bytes = 0
+        self.skipped: Dict[str, str] = {}
+        self._lock = threading.Lock()
+    
+    def _reserve(self, num_bytes: int) -> bool:
+        """Charge bytes against the memory budget, returning False if it is exhausted."""
+        with self._lock:
+            if self.held_bytes + num_bytes > self.memory_budget_bytes:
+                return False
+            self.held_bytes += num_bytes
+            return True
+    
+    def release(self, content: str) -> None:
+        """Return the memory held by a file's content to the budget.
+        
+        Args:
+            content: Content previously returned by :meth:`read`
+        """
+        with self._lock:
+            self.held_bytes = max(0, self.held_bytes - len(content.encode('utf-8')))
+    
+    def _skip(self, file_path: str, reason: str) -> None:
+        """Record a skipped file."""
+        with self._lock:
+            self.skipped[file_path] = reason
+    
+    def read(self, file_path: str, chunks: Iterable[bytes], size: Optional[int] = None) -> Optional[str]:
+        """Read a file's content stream under the policy.
+        
+        Reading stops as soon as the file is known to be skipped or no more
+        bytes are needed, so callers should close the underlying stream.
+        
+        Args:
+            file_path: Path to the file (used for reporting)
+            chunks: Iterable of raw content chunks
+            size: Total size in bytes, if known in advance
+        
+        Returns:
+            Decoded content, or None if the file was skipped
+        """
+        if size is not None and size > self.max_file_bytes and self.oversize_mode == "skip":
+            self._skip(file_path, f"file too large ({size} bytes)")
+            return None
+        
+        # Sampling splits the allowance between the start and the end of the file
+        head_limit = self.max_file_bytes
+        if self.oversize_mode == "sample":
+            head_limit -= self.max_file_bytes // 2
+        
+        head = bytearray()
+        tail = bytearray()
+        total = 0
+        dropped_newlines = 0
+        sniffed = False
+        reserved = 0
+        
+        try:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                total += len(chunk)
+                
+                kept = chunk[:max(0, head_limit - len(head))]
+                head.extend(kept)
+                chunk = chunk[len(kept):]
+                if chunk and self.oversize_mode == "sample":
+                    # Keep a rolling window of the last part of the file
+                    tail.extend(chunk)
+                    overflow = max(0, len(tail) - self.max_file_bytes // 2)
+                    dropped_newlines += tail.count(b'\n', 0, overflow)
+                    del tail[:overflow]
+                
+                if not sniffed and (len(head) >= SNIFF_BYTES or total > self.max_file_bytes):
+                    reason = _detect_unreviewable(bytes(head[:SNIFF_BYTES]), final=False)
+                    if reason:
+                        self._skip(file_path, reason)
+                        return None
+                    sniffed = True
+                
+                held = len(head) + len(tail)
+                if held > reserved:
+                    if not self._reserve(held - reserved):
+                        self._skip(file_path, "job memory budget exhausted")
+                        return None
+                    reserved = held
+                
+                if total > self.max_file_bytes:
+                    if self.oversize_mode == "skip":
+                        self._skip(file_path, f"file too large (over {self.max_file_bytes} bytes)")
+                        return None
+                    if self.oversize_mode == "truncate":
+                        break
+            
+            if not sniffed:
+                reason = _detect_unreviewable(bytes(head[:SNIFF_BYTES]), final=True)
+                if reason:
+                    self._skip(file_path, reason)
+                    return None
+            
+            data = bytes(head)
+            if total > self.max_file_bytes:
+                data = self._shrink(data, bytes(tail), dropped_newlines)
+            
+            try:
+                content = data.decode('utf-8')
+            except UnicodeDecodeError:
+                self._skip(file_path, "not valid UTF-8 text")
+                return None
+            
+            # Keep charging exactly the bytes of the returned content
+            with self._lock:
+                self.held_bytes += len(data) - reserved
+            reserved = 0
+            return content
+        finally:
+            if reserved:
+                with self._lock:
+                    self.held_bytes -= reserved
+    
+    def _shrink(self, head: bytes, tail: bytes, dropped_newlines: int) -> bytes:
+        """Cut an oversized file down to whole lines according to the oversize mode.
+        
+        Sampling keeps the first and last part of the file and blanks out the
+        lines in between, so reported line numbers still match the real file.
+        
+        Args:
+            head: First bytes of the file
+            tail: Last bytes of the file (sample mode only)
+            dropped_newlines: Newlines in the bytes discarded between head and tail
+        
+        Returns:
+            Shrunken content
+        """
+        # Drop the partial line at the cut
+        head = head[:head.rfind(b'\n') + 1]
+        
+        first_newline = tail.find(b'\n')
+        if self.oversize_mode == "truncate" or first_newline < 0:
+            return head
+        
+        # One blank line per line break removed, up to the tail's first full line
+        return head + b'\n' * (dropped_newlines + 1) + tail[first_newline + 1:]
+
+
+def _detect_unreviewable(head: bytes, final: bool) -> Optional[str]:
+    """Detect binary, generated or minified files from their first bytes.
+    
+    Args:
+        head: First bytes of the file
+        final: Whether ``head`` is the whole file
+    
+    Returns:
+        Reason the file should be skipped, or None if it looks like source code
+    """
+    if b'\x00' in head:
+        return "binary file"
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=final)
+    except UnicodeDecodeError:
+        return "binary file"
+    
+    if _has_generated_header(head):
+        return "generated file"
+    
+    first_line_end = head.find(b'\n')
+    if first_line_end > MINIFIED_LINE_LENGTH or (first_line_end < 0 and len(head) > MINIFIED_LINE_LENGTH):
+        return "minified file"
+    
+    return None
+
+
+def _has_generated_header(head: bytes) -> bool:
+    """Check whether a file's leading comment lines mark it as generated.
+    
+    Only the comment block at the top of the file is searched, so code or
+    string literals that merely mention a marker do not hide a file.
+    """
+    for line in head.split(b'\n')[:HEADER_LINES]:
+        line = line.strip()
+        if not line:
+            continue
+        if not line.startswith(HEADER_COMMENT_PREFIXES):
+            return False
+        if any(marker in line for marker in GENERATED_MARKERS):
+            return True
+    return False
+
+
+def iter_file_chunks(fileobj, chunk_size: int = STREAM_CHUNK_BYTES) -> Iterator[bytes]:
+    """Iterate over a binary file object in chunks."""
+    return iter(lambda: fileobj.read(chunk_size), b'')
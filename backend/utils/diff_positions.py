@@ -0,0 +1,252 @@
+import re
+from typing import Dict, Iterable, Iterator, Optional, Set
+
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+
+class FileDiff:
+    """Changes of one file, parsed hunk by hunk from a unified diff."""
+    
+    def __init__(self, old_path: Optional[str] = None, new_path: Optional[str] = None):
+        """Initialize an empty file diff.
+        
+        Args:
+            old_path: Path of the file before the change
+            new_path: Path of the file after the change
+        """
+        self.old_path = old_path
+        self.new_path = new_path
+        self.new_file = False
+        self.deleted_file = False
+        self.binary = False
+        # New line number -> text of every added line
+        self.added: Dict[int, str] = {}
+        # Old line number -> text of every removed line
+        self.removed: Dict[int, str] = {}
+        # New line number -> old line number of added (None) and context lines
+        self.line_map: Dict[int, Optional[int]] = {}
+        # New line number -> text of added and context lines
+        self.new_lines: Dict[int, str] = {}
+        self.hunks = 0
+        # False when a hunk ended before all the lines its header announced
+        self.complete = True
+        self.newline_at_end = True
+        self._old_line = self._new_line = 0
+        self._old_left = self._new_left = 0
+        self._last_side = None
+    
+    @property
+    def path(self) -> Optional[str]:
+        """Path of the file after the change, or before it for deleted files."""
+        return self.new_path or self.old_path
+    
+    @property
+    def in_hunk(self) -> bool:
+        """Whether the current hunk still expects lines."""
+        return self._old_left > 0 or self._new_left > 0
+    
+    def start_hunk(self, match: "re.Match") -> None:
+        """Start a hunk from its matched header."""
+        self.finish()
+        self.hunks += 1
+        self._old_line = int(match.group(1))
+        self._old_left = int(match.group(2)) if match.group(2) is not None else 1
+        self._new_line = int(match.group(3))
+        self._new_left = int(match.group(4)) if match.group(4) is not None else 1
+        # An empty side starts after its line 0
+        if self._old_left == 0:
+            self._old_line += 1
+        if self._new_left == 0:
+            self._new_line += 1
+    
+    def feed(self, line: str) -> None:
+        """Add one line of the current hunk.
+        
+        Args:
+            line: Hunk line starting with '+', '-', ' ' or the no-newline marker
+        """
+        if line.startswith('\\'):
+            if self._last_side in ('+', ' '):
+                self.newline_at_end = False
+            return
+        # Tools that strip trailing whitespace turn empty context lines into ''
+        tag, text = (line[0], line[1:]) if line else (' ', '')
+        if tag == '+':
+            self.added[self._new_line] = text
+            self.line_map[self._new_line] = None
+            self.new_lines[self._new_line] = text
+            self._new_line += 1
+            self._new_left -= 1
+        elif tag == '-':
+            self.removed[self._old_line] = text
+            self._old_line += 1
+            self._old_left -= 1
+        else:
+            self.line_map[self._new_line] = self._old_line
+            self.new_lines[self._new_line] = text
+            self._new_line += 1
+            self._old_line += 1
+            self._new_left -= 1
+            self._old_left -= 1
+        self._last_side = tag
+    
+    def finish(self) -> None:
+        """End the current hunk, marking the diff incomplete if lines are missing."""
+        if self.in_hunk:
+            self.complete = False
+            self._old_left = self._new_left = 0
+    
+    def new_content(self) -> Optional[str]:
+        """Rebuild the whole new file, when the diff holds all of it.
+        
+        Returns:
+            Content of an added file whose single hunk is complete, or None
+            when the file has to be fetched (modified, binary, empty or truncated)
+        """
+        if self.binary or not self.complete or self.hunks != 1 or self.removed:
+            return None
+        if len(self.line_map) != len(self.added) or min(self.added, default=0) != 1:
+            return None
+        lines = [self.added[line] for line in range(1, len(self.added) + 1)]
+        return '\n'.join(lines) + ('\n' if self.newline_at_end else '')
+
+
+def parse_patch(patch: str) -> FileDiff:
+    """Parse the hunks of one file, as providers return them per file.
+    
+    Lines are consumed by the counts of their hunk header, so content lines
+    that look like headers (a removed '-- comment') are read correctly and
+    a patch cut short is marked incomplete.
+    
+    Args:
+        patch: Unified diff hunks of one file
+    
+    Returns:
+        Parsed file diff
+    """
+    file_diff = FileDiff()
+    for line in patch.split('\n'):
+        if file_diff.in_hunk or line.startswith('\\'):
+            file_diff.feed(line)
+            continue
+        match = HUNK_HEADER.match(line)
+        if match:
+            file_diff.start_hunk(match)
+    file_diff.finish()
+    return file_diff
+
+
+def _diff_path(path: str) -> Optional[str]:
+    """Strip the a/ or b/ prefix of a path in a ---/+++ header; None for /dev/null."""
+    path = path.split('\t')[0].strip().strip('"')
+    if path == '/dev/null':
+        return None
+    return path[2:] if path[:2] in ('a/', 'b/') else path
+
+
+def iter_unified_diff(lines: Iterable[str]) -> Iterator[FileDiff]:
+    """Parse a multi-file unified diff (git format or plain) one file at a time.
+    
+    Only the file being parsed is held, so a diff streamed from a provider
+    is parsed while it downloads.
+    
+    Args:
+        lines: Lines of the diff, without their line endings
+    
+    Yields:
+        A parsed diff for every file, in diff order
+    """
+    current: Optional[FileDiff] = None
+    for line in lines:
+        if current is not None and (current.in_hunk or line.startswith('\\')):
+            current.feed(line)
+            continue
+        
+        if line.startswith('diff --git '):
+            if current is not None:
+                current.finish()
+                yield current
+            old_path, _, new_path = line[len('diff --git '):].partition(' b/')
+            current = FileDiff(_diff_path(old_path), new_path or None)
+        elif line.startswith('--- '):
+            if current is None or current.hunks:
+                # Plain diffs start every file with its --- header
+                if current is not None:
+                    current.finish()
+                    yield current
+                current = FileDiff()
+            current.old_path = _diff_path(line[4:])
+            current.new_file = current.old_path is None
+        elif current is None:
+            continue
+        elif line.startswith('+++ '):
+            current.new_path = _diff_path(line[4:])
+            current.deleted_file = current.new_path is None
+        elif line.startswith('new file mode'):
+            current.new_file = True
+        elif line.startswith('deleted file mode'):
+            current.deleted_file = True
+        elif line.startswith('rename from '):
+            current.old_path = line[len('rename from '):]
+        elif line.startswith('rename to '):
+            current.new_path = line[len('rename to '):]
+        elif line.startswith('Binary files ') or line == 'GIT binary patch':
+            current.binary = True
+        else:
+            match = HUNK_HEADER.match(line)
+            if match:
+                current.start_hunk(match)
+    if current is not None:
+        current.finish()
+        yield current
+
+
+def iter_text_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """Split streamed text into lines on '\\n' only, keeping any other control characters."""
+    pending = ''
+    for chunk in chunks:
+        lines = (pending + chunk).split('\n')
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def added_file_content(patch: str) -> Optional[str]:
+    """Rebuild a newly added file from its patch, saving the content fetch.
+    
+    Args:
+        patch: Unified diff hunks of the file, as returned by the provider
+    
+    Returns:
+        Content of the file, or None when the patch does not hold all of it
+    """
+    return parse_patch(patch).new_content()
+
+
+def diff_line_map(patch: str) -> Dict[int, Optional[int]]:
+    """Map the new-file lines shown in a diff to their old-file lines.
+    
+    Args:
+        patch: Unified diff of one file (hunks only, as providers return per file)
+    
+    Returns:
+        Dictionary mapping 1-based new line numbers of added and context
+        lines to the old line number (None for added lines)
+    """
+    return parse_patch(patch).line_map
+
+
+def commentable_lines(patch: str) -> Set[int]:
+    """Get the new-file line numbers a review comment can be attached to.
+    
+    Providers only accept inline comments on lines shown in the diff:
+    added lines and the context lines around them.
+    
+    Args:
+        patch: Unified diff of one file (hunks only, as providers return per file)
+    
+    Returns:
+        Set of 1-based line numbers in the new version of the file
+    """
+    return set(diff_line_map(patch))
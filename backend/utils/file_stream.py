@@ -0,0 +1,121 @@
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+# Files fetched ahead of the one being analyzed
+DEFAULT_STREAM_WINDOW = 8
+
+# Seconds between checks for a consumer that stopped reading
+PUT_POLL_SECONDS = 0.5
+
+_DONE = object()
+
+
+class _Failure:
+    """Exception raised by the producer, handed over to the consumer."""
+    
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def prefetch(items: Iterable[T], window: int = DEFAULT_STREAM_WINDOW) -> Iterator[T]:
+    """Iterate over ``items`` while a background thread produces the next ones.
+    
+    At most ``window`` items wait in the buffer, so a fast producer (a
+    provider fetching file contents) runs ahead of a slow consumer (the
+    checkers) without ever holding more than the window in memory.
+    Exceptions raised by the producer are re-raised in the consumer; when
+    the consumer stops early the producer is stopped and closed as well.
+    
+    Args:
+        items: Iterable consumed on the background thread
+        window: Maximum number of produced items not yet consumed
+    
+    Yields:
+        The items of ``items`` in order
+    """
+    buffer: "queue.Queue" = queue.Queue(maxsize=max(1, window))
+    stopped = threading.Event()
+    
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=PUT_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce() -> None:
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if not put(item):
+                    break
+            else:
+                put(_DONE)
+        except BaseException as e:
+            put(_Failure(e))
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+    
+    producer = threading.Thread(target=produce, name="prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+
+
+def fetch_concurrently(
+    fetch: Callable[[str], Optional[str]],
+    file_paths: Iterable[str],
+    max_concurrency: int
+) -> Iterator[Tuple[str, str]]:
+    """Fetch file contents in parallel, yielding each one as soon as it arrives.
+    
+    At most ``max_concurrency`` fetches are in flight, and ``file_paths`` is
+    only advanced when a slot frees up, so a lazily paginated file list is
+    listed and fetched at the same time.
+    
+    Args:
+        fetch: Function returning a file's content, or None to skip the file
+        file_paths: Paths of the files to fetch
+        max_concurrency: Maximum parallel fetches
+    
+    Yields:
+        (file path, content) tuples in completion order
+    """
+    paths = iter(file_paths)
+    pending = {}
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        while True:
+            for file_path in paths:
+                pending[executor.submit(fetch, file_path)] = file_path
+                if len(pending) >= max_concurrency:
+                    break
+            if not pending:
+                return
+            
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_path = pending.pop(future)
+                try:
+                    content = future.result()
+                except Exception as e:
+                    # Log error and continue with next file
+                    print(f"Error getting content for {file_path}: {e}")
+                    continue
+                if content is not None:
+                    yield file_path, content
@@ -1,6 +1,30 @@
 import os
+import tarfile
 import tempfile
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Tuple, BinaryIO, Iterable, Iterator, Optional
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.content_policy import ContentPolicy, iter_file_chunks
+from utils.diff_positions import iter_unified_diff
+
+# Score categories, in the column order used by ``calculate_scores``
+SCORE_CATEGORIES = ('style', 'performance', 'security', 'complexity', 'best_practices', 'documentation')
+
+# Seconds provider API requests wait for the server unless they set their own timeout
+DEFAULT_HTTP_TIMEOUT = 60
+
+DEFAULT_SCORE_WEIGHTS = {
+    "style": 0.15,
+    "performance": 0.2,
+    "security": 0.25,
+    "complexity": 0.15,
+    "best_practices": 0.15,
+    "documentation": 0.1
+}
 
 
 def create_temp_file(content: str, suffix: str = '.py') -> str:
@@ -32,33 +56,68 @@ def cleanup_temp_files(file_paths: List[str]) -> None:
             pass
 
 
-def calculate_score(issues: Dict[str, int], weights: Dict[str, float] = None) -> Dict[str, Any]:
+class TimeoutSession(requests.Session):
+    """Requests session that applies a default timeout to requests that do not set one."""
+    
+    def __init__(self, timeout: float):
+        super().__init__()
+        self.timeout = timeout
+    
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def create_http_session(headers: Dict[str, str], pool_size: int,
+                        timeout: Optional[float] = None) -> requests.Session:
+    """Create a requests session with a shared, retrying connection pool.
+    
+    Args:
+        headers: Headers sent with every request
+        pool_size: Maximum number of pooled connections per host
+        timeout: Seconds to wait for the server when a request sets no timeout (HTTP_TIMEOUT)
+        
+    Returns:
+        Configured requests session
+    """
+    if timeout is None:
+        timeout = float(os.getenv("HTTP_TIMEOUT", DEFAULT_HTTP_TIMEOUT))
+    session = TimeoutSession(timeout)
+    session.headers.update(headers)
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_size,
+        max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504])
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def calculate_score(issues: Dict[str, int], weights: Dict[str, float] = None,
+                    penalties: Dict[str, int] = None) -> Dict[str, Any]:
     """Calculate code quality score based on different types of issues.
     
     Args:
         issues: Dictionary with counts of different issue types
             (style, performance, security, complexity, best_practices, documentation)
         weights: Optional dictionary with weights for each issue type
+        penalties: Optional penalties per issue type computed by its checker,
+            used instead of the penalty derived from the issue count
             
     Returns:
         Dictionary with overall score and category scores
     """
     # Default weights if not provided
     if weights is None:
-        weights = {
-            "style": 0.15,
-            "performance": 0.2,
-            "security": 0.25,
-            "complexity": 0.15,
-            "best_practices": 0.15,
-            "documentation": 0.1
-        }
+        weights = DEFAULT_SCORE_WEIGHTS
     
     # Calculate category scores
     category_scores = {}
     for category, count in issues.items():
         # Higher counts mean lower scores
-        penalty = min(count * 2, 100)  # Cap penalty at 100
+        penalty = (penalties or {}).get(category, count * 2)
+        penalty = min(penalty, 100)  # Cap penalty at 100
         category_scores[category] = max(0, 100 - penalty)
     
     # Calculate weighted overall score
@@ -76,8 +135,42 @@ def calculate_score(issues: Dict[str, int], weights: Dict[str, float] = None) ->
     }
 
 
+def calculate_scores(counts: np.ndarray, weights: Dict[str, float] = None,
+                     penalties: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized ``calculate_score`` over many analyses.
+    
+    Args:
+        counts: Issue counts, one row per analysis and one column per ``SCORE_CATEGORIES`` entry
+        weights: Optional dictionary with weights for each issue type
+        penalties: Optional penalties shaped like ``counts``; NaN entries fall
+            back to the penalty derived from the count
+            
+    Returns:
+        Tuple of (overall score per analysis, category scores shaped like ``counts``)
+    """
+    if weights is None:
+        weights = DEFAULT_SCORE_WEIGHTS
+    
+    penalty = counts * 2.0
+    if penalties is not None:
+        penalty = np.where(np.isnan(penalties), penalty, penalties)
+    category_scores = np.maximum(0, 100 - np.minimum(penalty, 100))
+    
+    # Accumulate in the same order as calculate_score so results match it exactly
+    overall = np.zeros(len(counts))
+    for column, category in enumerate(SCORE_CATEGORIES):
+        if category in weights:
+            overall += category_scores[:, column] * weights[category]
+    # np.round rounds halves to even, like round() in calculate_score
+    overall = np.round(overall).astype(np.int64)
+    return overall, category_scores.astype(np.int64)
+
+
 def parse_diff_to_content(diff_content: str) -> Dict[str, str]:
-    """Parse git diff content to extract file contents.
+    """Get the full content of the files a git diff adds, rebuilt from their hunks.
+    
+    Only added files whose hunk is complete can be rebuilt; modified,
+    binary and truncated files are left out and have to be fetched.
     
     Args:
         diff_content: Git diff content
@@ -85,23 +178,74 @@ def parse_diff_to_content(diff_content: str) -> Dict[str, str]:
     Returns:
         Dictionary mapping file paths to their content
     """
-    # This is a simplified implementation
-    # A real implementation would properly parse the git diff format
     files_content = {}
-    current_file = None
-    current_content = []
-    
-    for line in diff_content.split('\n'):
-        if line.startswith('+++ b/'):
-            if current_file and current_content:
-                files_content[current_file] = '\n'.join(current_content)
-            current_file = line[6:]  # Remove '+++ b/' prefix
-            current_content = []
-        elif line.startswith('+') and current_file and not line.startswith('+++'):
-            # Add only added lines (remove the '+' prefix)
-            current_content.append(line[1:])
-    
-    if current_file and current_content:
-        files_content[current_file] = '\n'.join(current_content)
-    
-    return files_content
\ No newline at end of file
+    for file_diff in iter_unified_diff(diff_content.split('\n')):
+        content = file_diff.new_content() if file_diff.new_file else None
+        if content is not None:
+            files_content[file_diff.path] = content
+    
+    return files_content
+
+
+def iter_files_from_tarball(fileobj: BinaryIO, file_paths: Iterable[str],
+                            content_policy: Optional[ContentPolicy] = None) -> Iterator[Tuple[str, str]]:
+    """Extract selected files from a gzipped tarball stream, one at a time.
+    
+    The archive is read sequentially, so ``fileobj`` can be a non-seekable
+    HTTP response stream and nothing is written to disk. Provider archives
+    wrap the tree in a single top-level directory (e.g. ``owner-repo-sha/``),
+    which is stripped before matching against ``file_paths``.
+    
+    Args:
+        fileobj: Readable binary stream of a .tar.gz archive
+        file_paths: Repository-relative paths to extract
+        content_policy: Optional ContentPolicy applied to each extracted file
+        
+    Yields:
+        (file path, content) tuples in archive order
+    """
+    remaining = set(file_paths)
+    
+    with tarfile.open(fileobj=fileobj, mode='r|gz') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            
+            # Remove the top-level directory added by the provider
+            path = member.name.split('/', 1)[-1]
+            if path not in remaining:
+                continue
+            remaining.discard(path)
+            
+            extracted = archive.extractfile(member)
+            if extracted is None:
+                continue
+            
+            if content_policy is not None:
+                content = content_policy.read(path, iter_file_chunks(extracted), member.size)
+                if content is not None:
+                    yield path, content
+            else:
+                try:
+                    yield path, extracted.read().decode('utf-8')
+                except UnicodeDecodeError as e:
+                    print(f"Error decoding {path} from archive: {e}")
+            
+            # Stop reading once every requested file has been found
+            if not remaining:
+                break
+
+
+def extract_files_from_tarball(fileobj: BinaryIO, file_paths: Iterable[str],
+                               content_policy: Optional[ContentPolicy] = None) -> Dict[str, str]:
+    """Extract selected files from a gzipped tarball stream into memory.
+    
+    Args:
+        fileobj: Readable binary stream of a .tar.gz archive
+        file_paths: Repository-relative paths to extract
+        content_policy: Optional ContentPolicy applied to each extracted file
+        
+    Returns:
+        Dictionary mapping file paths to their content
+    """
+    return dict(iter_files_from_tarball(fileobj, file_paths, content_policy))
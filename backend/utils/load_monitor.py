@@ -0,0 +1,131 @@
+import os
+import re
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_DEGRADE_MODE = "off"
+DEFAULT_DEGRADE_QUEUE_DEPTH = 20
+DEFAULT_DEGRADE_LATENCY_TARGET = 120
+DEFAULT_DEGRADE_MAX_FILES = 20
+
+# Number of recent jobs whose latencies are considered
+LATENCY_WINDOW = 50
+
+# Work shed under pressure, cheapest to lose first; level N sheds the first N steps
+DEGRADATION_STEPS = (
+    "ai",                  # AI feedback
+    "style_unchanged",     # style issues on lines the PR did not change
+    "low_priority_files",  # files beyond DEGRADE_MAX_FILES, lowest priority first
+)
+
+# Paths shed first when files have to be shed
+LOW_PRIORITY_PATTERN = re.compile(r'(^|/)(tests?|docs?|examples?|migrations)/|(^|/)test_[^/]*$|_test\.py$')
+
+
+class LoadMonitor:
+    """Chooses how much work to shed from queue depth and recent job latencies.
+    
+    Pressure is the larger of the backlog relative to DEGRADE_QUEUE_DEPTH
+    and the 90th percentile of recent job latencies relative to
+    DEGRADE_LATENCY_TARGET. Each whole multiple of pressure sheds one more
+    step of ``DEGRADATION_STEPS``.
+    """
+    
+    def __init__(
+        self,
+        mode: Optional[str] = None,
+        queue_depth: Optional[int] = None,
+        latency_target: Optional[float] = None,
+        max_files: Optional[int] = None
+    ):
+        """Initialize the monitor from arguments or environment variables.
+        
+        Args:
+            mode: 'adaptive' to shed work under load, 'off' to never shed (DEGRADE_MODE)
+            queue_depth: Waiting jobs per degradation level (DEGRADE_QUEUE_DEPTH)
+            latency_target: Seconds a job should take (DEGRADE_LATENCY_TARGET)
+            max_files: Files analyzed once low-priority files are shed (DEGRADE_MAX_FILES)
+        """
+        self.mode = mode or os.getenv("DEGRADE_MODE", DEFAULT_DEGRADE_MODE)
+        if queue_depth is None:
+            queue_depth = int(os.getenv("DEGRADE_QUEUE_DEPTH", DEFAULT_DEGRADE_QUEUE_DEPTH))
+        if latency_target is None:
+            latency_target = float(os.getenv("DEGRADE_LATENCY_TARGET", DEFAULT_DEGRADE_LATENCY_TARGET))
+        if max_files is None:
+            max_files = int(os.getenv("DEGRADE_MAX_FILES", DEFAULT_DEGRADE_MAX_FILES))
+        self.queue_depth = queue_depth
+        self.latency_target = latency_target
+        self.max_files = max_files
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._stage_latencies: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+    
+    def record(self, stage_seconds: Dict[str, float]) -> None:
+        """Record the stage latencies of a finished job."""
+        with self._lock:
+            self._latencies.append(sum(stage_seconds.values()))
+            for stage, seconds in stage_seconds.items():
+                self._stage_latencies.setdefault(stage, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+    
+    def latency_p90(self) -> float:
+        """90th percentile of recent job latencies, or 0 without history."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.9))]
+    
+    def level(self, waiting_jobs: int) -> int:
+        """Get the degradation level for the next job.
+        
+        Args:
+            waiting_jobs: Jobs queued behind the one about to run
+        
+        Returns:
+            Number of ``DEGRADATION_STEPS`` to shed (0 runs every stage in full)
+        """
+        if self.mode != "adaptive":
+            return 0
+        pressure = max(
+            waiting_jobs / self.queue_depth if self.queue_depth > 0 else 0.0,
+            self.latency_p90() / self.latency_target if self.latency_target > 0 else 0.0
+        )
+        return min(len(DEGRADATION_STEPS), int(pressure))
+    
+    def stats(self) -> Dict[str, object]:
+        """Get recent latencies used to pick the degradation level."""
+        with self._lock:
+            stages = {
+                stage: round(sum(values) / len(values), 3)
+                for stage, values in self._stage_latencies.items() if values
+            }
+        return {"mode": self.mode, "job_latency_p90": round(self.latency_p90(), 3), "stage_latency_avg": stages}
+
+
+def shed_steps(level: int) -> Tuple[str, ...]:
+    """Get the degradation steps applied at a level."""
+    return DEGRADATION_STEPS[:max(0, level)]
+
+
+def shed_file(file_path: str, admitted: int, limit: int) -> bool:
+    """Decide whether a streamed file is shed when a job has to shed files.
+    
+    Files arrive one at a time, so instead of ranking all of them, tests,
+    docs, examples and migrations are shed outright and other files are
+    admitted until ``limit`` of them have been.
+    
+    Args:
+        file_path: Path to the arriving file
+        admitted: Number of files admitted so far
+        limit: Number of files to keep
+    
+    Returns:
+        True if the file should not be analyzed
+    """
+    return bool(LOW_PRIORITY_PATTERN.search(file_path)) or admitted >= limit
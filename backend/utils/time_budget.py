@@ -0,0 +1,246 @@
+import os
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, List, Optional, TypeVar
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_JOB_TIMEOUT = 300
+DEFAULT_STAGE_TIMEOUT = 120
+DEFAULT_FILE_TIMEOUT = 30
+
+T = TypeVar('T')
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once it has been cancelled."""
+
+
+class BudgetExceeded(Exception):
+    """Raised when a file or stage runs out of time."""
+
+
+def _parse_stage_timeouts(value: str) -> Dict[str, float]:
+    """Parse 'stage=seconds,...' into a dictionary."""
+    timeouts = {}
+    for item in value.split(","):
+        name, _, seconds = item.partition("=")
+        if name.strip() and seconds.strip():
+            timeouts[name.strip()] = float(seconds)
+    return timeouts
+
+
+class TimeBudget:
+    """Time budgets of one analysis job, per job, per stage and per file.
+    
+    Files are streamed through the stages one at a time with :meth:`run_file`,
+    so a stage's budget is the total time it spends over all files. Files
+    reaching a stage that is out of time are recorded as left out, so the
+    job can still return partial results. :meth:`cancel` stops the job from
+    another thread and kills the subprocesses it started.
+    """
+    
+    def __init__(
+        self,
+        job_timeout: Optional[float] = None,
+        stage_timeout: Optional[float] = None,
+        file_timeout: Optional[float] = None,
+        stage_timeouts: Optional[Dict[str, float]] = None
+    ):
+        """Initialize the budget from arguments or environment variables.
+        
+        Args:
+            job_timeout: Seconds for the whole job (ANALYSIS_JOB_TIMEOUT)
+            stage_timeout: Default seconds per stage (ANALYSIS_STAGE_TIMEOUT)
+            file_timeout: Seconds per file within a stage (ANALYSIS_FILE_TIMEOUT)
+            stage_timeouts: Per-stage overrides, e.g. {'ai': 90}
+                (ANALYSIS_STAGE_TIMEOUTS as 'ai=90,style=60')
+        """
+        if job_timeout is None:
+            job_timeout = float(os.getenv("ANALYSIS_JOB_TIMEOUT", DEFAULT_JOB_TIMEOUT))
+        if stage_timeout is None:
+            stage_timeout = float(os.getenv("ANALYSIS_STAGE_TIMEOUT", DEFAULT_STAGE_TIMEOUT))
+        if file_timeout is None:
+            file_timeout = float(os.getenv("ANALYSIS_FILE_TIMEOUT", DEFAULT_FILE_TIMEOUT))
+        if stage_timeouts is None:
+            stage_timeouts = _parse_stage_timeouts(os.getenv("ANALYSIS_STAGE_TIMEOUTS", ""))
+        
+        self.job_timeout = job_timeout
+        self.stage_timeout = stage_timeout
+        self.file_timeout = file_timeout
+        self.stage_timeouts = stage_timeouts
+        self.started = time.monotonic()
+        self.stage_seconds: Dict[str, float] = {}
+        self.skipped_stages: List[str] = []
+        self.skipped_files: Dict[str, List[str]] = {}
+        self._stage_started = self.started
+        self._stage_deadline = self.started + job_timeout
+        self._file_deadline = self._stage_deadline
+        self._cancelled = threading.Event()
+        self._processes: List[subprocess.Popen] = []
+        self._lock = threading.Lock()
+    
+    @property
+    def cancelled(self) -> bool:
+        """Whether the job has been cancelled."""
+        return self._cancelled.is_set()
+    
+    @property
+    def partial(self) -> bool:
+        """Whether any stage or file was left out."""
+        return bool(self.skipped_stages or self.skipped_files)
+    
+    def cancel(self) -> None:
+        """Cancel the job and kill its running subprocesses."""
+        self._cancelled.set()
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            try:
+                process.kill()
+            except OSError:
+                pass
+    
+    def check_cancelled(self) -> None:
+        """Raise JobCancelled if the job has been cancelled."""
+        if self.cancelled:
+            raise JobCancelled("Job was cancelled")
+    
+    def check_file_time(self) -> None:
+        """Stop an in-process check of a file that has run out of time.
+        
+        Checks run by :meth:`run_file` that cannot be killed like a
+        subprocess call this between units of work, such as functions.
+        
+        Raises:
+            JobCancelled: If the job has been cancelled
+            BudgetExceeded: If the file's time in the current stage is up
+        """
+        self.check_cancelled()
+        if time.monotonic() > self._file_deadline:
+            raise BudgetExceeded("ran out of time")
+    
+    def job_remaining(self) -> float:
+        """Seconds left for the whole job."""
+        return self.started + self.job_timeout - time.monotonic()
+    
+    def remaining(self) -> float:
+        """Seconds left for the current stage, bounded by the job's time."""
+        return min(self._stage_deadline - time.monotonic(), self.job_remaining())
+    
+    def time_for_file(self) -> float:
+        """Seconds one file may take in the current stage."""
+        return max(0.0, min(self.file_timeout, self.remaining()))
+    
+    def start_stage(self, stage: str) -> bool:
+        """Start a stage, or record it as skipped if the job is out of time.
+        
+        Args:
+            stage: Stage name
+        
+        Returns:
+            True if the stage should run
+        """
+        self.check_cancelled()
+        if self.job_remaining() <= 0:
+            self.skipped_stages.append(stage)
+            return False
+        
+        now = time.monotonic()
+        self._stage_deadline = now + self.stage_timeouts.get(stage, self.stage_timeout)
+        self.stage_seconds[stage] = 0.0
+        self._stage_started = now
+        return True
+    
+    def end_stage(self, stage: str) -> None:
+        """Record how long a stage took."""
+        self.stage_seconds[stage] = round(time.monotonic() - self._stage_started, 3)
+    
+    def skip_files(self, stage: str, file_paths: List[str]) -> None:
+        """Record files a stage did not analyze in time."""
+        if file_paths:
+            self.skipped_files.setdefault(stage, []).extend(file_paths)
+    
+    def stage_time_left(self, stage: str) -> float:
+        """Seconds a stage that runs interleaved with others has left, bounded by the job's time."""
+        spent = self.stage_seconds.get(stage, 0.0)
+        return min(self.stage_timeouts.get(stage, self.stage_timeout) - spent, self.job_remaining())
+    
+    def add_stage_seconds(self, stage: str, seconds: float) -> None:
+        """Add time spent in a stage that runs interleaved with others."""
+        self.stage_seconds[stage] = round(self.stage_seconds.get(stage, 0.0) + seconds, 3)
+    
+    def run_file(self, stage: str, content: str, file_path: str, check: Callable[[str, str], T]) -> Optional[T]:
+        """Run one stage's check on one file within the stage's remaining time.
+        
+        The stage's time is accumulated over every file it checks. Files
+        reaching the stage after its time (or the job's) has run out, and
+        files whose check exceeded its own budget, are recorded as skipped.
+        In-process checks cannot be interrupted; they stop between
+        functions by calling :meth:`check_file_time`, and a single slow
+        function is only noticed once it has been checked.
+        
+        Args:
+            stage: Stage name
+            content: Content of the file
+            file_path: Path to the file
+            check: Function taking (content, file_path) and returning its result
+        
+        Returns:
+            Result of ``check``, or None if the file was skipped
+        """
+        self.check_cancelled()
+        now = time.monotonic()
+        self._stage_deadline = now + self.stage_time_left(stage)
+        self._file_deadline = now + self.time_for_file()
+        if self.remaining() <= 0:
+            self.skip_files(stage, [file_path])
+            return None
+        
+        try:
+            return check(content, file_path)
+        except BudgetExceeded as e:
+            print(f"Skipped {file_path} in {stage}: {e}")
+            self.skip_files(stage, [file_path])
+            return None
+        finally:
+            elapsed = time.monotonic() - now
+            self.add_stage_seconds(stage, elapsed)
+            if elapsed > self.file_timeout:
+                print(f"{stage} took {elapsed:.1f}s on {file_path} (budget {self.file_timeout:.0f}s)")
+            self.check_cancelled()
+    
+    def run_command(self, args: List[str], timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        """Run a subprocess that is killed on timeout or cancellation.
+        
+        Args:
+            args: Command and arguments
+            timeout: Seconds before the process is killed (defaults to the file budget)
+        
+        Returns:
+            Completed process with text stdout and stderr
+        """
+        self.check_cancelled()
+        if timeout is None:
+            timeout = self.time_for_file()
+        
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        with self._lock:
+            self._processes.append(process)
+        try:
+            try:
+                stdout, stderr = process.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                raise BudgetExceeded(f"{args[0]} timed out after {timeout:.1f}s")
+        finally:
+            with self._lock:
+                self._processes.remove(process)
+        
+        self.check_cancelled()
+        return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
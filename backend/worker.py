@@ -0,0 +1,325 @@
+"""Analysis worker processes that pull jobs from the shared job queue.
+
+Usage:
+    python worker.py --processes 4
+
+The API enqueues jobs when started with ANALYSIS_MODE=queue; any number of
+worker processes, on this or other machines sharing the queue, run them.
+A pull request changing more than SHARD_THRESHOLD Python files is split into
+shards of SHARD_SIZE files that several workers analyze; the worker
+finishing the last shard merges them into the job's result.
+
+Each job runs under a CPU time and memory limit (setrlimit). A job
+exceeding one is failed with the reason instead of being retried on
+another worker, and worker processes are replaced by fresh ones after a
+number of jobs or once their peak memory grows too large.
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; jobs run without limits
+    resource = None
+
+from dotenv import load_dotenv
+
+from services.job_queue import JobQueue, get_job_queue
+from utils.time_budget import JobCancelled, TimeBudget
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_POLL_INTERVAL = 1.0
+
+# Seconds between checks for cancellation of the running job
+CANCEL_CHECK_INTERVAL = 1.0
+
+# CPU seconds one job may use before its worker process is killed (0 for no limit)
+DEFAULT_JOB_CPU_SECONDS = 600
+JOB_CPU_SECONDS = int(os.getenv("JOB_CPU_SECONDS", DEFAULT_JOB_CPU_SECONDS))
+
+# Memory one job may allocate on top of what its worker process holds (0 for no limit)
+DEFAULT_JOB_MEMORY_LIMIT_MB = 2048
+JOB_MEMORY_LIMIT_MB = int(os.getenv("JOB_MEMORY_LIMIT_MB", DEFAULT_JOB_MEMORY_LIMIT_MB))
+
+# Jobs a worker process runs before it is replaced by a fresh one (0 for no limit)
+DEFAULT_WORKER_MAX_JOBS = 500
+WORKER_MAX_JOBS = int(os.getenv("WORKER_MAX_JOBS", DEFAULT_WORKER_MAX_JOBS))
+
+# Peak resident memory after which a worker process is replaced once its job is done (0 for no limit)
+DEFAULT_WORKER_MAX_RSS_MB = 1024
+WORKER_MAX_RSS_MB = int(os.getenv("WORKER_MAX_RSS_MB", DEFAULT_WORKER_MAX_RSS_MB))
+
+# Job whose lease this worker process holds, read by the supervisor if the process is killed
+_current_job = None
+
+
+def _address_space() -> Optional[int]:
+    """Get the virtual memory size of this process in bytes, or None where it cannot be read."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def _set_soft_limit(limit: int, value: Optional[int]) -> None:
+    """Set a resource's soft limit, or lift it up to the hard limit with None."""
+    _, hard = resource.getrlimit(limit)
+    if value is None or (hard != resource.RLIM_INFINITY and value > hard):
+        value = hard
+    resource.setrlimit(limit, (value, hard))
+
+
+@contextmanager
+def _job_limits() -> Iterator[None]:
+    """Limit the CPU time and memory of this process while the block runs one job.
+    
+    The CPU limit makes the kernel kill the process with SIGXCPU, which
+    also stops work stuck in C code (a pathological regex, deeply nested
+    expressions); the supervisor then fails the job. Allocations over the
+    memory limit raise MemoryError in the job. Both limits are lifted again
+    between jobs.
+    """
+    if resource is None:
+        yield
+        return
+    
+    if JOB_CPU_SECONDS > 0:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        _set_soft_limit(resource.RLIMIT_CPU, int(usage.ru_utime + usage.ru_stime) + JOB_CPU_SECONDS)
+    address_space = _address_space()
+    if JOB_MEMORY_LIMIT_MB > 0 and address_space is not None:
+        _set_soft_limit(resource.RLIMIT_AS, address_space + JOB_MEMORY_LIMIT_MB * 1024 * 1024)
+    try:
+        yield
+    finally:
+        _set_soft_limit(resource.RLIMIT_CPU, None)
+        _set_soft_limit(resource.RLIMIT_AS, None)
+
+
+def _peak_rss_mb() -> float:
+    """Get the peak resident memory of this process in megabytes."""
+    if resource is None:
+        return 0.0
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _keep_lease(queue: JobQueue, job_id: str, worker_id: str, stop: threading.Event, budget: TimeBudget) -> None:
+    """Extend a job's lease until the job finishes, and stop the job if it is cancelled or the lease is lost."""
+    interval = max(1.0, getattr(queue, "visibility_timeout", 60) / 3)
+    next_heartbeat = time.monotonic() + interval
+    while not stop.wait(CANCEL_CHECK_INTERVAL):
+        if (queue.get(job_id) or {}).get("status") == "cancelled":
+            print(f"Job {job_id} was cancelled")
+            budget.cancel()
+            return
+        if time.monotonic() < next_heartbeat:
+            continue
+        next_heartbeat = time.monotonic() + interval
+        if not queue.heartbeat(job_id, worker_id):
+            # Another worker has the job now; stop duplicating its work
+            print(f"Worker {worker_id} lost the lease on job {job_id}")
+            budget.cancel()
+            return
+        queue.worker_heartbeat(worker_id, {"pid": os.getpid(), "job_id": job_id})
+
+
+@contextmanager
+def _leased(queue: JobQueue, job_id: str, worker_id: str) -> Iterator[TimeBudget]:
+    """Keep a job's lease and its resource limits while the block runs; the yielded budget is cancelled with the job."""
+    budget = TimeBudget()
+    stop = threading.Event()
+    lease_thread = threading.Thread(
+        target=_keep_lease, args=(queue, job_id, worker_id, stop, budget), daemon=True
+    )
+    lease_thread.start()
+    if _current_job is not None:
+        _current_job.value = job_id.encode()
+    try:
+        with _job_limits():
+            yield budget
+    finally:
+        if _current_job is not None:
+            _current_job.value = b""
+        stop.set()
+        lease_thread.join()
+
+
+def _merge_job(queue: JobQueue, job_id: str, worker_id: str, payload: Dict[str, Any],
+               shard_results: List[Dict[str, Any]], checkers: Dict[str, Any], budget: TimeBudget) -> None:
+    """Merge the results of a split job's shards and complete the job."""
+    from pipeline import merge_shard_results
+    
+    try:
+        result = merge_shard_results(payload, shard_results, checkers=checkers, budget=budget)
+        queue.complete(job_id, worker_id, result)
+    except JobCancelled:
+        print(f"Worker {worker_id} stopped merging job {job_id}")
+    except MemoryError:
+        queue.fail(job_id, worker_id, f"Merging shard results exceeded the memory limit of {JOB_MEMORY_LIMIT_MB} MB")
+        raise
+    except Exception as e:
+        queue.fail(job_id, worker_id, f"Merging shard results failed: {e}")
+
+
+def run_worker(worker_id: str, poll_interval: float = DEFAULT_POLL_INTERVAL, current_job: Any = None) -> None:
+    """Claim and run jobs until the process is stopped or is due to be replaced.
+    
+    Args:
+        worker_id: Unique identifier of this worker process
+        poll_interval: Seconds to wait when the queue is empty
+        current_job: Optional shared byte array the ID of the job being run is kept in
+    """
+    global _current_job
+    _current_job = current_job
+    # The supervisor stops workers with SIGTERM; its own handler is inherited otherwise
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Imported here so the supervisor process never loads the analysis stack
+    from pipeline import analyze_pull_request, create_checkers, load_monitor, plan_shards
+    
+    queue = get_job_queue()
+    checkers = create_checkers()
+    jobs_done = 0
+    print(f"Worker {worker_id} started")
+    
+    while True:
+        queue.worker_heartbeat(worker_id, {
+            "pid": os.getpid(), "job_id": None, "jobs_done": jobs_done, "load": load_monitor.stats()
+        })
+        job = queue.claim(worker_id)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        
+        job_id = job["job_id"]
+        payload = dict(job["payload"])
+        shard = payload.pop("shard", None)
+        shard_results = None
+        with _leased(queue, job_id, worker_id) as budget:
+            try:
+                shards = plan_shards(payload) if shard is None and not job.get("shards") else []
+                if job.get("shards"):
+                    # The worker merging this job's shards was lost before it finished
+                    _merge_job(queue, job_id, worker_id, payload, queue.shard_results(job_id), checkers, budget)
+                elif shards:
+                    queue.split(job_id, worker_id, [{**payload, "shard": spec} for spec in shards])
+                    print(f"Worker {worker_id} split job {job_id} into {len(shards)} shards")
+                else:
+                    result = analyze_pull_request(
+                        payload, checkers=checkers, budget=budget, waiting_jobs=queue.depth(), shard=shard
+                    )
+                    if shard is None:
+                        queue.complete(job_id, worker_id, result)
+                    else:
+                        # Leases the job to this worker if this was its last shard
+                        shard_results = queue.finish_shard(job_id, worker_id, result)
+            except JobCancelled:
+                print(f"Worker {worker_id} stopped job {job_id}")
+            except MemoryError:
+                # The process may be left fragmented or inconsistent; it is replaced below
+                shard_results = None
+                queue.fail(job_id, worker_id, f"Job exceeded the memory limit of {JOB_MEMORY_LIMIT_MB} MB")
+                print(f"Worker {worker_id} ran out of memory on job {job_id}, exiting")
+                return
+            except Exception as e:
+                queue.fail(job_id, worker_id, str(e))
+        if shard_results is not None:
+            # The shard's lease ended with it; the merge keeps the lease of the job itself
+            try:
+                with _leased(queue, job["parent_id"], worker_id) as budget:
+                    _merge_job(queue, job["parent_id"], worker_id, payload, shard_results, checkers, budget)
+            except MemoryError:
+                print(f"Worker {worker_id} ran out of memory merging job {job['parent_id']}, exiting")
+                return
+        jobs_done += 1
+        if WORKER_MAX_JOBS and jobs_done >= WORKER_MAX_JOBS:
+            print(f"Worker {worker_id} ran {jobs_done} jobs, exiting to be replaced")
+            return
+        if WORKER_MAX_RSS_MB and _peak_rss_mb() > WORKER_MAX_RSS_MB:
+            print(f"Worker {worker_id} reached {_peak_rss_mb():.0f} MB peak memory, exiting to be replaced")
+            return
+
+
+def _start_worker(index: int, poll_interval: float) -> multiprocessing.Process:
+    """Start one worker process; its ``current_job`` holds the ID of the job it is running."""
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{index}-{int(time.time())}"
+    current_job = multiprocessing.Array('c', 128)
+    process = multiprocessing.Process(
+        target=run_worker, args=(worker_id, poll_interval, current_job), name=worker_id, daemon=True
+    )
+    process.current_job = current_job
+    process.start()
+    return process
+
+
+def _exit_reason(exitcode: Optional[int]) -> Optional[str]:
+    """Describe why a worker process killed by a resource limit exited, or None for other exits."""
+    if exitcode == -signal.SIGXCPU:
+        return f"Job exceeded the CPU time limit of {JOB_CPU_SECONDS}s"
+    if exitcode == -signal.SIGKILL:
+        return "Worker process was killed while running the job, most likely for running out of memory"
+    return None
+
+
+def _reap_worker(queue: JobQueue, process: multiprocessing.Process) -> None:
+    """Report the exit of a worker process and fail its job if a resource limit killed it."""
+    job_id = process.current_job.value.decode()
+    reason = _exit_reason(process.exitcode)
+    if process.exitcode == 0:
+        print(f"Worker {process.name} was recycled, restarting")
+    elif job_id and reason:
+        # Running the job again would only take down another worker
+        print(f"Worker {process.name} was killed running job {job_id}: {reason}")
+        queue.fail(job_id, process.name, reason)
+    else:
+        # The queue re-leases its job once the visibility timeout expires
+        print(f"Worker {process.name} exited with code {process.exitcode}, restarting")
+
+
+def main() -> None:
+    """Start worker processes and restart any that exit."""
+    parser = argparse.ArgumentParser(description="Run PR analysis worker processes")
+    parser.add_argument(
+        "--processes", type=int, default=int(os.getenv("WORKER_PROCESSES", "2")),
+        help="Number of worker processes (WORKER_PROCESSES)"
+    )
+    parser.add_argument(
+        "--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+        help="Seconds to wait when the queue is empty"
+    )
+    args = parser.parse_args()
+    
+    # Stopped with SIGTERM, the workers are stopped too instead of being left running
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    queue = get_job_queue()
+    workers = [_start_worker(i, args.poll_interval) for i in range(args.processes)]
+    try:
+        while True:
+            time.sleep(1)
+            for i, process in enumerate(workers):
+                if not process.is_alive():
+                    _reap_worker(queue, process)
+                    workers[i] = _start_worker(i, args.poll_interval)
+    except KeyboardInterrupt:
+        # A second signal must not interrupt stopping the workers
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for process in workers:
+            process.terminate()
+        for process in workers:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()